@@ -1,156 +1,118 @@
 # ai_negotiator_api_cors.py
 
-from flask import Flask, request, jsonify
+from dotenv import load_dotenv
+load_dotenv()  # .env settings apply to everything imported below
+
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from negotiation_bot_kg import get_memory, conversation, extract_preferences, extract_structured_offer, get_dynamic_context_from_kg, NegotiationKnowledgeGraph, INITIAL_SUBJECTIVE_LIMIT, TRUE_MAX_SALARY
-import datetime
+from negotiation_session import response_cache_stats, hedging_stats, fast_path_stats, offer_export_stats
+from negotiation_bot_kg import conversation, prompt_layout, llm_transport_stats
+import turn_metrics
+import log_pipeline
+from session_store import SessionStore
+from session_journal import SessionJournal
+from session_backend import VersionConflict
+from negotiation_batch import parse_batch, run_batch
+from negotiation_summary import FORMATS as SUMMARY_FORMATS, parse_summary_request
 import logging
 import json
-import re
+import threading
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Basic logging setup for the Flask app
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
-
-# Global state for the negotiation (for demonstration purposes)
-# In a production environment, this would be managed per user session.
-negotiation_sessions = {}
-
-class NegotiationSessionState:
-    def __init__(self, session_id):
-        self.session_id = session_id
-        self.kg = NegotiationKnowledgeGraph(session_id)
-        self.current_turn = 0
-        self.subjective_limit = INITIAL_SUBJECTIVE_LIMIT
-        self.last_agent_offer_node_id = None
-        self.last_agent_offer_details = None
-
-    def get_agent_reply(self, user_input):
-        self.current_turn += 1
-        
-        # Logic for acceptance handling (from negotiation_bot_kg.py)
-        accepted = False
-        if self.last_agent_offer_node_id and re.search(r"\b(deal|accept|agree|sounds good|let\'?s do it|i\'?ll take it|happy to take it|ok)\b", user_input, re.IGNORECASE):
-            prev_base = self.last_agent_offer_details.get("base") if self.last_agent_offer_details else None
-            user_offer_details = extract_structured_offer(user_input)
-            user_base = user_offer_details.get("base")
-            
-            if isinstance(prev_base, int) and (user_base is None or user_base == prev_base):
-                accepted = True
-                self.kg.update_offer_status(self.last_agent_offer_node_id, "accepted")
-                self.kg.add_turn(user_input, "Agreement Reached.", self.subjective_limit) 
-                
-                if user_offer_details:
-                    self.kg.add_offer(self.current_turn, user_offer_details, "candidate", status="accepted_trigger")
-                else:
-                    self.kg.add_offer(self.current_turn, {"status_trigger": "acceptance"}, "candidate", status="accepted_trigger")
-                    
-                concluding_reply = f"Great! Then we have a deal based on our last offer: {json.dumps(self.last_agent_offer_details)}. I\'?m thrilled to have you join the team and will follow up with the formal offer letter shortly."
-                self.kg.graph.nodes[self.kg._get_turn_node_id(self.current_turn)]["agent_response"] = concluding_reply
-                return concluding_reply
-
-        if accepted:
-            return ""
-
-        extract_preferences(user_input, self.kg)
-        candidate_offer_details = extract_structured_offer(user_input)
-
-        last_candidate_offer_info = self.kg.get_last_offer_details("candidate")
-        rejected_agent_offers_count = len(self.kg.get_offers_by_status("rejected", "agent"))
-        prev_limit_from_kg = self.kg.get_current_limit() or INITIAL_SUBJECTIVE_LIMIT
-
-        if self.current_turn == 1:
-            self.subjective_limit = INITIAL_SUBJECTIVE_LIMIT
-        elif rejected_agent_offers_count == 0 and last_candidate_offer_info:
-            _, candidate_offer, _ = last_candidate_offer_info
-            candidate_base = candidate_offer.get("base")
-            if isinstance(candidate_base, int):
-                midpoint = (prev_limit_from_kg + candidate_base) // 2
-                self.subjective_limit = min(TRUE_MAX_SALARY, midpoint)
-            else:
-                self.subjective_limit = min(TRUE_MAX_SALARY, int(prev_limit_from_kg * 1.05))
-        elif rejected_agent_offers_count == 1:
-            self.subjective_limit = min(TRUE_MAX_SALARY, int(prev_limit_from_kg * 1.08))
-        else: 
-            self.subjective_limit = TRUE_MAX_SALARY
-            
-        self.subjective_limit = max(self.subjective_limit, prev_limit_from_kg)
-
-        kg_context_for_prompt = get_dynamic_context_from_kg(self.kg)
-
-        inputs = {
-            "message": user_input,
-            "subjective_limit": self.subjective_limit,
-            "kg_context": kg_context_for_prompt
-        }
+# Records are queued and written by a background thread: JSON lines to NEGOTIATION_LOG_FILE
+# (rotated by size) and the usual lines to the console
+log_writer = log_pipeline.configure_logging_from_env()
 
-        try:
-            result = conversation.invoke(
-                inputs,
-                config={"configurable": {"session_id": self.session_id}}
-            )
-            reply = result.content.strip()
-            
-            self.kg.add_turn(user_input, reply, self.subjective_limit)
-
-            if candidate_offer_details:
-                new_candidate_offer_node_id = self.kg.add_offer(self.current_turn, candidate_offer_details, "candidate")
-                if self.last_agent_offer_node_id and self.kg.graph.nodes[self.last_agent_offer_node_id].get("status") == "proposed":
-                    self.kg.update_offer_status(self.last_agent_offer_node_id, "rejected")
-
-            agent_offer_details = extract_structured_offer(reply)
-            if agent_offer_details:
-                agent_base = agent_offer_details.get("base")
-                if isinstance(agent_base, int) and agent_base <= self.subjective_limit:
-                    new_agent_offer_node_id = self.kg.add_offer(self.current_turn, agent_offer_details, "agent")
-                    self.last_agent_offer_node_id = new_agent_offer_node_id
-                    self.last_agent_offer_details = agent_offer_details
-                    
-                    rejected_agent_offers = self.kg.get_offers_by_status("rejected", "agent")
-                    for _, rejected_details, rejected_node_id in rejected_agent_offers:
-                        if rejected_details.get("base") == agent_base:
-                            self.kg.add_similar_offer_relation(new_agent_offer_node_id, rejected_node_id)
-                            break
-                elif isinstance(agent_base, int):
-                    self.last_agent_offer_node_id = None
-                    self.last_agent_offer_details = None
-                else:
-                    self.kg.add_offer(self.current_turn, agent_offer_details, "agent")
-                    self.last_agent_offer_node_id = None
-                    self.last_agent_offer_details = None
-            else:
-                self.last_agent_offer_node_id = None
-                self.last_agent_offer_details = None
-            return reply
-
-        except Exception as e:
-            logging.error(f"Error during invocation: {e}")
-            return f"Error: {str(e)}"
+# Per-session negotiation state, bounded by count/memory caps and an idle TTL.
+# Evicted sessions are spilled to disk and rehydrated on their next request.
+# With NEGOTIATION_JOURNAL_DIR set, every turn is journaled and sessions survive restarts.
+# With NEGOTIATION_SESSION_BACKEND=sqlite:///relative.db (or sqlite:////absolute.db), several worker processes share sessions.
+session_journal = SessionJournal.from_env()
+if session_journal is not None:
+    session_journal.recover()
+negotiation_sessions = SessionStore.from_env(journal=session_journal)
+
+# The OpenAI client and LangChain chain are built off the request path; /ready reports
+# when that has finished (and why, if it failed)
+threading.Thread(target=conversation.warmup, name="conversation-warmup", daemon=True).start()
 
 @app.route("/negotiate", methods=["POST"])
 def negotiate():
     data = request.json
     user_input = data.get("userInput")
     session_id = data.get("sessionId", "default_session") # Use a session ID from the frontend
+    # Retries of a submission carry the same id and get the reply already produced for it
+    request_id = data.get("requestId") or request.headers.get("Idempotency-Key")
 
     if not user_input:
         return jsonify({"error": "No userInput provided"}), 400
 
-    if session_id not in negotiation_sessions:
-        negotiation_sessions[session_id] = NegotiationSessionState(session_id)
-        logging.info(f"New negotiation session created: {session_id}")
-
-    session_state = negotiation_sessions[session_id]
-    agent_reply = session_state.get_agent_reply(user_input)
+    agent_reply = negotiation_sessions.run_turn(session_id, lambda session_state: session_state.get_agent_reply(user_input, request_id))
     
     return jsonify({"reply": agent_reply})
 
+@app.route("/negotiate_batch", methods=["POST"])
+def negotiate_batch():
+    # Many turns in one request; see negotiation_batch.py
+    turns, error = parse_batch(request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
+    return jsonify({"replies": run_batch(negotiation_sessions, turns)})
+
+@app.route("/negotiate_stream", methods=["POST"])
+def negotiate_stream():
+    # Same turn as /negotiate, streamed as Server-Sent Events: "token" events while the
+    # model generates, then one "done" event with the full reply and the extracted offer
+    data = request.json
+    user_input = data.get("userInput")
+    session_id = data.get("sessionId", "default_session")
+    request_id = data.get("requestId") or request.headers.get("Idempotency-Key")
+
+    if not user_input:
+        return jsonify({"error": "No userInput provided"}), 400
+
+    def events():
+        try:
+            with negotiation_sessions.session(session_id) as session_state:
+                for event, payload in session_state.stream_agent_reply(user_input, request_id):
+                    yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        except VersionConflict:
+            # Tokens already went out, so the turn can't be rerun here; a resend with the
+            # same requestId gets whichever reply won
+            logging.warning(f"Streamed turn for session {session_id} lost a concurrent update")
+            yield f"event: error\ndata: {json.dumps({'error': 'Session was updated by another request; please resend'})}\n\n"
+
+    return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/negotiation_summary", methods=["GET"])
+def negotiation_summary():
+    # ?sessionId=...&format=text|json&from_turn=N&stream=1. Answered from the snapshot the
+    # session's last turn published, so polling doesn't wait behind a turn in progress
+    options, error = parse_summary_request(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    summary = negotiation_sessions.summary(options["session_id"])
+    if summary is None:
+        return jsonify({"error": "Unknown session"}), 404
+    chunks = summary.render(options["format"], options["from_turn"])
+    body = chunks if options["stream"] else "".join(chunks)
+    return Response(body, content_type=SUMMARY_FORMATS[options["format"]], headers={"Cache-Control": "no-cache"})
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    return jsonify({"ready": conversation.ready, "error": conversation.error}), 200 if conversation.ready else 503
+
+@app.route("/session_stats", methods=["GET"])
+def session_stats():
+    return jsonify({**negotiation_sessions.stats(), "prompt": prompt_layout.stats(), "response_cache": response_cache_stats(), "logging": log_writer.stats(), "llm_transport": llm_transport_stats(), "hedging": hedging_stats(), "fast_path": fast_path_stats(), "offer_export": offer_export_stats()})
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    # Per-stage turn timings and turn/error counters for Prometheus to scrape
+    return Response(turn_metrics.metrics.render(), content_type=turn_metrics.CONTENT_TYPE)
+
 @app.route("/health", methods=["GET"])
 def health():
     return jsonify({"status": "healthy", "message": "AI Negotiator API is running"})
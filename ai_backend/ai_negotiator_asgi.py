@@ -0,0 +1,227 @@
+# ai_negotiator_asgi.py
+# Asyncio serving mode: the same routes as ai_negotiator_api_cors.py as a plain ASGI app.
+# A request waiting on the model is a suspended coroutine rather than a pinned worker
+# thread, so one process can hold hundreds of negotiations in flight.
+#
+#   uvicorn ai_negotiator_asgi:app --host 0.0.0.0 --port 5000
+
+import asyncio
+import json
+import logging
+from typing import Optional
+from urllib.parse import parse_qsl
+
+from dotenv import load_dotenv
+load_dotenv()  # .env settings apply to everything imported below
+
+from negotiation_bot_kg import conversation, prompt_layout, llm_transport_stats
+from negotiation_session import response_cache_stats, hedging_stats, fast_path_stats, offer_export_stats
+import turn_metrics
+import log_pipeline
+from session_store import SessionStore
+from session_journal import SessionJournal
+from session_backend import VersionConflict
+from negotiation_batch import parse_batch, arun_batch
+from negotiation_summary import FORMATS as SUMMARY_FORMATS, parse_summary_request
+
+# Records are queued and written by a background thread (see log_pipeline.py)
+log_writer = log_pipeline.configure_logging_from_env()
+
+session_journal = SessionJournal.from_env()
+if session_journal is not None:
+    session_journal.recover()
+negotiation_sessions = SessionStore.from_env(journal=session_journal)
+
+# Matches flask_cors defaults in ai_negotiator_api_cors.py
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    # Both turn endpoints read Idempotency-Key, which browsers only send once a preflight allows it
+    (b"access-control-allow-headers", b"content-type, idempotency-key"),
+]
+
+
+def header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def send_json(send, payload, status: int = 200):
+    body = json.dumps(payload).encode("utf-8")
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + CORS_HEADERS
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def read_turn_request(scope, receive, send):
+    """Returns (user_input, session_id, request_id), or None after answering 400."""
+    try:
+        data = json.loads(await read_body(receive) or b"null")
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        await send_json(send, {"error": "Request body must be a JSON object"}, 400)
+        return None
+    user_input = data.get("userInput")
+    session_id = data.get("sessionId", "default_session")
+    # Retries of a submission carry the same id and get the reply already produced for it
+    request_id = data.get("requestId") or header(scope, b"idempotency-key")
+
+    if not user_input:
+        await send_json(send, {"error": "No userInput provided"}, 400)
+        return None
+    return user_input, session_id, request_id
+
+
+async def negotiate(scope, receive, send):
+    turn_request = await read_turn_request(scope, receive, send)
+    if turn_request is None:
+        return
+    user_input, session_id, request_id = turn_request
+
+    agent_reply = await negotiation_sessions.arun_turn(session_id, lambda session_state: session_state.aget_agent_reply(user_input, request_id))
+
+    await send_json(send, {"reply": agent_reply})
+
+
+async def negotiate_batch(scope, receive, send):
+    # Many turns in one request; see negotiation_batch.py
+    try:
+        data = json.loads(await read_body(receive) or b"null")
+    except ValueError:
+        data = None
+    turns, error = parse_batch(data)
+    if error:
+        await send_json(send, {"error": error}, 400)
+        return
+    await send_json(send, {"replies": await arun_batch(negotiation_sessions, turns)})
+
+
+async def negotiate_stream(scope, receive, send):
+    # Server-Sent Events: "token" events while the model generates, then "done" with the
+    # full reply and the extracted offer once the KG has been updated
+    turn_request = await read_turn_request(scope, receive, send)
+    if turn_request is None:
+        return
+    user_input, session_id, request_id = turn_request
+
+    headers = [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")] + CORS_HEADERS
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    try:
+        async with negotiation_sessions.asession(session_id) as session_state:
+            events = session_state.astream_agent_reply(user_input, request_id)
+            try:
+                async for event, payload in events:
+                    data = f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8")
+                    await send({"type": "http.response.body", "body": data, "more_body": True})
+            finally:
+                # Finishes the turn's journal record even if the client went away mid-stream
+                await events.aclose()
+    except VersionConflict:
+        logging.warning(f"Streamed turn for session {session_id} lost a concurrent update")
+        data = f"event: error\ndata: {json.dumps({'error': 'Session was updated by another request; please resend'})}\n\n"
+        await send({"type": "http.response.body", "body": data.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def negotiation_summary(scope, receive, send):
+    # ?sessionId=...&format=text|json&from_turn=N&stream=1; see the Flask route
+    options, error = parse_summary_request(dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"))))
+    if error:
+        await send_json(send, {"error": error}, 400)
+        return
+    # Off the loop: a session's first summary request waits for its turn in progress
+    summary = await asyncio.to_thread(negotiation_sessions.summary, options["session_id"])
+    if summary is None:
+        await send_json(send, {"error": "Unknown session"}, 404)
+        return
+    chunks = summary.render(options["format"], options["from_turn"])
+    headers = [(b"content-type", SUMMARY_FORMATS[options["format"]].encode()), (b"cache-control", b"no-cache")] + CORS_HEADERS
+    if not options["stream"]:
+        body = "".join(chunks).encode("utf-8")
+        await send({"type": "http.response.start", "status": 200, "headers": headers + [(b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+        return
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    for chunk in chunks:
+        await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def session_stats(scope, receive, send):
+    await send_json(send, {**negotiation_sessions.stats(), "prompt": prompt_layout.stats(), "response_cache": response_cache_stats(), "logging": log_writer.stats(), "llm_transport": llm_transport_stats(), "hedging": hedging_stats(), "fast_path": fast_path_stats(), "offer_export": offer_export_stats()})
+
+
+async def ready(scope, receive, send):
+    await send_json(send, {"ready": conversation.ready, "error": conversation.error}, 200 if conversation.ready else 503)
+
+
+async def metrics(scope, receive, send):
+    body = turn_metrics.metrics.render().encode("utf-8")
+    headers = [(b"content-type", turn_metrics.CONTENT_TYPE.encode()), (b"content-length", str(len(body)).encode())] + CORS_HEADERS
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def health(scope, receive, send):
+    await send_json(send, {"status": "healthy", "message": "AI Negotiator API is running"})
+
+
+# Holds the startup warmup task so it isn't garbage-collected while running
+warmup_tasks = set()
+
+ROUTES = {
+    ("POST", "/negotiate"): negotiate,
+    ("POST", "/negotiate_stream"): negotiate_stream,
+    ("POST", "/negotiate_batch"): negotiate_batch,
+    ("GET", "/negotiation_summary"): negotiation_summary,
+    ("GET", "/session_stats"): session_stats,
+    ("GET", "/health"): health,
+    ("GET", "/ready"): ready,
+    ("GET", "/metrics"): metrics,
+}
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Builds the OpenAI client and chain in the background; /ready reports when done
+                warmup_tasks.add(asyncio.ensure_future(asyncio.to_thread(conversation.warmup)))
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if session_journal is not None:
+                    await asyncio.to_thread(session_journal.close)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"]
+    if method == "OPTIONS":
+        await send({"type": "http.response.start", "status": 204, "headers": CORS_HEADERS})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    handler = ROUTES.get((method, path))
+    if handler is None:
+        known_path = any(route_path == path for _, route_path in ROUTES)
+        await send_json(send, {"error": "Method not allowed" if known_path else "Not found"}, 405 if known_path else 404)
+        return
+    await handler(scope, receive, send)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=5000)
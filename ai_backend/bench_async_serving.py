@@ -0,0 +1,99 @@
+# Benchmark: Flask (thread per request) vs the ASGI app (coroutine per request)
+#
+#   python bench_async_serving.py [clients] [latency_seconds] [flask_threads]
+#
+# `clients` concurrent negotiations each play TURNS turns against a FakeConversation that
+# takes `latency_seconds` per call. The Flask app is driven through its test client with
+# at most `flask_threads` requests in flight, as a threaded server or gunicorn --threads
+# would allow; the ASGI app is called in-process from one event loop with no cap.
+
+import asyncio
+import gc
+import json
+import os
+import sys
+import threading
+import time
+
+os.environ.setdefault("OPENAI_API_KEY1", "bench-placeholder")
+os.environ.setdefault("NEGOTIATION_LOG_FILE", "")  # console only; no JSON log file from bench runs
+
+import negotiation_session
+from fake_llm import FakeConversation
+import ai_negotiator_api
+import ai_negotiator_asgi
+
+TURNS = 3
+MESSAGES = (
+    "I'm looking for $140,000 with remote work.",
+    "Could you do $135,000 and stock options?",
+    "How about $130,000 with a $10,000 signing bonus?",
+)
+
+
+def run_flask(clients: int, flask_threads: int) -> float:
+    client = ai_negotiator_api.app.test_client()
+    workers = threading.BoundedSemaphore(flask_threads)
+
+    def negotiation(n):
+        for message in MESSAGES[:TURNS]:
+            with workers:
+                response = client.post("/negotiate", json={"userInput": message, "sessionId": f"flask-{n}"})
+            assert response.status_code == 200 and not response.json["reply"].startswith("Error")
+
+    threads = [threading.Thread(target=negotiation, args=(n,)) for n in range(clients)]
+    gc.collect()
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start
+
+
+async def asgi_post(path: str, payload) -> dict:
+    body = json.dumps(payload).encode("utf-8")
+    scope = {"type": "http", "method": "POST", "path": path, "headers": [(b"content-type", b"application/json")]}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await ai_negotiator_asgi.app(scope, receive, send)
+    assert sent[0]["status"] == 200
+    return json.loads(sent[1]["body"])
+
+
+def run_asgi(clients: int) -> float:
+    async def negotiation(n):
+        for message in MESSAGES[:TURNS]:
+            reply = await asgi_post("/negotiate", {"userInput": message, "sessionId": f"asgi-{n}"})
+            assert not reply["reply"].startswith("Error")
+
+    async def main():
+        await asyncio.gather(*(negotiation(n) for n in range(clients)))
+
+    gc.collect()
+    start = time.perf_counter()
+    asyncio.run(main())
+    return time.perf_counter() - start
+
+
+def main(clients: int, latency: float, flask_threads: int):
+    negotiation_session.conversation = FakeConversation(latency)
+    requests = clients * TURNS
+    print(f"{clients} concurrent negotiations x {TURNS} turns, model latency {latency:.2f}s")
+    flask_s = run_flask(clients, flask_threads)
+    print(f"flask ({flask_threads} worker threads): {flask_s:7.2f}s  {requests / flask_s:8.1f} req/s")
+    asgi_s = run_asgi(clients)
+    print(f"asgi (single event loop):    {asgi_s:7.2f}s  {requests / asgi_s:8.1f} req/s  ({flask_s / asgi_s:.1f}x)")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 200,
+         float(args[1]) if len(args) > 1 else 0.5,
+         int(args[2]) if len(args) > 2 else 16)
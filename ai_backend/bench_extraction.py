@@ -0,0 +1,134 @@
+# Benchmark: single-pass scanner vs the previous multi-regex extraction
+#
+#   python bench_extraction.py
+#
+# Scores both extractors against extraction_corpus.jsonl (hand-labelled candidate and
+# agent messages) and times one full per-turn workload: the candidate message is checked
+# for acceptance, offer and preferences, and the agent reply for an offer.
+
+import json
+import os
+import re
+import time
+
+from offer_extraction import scan_message
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extraction_corpus.jsonl")
+REPEAT = 500
+
+
+# The extraction as it was before offer_extraction.py, kept here as the baseline
+def legacy_extract_structured_offer(text):
+    offer = {}
+    base_salary_matches = re.findall(r"(?:base(?: salary)? of|salary of|offer(?:ing)?|at|is|around|for)\s*\$?(\d{1,3}(?:,\d{3})*|\d+)[kK]?", text, re.IGNORECASE)
+    salary_matches = re.findall(r"\$?(\d{1,3}(?:,\d{3})*|\d+)[kK]?\b(?!\s*(?:bonus|relocation|stock|year|month))", text)
+    all_numeric_matches = re.findall(r"\$?(\d{1,3}(?:,\d{3})*|\d+)\b", text)
+    potential_salaries = []
+    processed_matches = set()
+    for m in base_salary_matches + salary_matches:
+        num_str = m.replace(",", "").lower()
+        if num_str in processed_matches:
+            continue
+        multiplier = 1000 if 'k' in num_str else 1
+        try:
+            salary = int(re.sub(r"[k$]", "", num_str)) * multiplier
+            if 10000 < salary < 1000000:
+                potential_salaries.append(salary)
+                processed_matches.add(num_str)
+        except ValueError:
+            continue
+    if potential_salaries:
+        offer["base"] = max(potential_salaries)
+    elif all_numeric_matches:
+        numeric_values = [int(m.replace(",", "")) for m in all_numeric_matches if m not in processed_matches]
+        valid_salaries = [s for s in numeric_values if 10000 < s < 1000000]
+        if valid_salaries:
+            offer["base"] = max(valid_salaries)
+    if re.search(r"\b(?:remote(?: work)?|work from home|wfh)\b", text, re.IGNORECASE):
+        offer.setdefault("perks", []).append("remote work")
+    if re.search(r"\b(?:stock options?|equity|rsus?)\b", text, re.IGNORECASE):
+        offer.setdefault("perks", []).append("stock options")
+    if re.search(r"\b(?:relocation(?: bonus| package| assistance)?|moving expenses)\b", text, re.IGNORECASE):
+        offer.setdefault("perks", []).append("relocation assistance")
+    if re.search(r"\b(?:bonus)\b", text, re.IGNORECASE):
+        bonus_matches = re.findall(r"\$?(\d{1,3}(?:,\d{3})*|\d+)[kK]?\s*(?:bonus)", text, re.IGNORECASE)
+        if bonus_matches:
+            num_str = bonus_matches[0].replace(",", "").lower()
+            multiplier = 1000 if 'k' in num_str else 1
+            offer["bonus"] = int(re.sub(r"[k$]", "", num_str)) * multiplier
+        else:
+            offer["bonus"] = "mentioned"
+    if "perks" in offer:
+        offer["perks"] = sorted(list(set(offer["perks"])))
+    if "base" not in offer:
+        return {}
+    return offer
+
+
+def legacy_preferences(text):
+    preferences = []
+    if re.search(r"\b(?:remote(?: work)?|work from home|wfh)\b", text, re.IGNORECASE):
+        preferences.append("remote work")
+    if re.search(r"\b(?:stock options?|equity|rsus?)\b", text, re.IGNORECASE):
+        preferences.append("stock options")
+    if re.search(r"\b(?:relocation|moving)\b", text, re.IGNORECASE):
+        preferences.append("relocation assistance")
+    return preferences
+
+
+def legacy_accepted(text):
+    return bool(re.search(r"\b(deal|accept|agree|sounds good|let'?s do it|i'?ll take it|happy to take it|ok)\b", text, re.IGNORECASE))
+
+
+def legacy_scan(text):
+    return legacy_extract_structured_offer(text), legacy_preferences(text), legacy_accepted(text)
+
+
+def scanner_scan(text):
+    scan = scan_message(text)
+    return scan.offer, scan.preferences, scan.accepted
+
+
+def load_corpus():
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def score(name, extract, corpus):
+    correct = 0
+    for row in corpus:
+        offer, preferences, accepted = extract(row["text"])
+        if (offer, preferences, accepted) == (row["offer"], row["preferences"], row["accepted"]):
+            correct += 1
+        else:
+            print(f"  [{name}] miss: {row['text']!r}\n      got offer={offer} prefs={preferences} accepted={accepted}")
+    print(f"{name}: {correct}/{len(corpus)} messages fully correct")
+
+
+def time_turns(scan_candidate, scan_agent, corpus) -> float:
+    candidates = [row["text"] for row in corpus if row["source"] == "candidate"]
+    agents = [row["text"] for row in corpus if row["source"] == "agent"]
+    pairs = list(zip(candidates, agents * (len(candidates) // len(agents) + 1)))
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        for candidate_text, agent_text in pairs:
+            scan_candidate(candidate_text)
+            scan_agent(agent_text)
+    return (time.perf_counter() - start) / (REPEAT * len(pairs)) * 1e6
+
+
+def legacy_candidate_scan(text):
+    # get_agent_reply ran the acceptance regex, then extract_structured_offer (twice when
+    # the acceptance branch was taken), then extract_preferences
+    legacy_accepted(text)
+    legacy_extract_structured_offer(text)
+    legacy_preferences(text)
+
+
+if __name__ == "__main__":
+    corpus = load_corpus()
+    score("legacy", legacy_scan, corpus)
+    score("scanner", scanner_scan, corpus)
+    legacy_us = time_turns(legacy_candidate_scan, legacy_extract_structured_offer, corpus)
+    scanner_us = time_turns(scan_message, scan_message, corpus)
+    print(f"per turn (candidate message + agent reply): legacy {legacy_us:.1f} us, scanner {scanner_us:.1f} us ({legacy_us / scanner_us:.1f}x)")
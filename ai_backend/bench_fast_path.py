@@ -0,0 +1,137 @@
+# Benchmark: share of turns answered by fast-path rules and the model time they save
+#
+#   python bench_fast_path.py [sessions] [latency_seconds]
+#
+# Sessions replay a mix of scripted negotiations (openings, bare repeats of a counter,
+# "I'll sign for $X" above and below the limit, perk requests) against a FakeConversation,
+# with the fast path off and on, and report model calls, served rate and per-turn latency.
+# Each script is also checked to leave the session in the same state when a model gives
+# the rule replies word for word: served turns must record exactly like model turns, and
+# rejections that mention signing or a number (NEGATED) and commitments naming two amounts
+# (TWO_AMOUNTS) must all go to the model.
+
+import logging
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("OPENAI_API_KEY1", "bench-placeholder")
+os.environ.setdefault("NEGOTIATION_LOG_FILE", "")
+warnings.filterwarnings("ignore")
+
+import negotiation_session
+from fake_llm import FakeConversation
+from fast_path import FastPath
+from langchain_core.messages import AIMessage
+from negotiation_bot_kg import get_dynamic_context_from_kg
+from negotiation_session import NegotiationSessionState
+
+SCRIPTS = (
+    ("Hi, I'm looking for $140,000.", "I'm holding at $140,000.", "I'll sign today for $125,000.", "Deal!"),
+    ("Could you do $130,000 with remote work?", "What about a signing bonus?", "I'd take $150,000 and sign today."),
+    ("Hello, what does the role pay?", "I was hoping for $128,000 with stock options.", "Ok, deal."),
+    ("I need $145,000.", "$145,000.", "I'll sign for $132,000 right now."),
+)
+
+# Refusals that name a base and a signing word; none of them may be served
+NEGATED = (
+    "No deal at $100,000, I can't sign for that.",
+    "I won't sign for $110,000.",
+    "I'd take $150,000, not $120,000.",
+    "I wouldn't take $105,000.",
+    "I’m not ready to sign at $112,000.",
+    "I will never take $100,000.",
+    "I don't think I'll sign for $118,000.",
+    "I cannot take $108,000.",
+)
+
+# Commitments that also name another amount; the larger one isn't the one committed to
+TWO_AMOUNTS = (
+    "I wanted $140k, but I'll sign for $128k.",
+    "I'll sign for $128,000 today, down from $140,000.",
+    "I'd take $125,000 instead of the $135,000 I asked for.",
+)
+
+
+class ScriptedConversation:
+    # Answers with the given replies in order
+    def __init__(self, replies):
+        self.replies = iter(replies)
+
+    def invoke(self, inputs, config=None):
+        return AIMessage(content=next(self.replies))
+
+
+def session_state(state):
+    return (state.kg.get_negotiation_summary(), get_dynamic_context_from_kg(state.kg), state.subjective_limit,
+            state.last_agent_offer_details, state.kg.count_offers_by_status("rejected", "agent"))
+
+
+def check_parity():
+    for index, script in enumerate(SCRIPTS):
+        negotiation_session.conversation = FakeConversation(0)
+        negotiation_session.fast_path = FastPath()
+        served = NegotiationSessionState(f"parity-{index}")
+        replies = [served.get_agent_reply(message) for message in script]
+        negotiation_session.conversation = ScriptedConversation(replies)
+        negotiation_session.fast_path = None
+        modelled = NegotiationSessionState(f"parity-{index}")
+        for message in script:
+            modelled.get_agent_reply(message)
+        if session_state(served) != session_state(modelled):
+            raise SystemExit(f"script {index}: fast-path turns recorded differently from model turns")
+    print(f"parity: {len(SCRIPTS)} scripts record identically with and without the fast path")
+
+
+def check_model_only(label, messages):
+    fake = negotiation_session.conversation = FakeConversation(0)
+    fast_path = negotiation_session.fast_path = FastPath()
+    for index, message in enumerate(messages):
+        state = NegotiationSessionState(f"{label}-{index}")
+        state.get_agent_reply("I'm looking for $140,000.")
+        calls = fake.calls
+        state.get_agent_reply(message)
+        if fake.calls != calls + 1 or fast_path.stats()["served"]:
+            raise SystemExit(f"fast path answered a turn the model must take: {message!r}")
+    print(f"{label}: {len(messages)} messages all went to the model")
+
+
+def run(sessions: int, latency: float, fast_path):
+    fake = negotiation_session.conversation = FakeConversation(latency)
+    negotiation_session.fast_path = fast_path
+    latencies = []
+
+    def play(index):
+        state = NegotiationSessionState(f"fast-{index}")
+        for message in SCRIPTS[index % len(SCRIPTS)]:
+            started = time.perf_counter()
+            state.get_agent_reply(message)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(16) as pool:
+        list(pool.map(play, range(sessions)))
+    return fake.calls, latencies, time.perf_counter() - started
+
+
+def main(sessions: int, latency: float):
+    logging.disable(logging.CRITICAL)
+    check_parity()
+    check_model_only("negation", NEGATED)
+    check_model_only("two amounts", TWO_AMOUNTS)
+    print(f"{sessions} sessions, {len(SCRIPTS)} scripts, model latency {latency * 1000:.0f} ms")
+    print(f"{'fast path':>9} {'turns':>6} {'model calls':>12} {'mean ms':>8} {'wall s':>7}")
+    for label, fast_path in (("off", None), ("on", FastPath())):
+        calls, latencies, wall = run(sessions, latency, fast_path)
+        mean = sum(latencies) / len(latencies) * 1000
+        print(f"{label:>9} {len(latencies):>6} {calls:>12} {mean:>8.0f} {wall:>7.2f}")
+        if fast_path is not None:
+            print("fast path:", fast_path.stats())
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 200,
+         float(args[1]) if len(args) > 1 else 0.2)
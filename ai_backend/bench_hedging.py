@@ -0,0 +1,82 @@
+# Benchmark: turn latency with and without hedged model calls, against a heavy-tailed fake model
+#
+#   python bench_hedging.py [turns] [concurrency]
+#
+# The fake model answers in ~300 ms, but 5% of calls take 5 s. Turns run through
+# NegotiationSessionState.get_agent_reply (threads) and aget_agent_reply (asyncio) with
+# hedging off and on; "extra load" is model calls per turn minus one.
+
+import asyncio
+import logging
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+warnings.filterwarnings("ignore")
+os.environ.setdefault("OPENAI_API_KEY1", "bench-placeholder")
+
+import negotiation_session
+from fake_llm import FakeConversation
+from llm_hedging import HedgedCalls
+from negotiation_session import NegotiationSessionState
+
+MESSAGES = ("Hi, I'm hoping for $140,000.", "Could you do $132,000 with remote work?", "What about $128,000?")
+
+
+def percentiles(latencies):
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return pick(0.5), pick(0.95), pick(0.99)
+
+
+def run_threads(turns: int, concurrency: int):
+    def turn(index):
+        state = NegotiationSessionState(f"hedge-{index}")
+        started = time.perf_counter()
+        state.get_agent_reply(MESSAGES[index % len(MESSAGES)])
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(turn, range(turns)))
+
+
+async def run_async(turns: int, concurrency: int):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def turn(index):
+        async with limit:
+            state = NegotiationSessionState(f"hedge-{index}")
+            started = time.perf_counter()
+            await state.aget_agent_reply(MESSAGES[index % len(MESSAGES)])
+            return time.perf_counter() - started
+
+    return await asyncio.gather(*(turn(index) for index in range(turns)))
+
+
+def main(turns: int, concurrency: int):
+    logging.disable(logging.CRITICAL)
+    print(f"{turns} turns, {concurrency} concurrent; model ~300 ms, 5% of calls 5 s")
+    print(f"{'mode':>14} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'extra load':>11} {'hedge rate':>11} {'win rate':>9}")
+    for mode in ("threads", "asyncio"):
+        for hedged in (False, True):
+            fake = FakeConversation(latency=0.3, latency_sd=0.05, tail_rate=0.05, tail_latency=5.0, seed=3)
+            negotiation_session.conversation = fake
+            # A short initial deadline so the bench doesn't spend its first calls learning the latency
+            negotiation_session.llm_hedging = HedgedCalls(initial_delay=0.6) if hedged else None
+            if mode == "threads":
+                latencies = run_threads(turns, concurrency)
+            else:
+                latencies = asyncio.run(run_async(turns, concurrency))
+            p50, p95, p99 = percentiles(latencies)
+            stats = negotiation_session.hedging_stats() or {}
+            label = f"{mode} {'hedged' if hedged else 'plain'}"
+            rate = lambda key: f"{stats[key]:.1%}" if stats.get(key) is not None else "-"
+            print(f"{label:>14} {p50:>8.0f} {p95:>8.0f} {p99:>8.0f} {fake.calls / turns - 1:>11.1%} {rate('hedge_rate'):>11} {rate('win_rate'):>9}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 400,
+         int(args[1]) if len(args) > 1 else 32)
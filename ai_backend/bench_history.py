@@ -0,0 +1,73 @@
+# Benchmark: size of the {history} prompt slot as a negotiation grows
+#
+#   python bench_history.py [turns]
+#
+# Drives one session through FakeConversation and, at checkpoints, renders the full
+# negotiation prompt with the bounded KG history (what negotiation_bot_kg sends) and with
+# an unbounded verbatim transcript of every turn, for comparison. Token counts use the
+# same ~4 characters/token estimate as the history budget.
+
+import gc
+import logging
+import os
+import sys
+import time
+import warnings
+
+os.environ.setdefault("OPENAI_API_KEY1", "bench-placeholder")
+warnings.filterwarnings("ignore")
+
+import negotiation_session
+from conversation_history import approx_tokens, format_history
+from fake_llm import FakeConversation
+from langchain_core.messages import AIMessage, HumanMessage
+from negotiation_bot_kg import get_memory, history_store, prompt_layout
+from negotiation_session import NegotiationSessionState
+
+MESSAGES = (
+    "I'm looking for $140,000 with remote work.",
+    "Could you do $135,000 and stock options?",
+    "What about relocation assistance? I could go to $132,000.",
+    "How about $130,000 with a $10,000 signing bonus?",
+)
+REPEAT = 500
+
+
+def full_transcript(state: NegotiationSessionState):
+    messages = []
+    for turn_number in range(1, state.kg.turn_count + 1):
+        candidate, agent = state.kg.get_turn_messages(turn_number)
+        messages += [HumanMessage(content=candidate), AIMessage(content=agent)]
+    return messages
+
+
+def prompt_tokens(inputs) -> int:
+    return sum(approx_tokens(message.content) for message in prompt_layout.render(inputs))
+
+
+def main(turns: int):
+    logging.disable(logging.CRITICAL)
+    negotiation_session.conversation = FakeConversation(0)
+    state = NegotiationSessionState("bench_history")
+    history_store.bind(state.session_id, state.kg)
+    checkpoints = {n for n in (1, 5, 10, 50, 100, 200, 500, 1000, 2000) if n <= turns} | {turns}
+    print(f"history budget: last {history_store.max_turns} turns, {history_store.max_tokens} tokens")
+    print(f"{'turn':>6} {'history tok':>12} {'prompt tok':>11} {'unbounded tok':>14} {'build us':>9}")
+    for turn in range(1, turns + 1):
+        state.get_agent_reply(MESSAGES[turn % len(MESSAGES)])
+        if turn not in checkpoints:
+            continue
+        inputs = {"message": MESSAGES[0], "subjective_limit": state.subjective_limit, "kg_context": ""}
+        history = format_history(get_memory(state.session_id).messages)
+        unbounded = format_history(full_transcript(state))
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            format_history(get_memory(state.session_id).messages)
+        build_us = (time.perf_counter() - start) / REPEAT * 1e6
+        print(f"{turn:>6} {approx_tokens(history):>12} {prompt_tokens({**inputs, 'history': history}):>11} "
+              f"{prompt_tokens({**inputs, 'history': unbounded}):>14} {build_us:>9.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
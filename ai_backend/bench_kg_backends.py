@@ -0,0 +1,156 @@
+# Benchmark and parity check: networkx vs compact KG backend
+#
+#   python bench_kg_backends.py [sessions] [turns]
+#
+# Parity: seeded random sequences of KG mutations (including re-offers in the same turn,
+# offers whose details aren't a dict, unknown offer ids, repeated preferences and similarity
+# links) are applied to both backends, and every public query (including similar-offer
+# lookups), the rendered prompt context, the negotiation summary and the offer export rows are compared after each step. The journal ops one backend records
+# are also replayed into the other, and both are compared again after a pickle round trip.
+# Memory: `sessions` concurrent KGs of `turns` turns each, measured with tracemalloc.
+
+import contextlib
+import gc
+import io
+import pickle
+import random
+import sys
+import time
+import tracemalloc
+
+from compact_kg import CompactNegotiationKnowledgeGraph
+from negotiation_bot_kg import get_dynamic_context_from_kg
+from negotiation_kg import NegotiationKnowledgeGraph
+
+PARITY_SEQUENCES = 300
+PARITY_STEPS = 60
+STATUSES = ("proposed", "rejected", "accepted", "superseded", "accepted_trigger")
+PARTIES = ("candidate", "agent", None)
+PERKS = ("remote work", "Remote Work", "stock options", "signing bonus", "relocation")
+# find_similar_offer probes: (details, tolerance)
+SIMILARITY_PROBES = (({"base": 120_000}, 0.0), ({"base": 121_000}, 0.02), ({"base": 130_000, "perks": ["Remote Work"]}, 0.05),
+                     ({"base": 120_000, "perks": ["remote work"]}, None), ({"base": 140_000, "bonus": 10_000}, 0.1))
+
+
+def snapshot(kg):
+    state = {
+        "turn_count": kg.turn_count,
+        "version": kg.version,
+        "limit": kg.get_current_limit(),
+        "preferences": kg.get_candidate_preferences(),
+        "context": get_dynamic_context_from_kg(kg),
+        "summary": kg.get_negotiation_summary(),
+        "turns": [kg.get_turn_messages(t) for t in range(0, kg.turn_count + 2)],
+        # Timestamps differ between the two KGs; limits and offers must not
+        "export": (list(kg.export_rows()[0]), kg.export_rows()[2]),
+    }
+    for party in PARTIES:
+        state[("last", party)] = kg.get_last_offer_details(party)
+        state[("span", party)] = [kg.get_offer_span(party, t) for t in range(0, kg.turn_count + 1)]
+        for status in STATUSES:
+            state[(status, party)] = (kg.get_offers_by_status(status, party), kg.get_offers_by_status(status, party, limit=2),
+                                      kg.count_offers_by_status(status, party))
+            if party is not None:
+                state[("similar", status, party)] = [kg.find_similar_offer(details, status, party, tolerance)
+                                                     for details, tolerance in SIMILARITY_PROBES]
+    for t in range(0, kg.turn_count + 2):
+        for party in ("candidate", "agent"):
+            state[("status", t, party)] = kg.get_offer_status(f"offer_{t}_{party}")
+            # The graph returns links outgoing first, the compact backend in link order
+            state[("similar", t, party)] = sorted(kg.get_similar_offers(f"offer_{t}_{party}"))
+    return state
+
+
+def random_step(kg, rng: random.Random):
+    roll = rng.random()
+    if roll < 0.2 or kg.turn_count == 0:
+        kg.add_turn(f"candidate says {rng.random():.3f}", f"agent says {rng.random():.3f}", rng.choice((115_000, 120_750, 135_000)))
+    elif roll < 0.55:
+        details = rng.choice(({"base": rng.randrange(100, 150) * 1_000}, {"base": 120_000, "perks": ["remote work"]},
+                              {"base": rng.randrange(125, 135) * 1_000, "perks": ["remote work"]},
+                              {"base": 140_000, "bonus": rng.choice((10_000, "mentioned"))},
+                              {}, {"status_trigger": "acceptance"}, "not a dict"))
+        kg.add_offer(rng.randint(0, kg.turn_count + 1), details, rng.choice(("candidate", "agent")), rng.choice(STATUSES[:3]))
+    elif roll < 0.8:
+        kg.update_offer_status(f"offer_{rng.randint(0, kg.turn_count + 1)}_{rng.choice(('candidate', 'agent'))}", rng.choice(STATUSES))
+    elif roll < 0.85:
+        kg.add_candidate_preference(rng.choice(PERKS))
+    elif roll < 0.92:
+        pick = lambda: f"offer_{rng.randint(0, kg.turn_count + 1)}_{rng.choice(('candidate', 'agent'))}"
+        kg.add_similar_offer_relation(pick(), pick())
+    else:
+        kg.set_agent_response(rng.randint(0, kg.turn_count + 1), f"revised {rng.random():.3f}")
+
+
+def check_parity():
+    failures = 0
+    with contextlib.redirect_stdout(io.StringIO()):  # both backends print the same warnings
+        for seed in range(PARITY_SEQUENCES):
+            graph, compact = NegotiationKnowledgeGraph(f"s{seed}"), CompactNegotiationKnowledgeGraph(f"s{seed}")
+            graph.journal_ops = []
+            rng_graph, rng_compact = random.Random(seed), random.Random(seed)
+            for _ in range(PARITY_STEPS):
+                random_step(graph, rng_graph)
+                random_step(compact, rng_compact)
+                if snapshot(graph) != snapshot(compact):
+                    failures += 1
+                    break
+            replayed = CompactNegotiationKnowledgeGraph(f"s{seed}")
+            for op in graph.journal_ops:
+                replayed.apply_journal_op(*op)
+            graph.journal_ops = None
+            restored = pickle.loads(pickle.dumps(compact))
+            if not (snapshot(graph) == snapshot(replayed) == snapshot(restored)):
+                failures += 1
+    print(f"parity: {PARITY_SEQUENCES} sequences x {PARITY_STEPS} steps, {failures} mismatches")
+    return failures == 0
+
+
+def play(kg, turns: int, rng: random.Random):
+    # The mutations one negotiation turn makes in NegotiationSessionState
+    previous_agent_offer = None
+    for t in range(turns):
+        turn = kg.add_turn("Could you do $135,000 and stock options? I'd also like remote work.",
+                           "We can offer a base salary of $118,000 with stock options and a relocation bonus.", 115_000 + 2_000 * t)
+        kg.add_offer(turn, {"base": 140_000 - 2_000 * t}, "candidate")
+        if previous_agent_offer:
+            kg.update_offer_status(previous_agent_offer, "rejected")
+        previous_agent_offer = kg.add_offer(turn, {"base": 112_000 + 1_500 * t, "perks": ["stock options"]}, "agent")
+        kg.add_candidate_preference(rng.choice(PERKS))
+
+
+def measure(factory, sessions: int, turns: int):
+    rng = random.Random(1)
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    kgs = []
+    for s in range(sessions):
+        kg = factory(f"session-{s}")
+        play(kg, turns, rng)
+        kgs.append(kg)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pickled = sum(len(pickle.dumps(kg, protocol=pickle.HIGHEST_PROTOCOL)) for kg in kgs[:200]) / min(200, sessions)
+    estimate = sum(kg.approx_memory_bytes() for kg in kgs) / sessions
+    return current / sessions, pickled, estimate, elapsed
+
+
+def main(sessions: int, turns: int):
+    parity_ok = check_parity()
+    print(f"memory: {sessions} sessions x {turns} turns")
+    print(f"{'backend':>9} {'bytes/session':>14} {'total MiB':>10} {'pickled B':>10} {'estimate B':>11} {'build s':>8}")
+    results = {}
+    for name, factory in (("networkx", NegotiationKnowledgeGraph), ("compact", CompactNegotiationKnowledgeGraph)):
+        per_session, pickled, estimate, elapsed = results[name] = measure(factory, sessions, turns)
+        print(f"{name:>9} {per_session:>14,.0f} {per_session * sessions / 2**20:>10.1f} {pickled:>10,.0f} {estimate:>11,.0f} {elapsed:>8.2f}")
+    print(f"compact uses {results['networkx'][0] / results['compact'][0]:.1f}x less memory per session")
+    if not parity_ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 10_000,
+         int(args[1]) if len(args) > 1 else 6)
@@ -0,0 +1,69 @@
+# Benchmark: cost of building the KG prompt context per turn
+#
+#   python bench_kg_context.py [turns]
+#
+# Compares get_dynamic_context_from_kg (versioned section cache on the KG) with a
+# from-scratch render, on turns that mutate offer state and on turns that don't.
+
+import gc
+import os
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY1", "bench-placeholder")
+
+from negotiation_bot_kg import get_dynamic_context_from_kg, CONTEXT_RENDERERS
+from negotiation_kg import NegotiationKnowledgeGraph
+
+REPEAT = 2000
+
+
+def render_from_scratch(kg: NegotiationKnowledgeGraph) -> str:
+    context_parts = [text for text in (render(kg) for _, render in CONTEXT_RENDERERS) if text]
+    return " ".join(context_parts) if context_parts else "No specific context from Knowledge Graph yet."
+
+
+def time_call(fn, kg: NegotiationKnowledgeGraph) -> float:
+    gc.collect()  # keep a full collection of the LangChain import graph out of the timings
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn(kg)
+    return (time.perf_counter() - start) / REPEAT * 1e6
+
+
+def main(turns: int):
+    kg = NegotiationKnowledgeGraph("bench_session")
+    kg.add_candidate_preference("remote work")
+    last_agent_offer = None
+    for turn in range(1, turns + 1):
+        t = kg.add_turn("How about $130,000?", "We can do $118,000 base.", 115_000)
+        assert get_dynamic_context_from_kg(kg) == render_from_scratch(kg)
+        kg.add_offer(t, {"base": 130_000 + turn, "perks": ["remote work"]}, "candidate")
+        if last_agent_offer:
+            kg.update_offer_status(last_agent_offer, "rejected")
+        last_agent_offer = kg.add_offer(t, {"base": 118_000 + turn, "perks": ["stock options"]}, "agent")
+        assert get_dynamic_context_from_kg(kg) == render_from_scratch(kg)
+
+    # Unchanged offer state: every call after the first is a cache hit
+    cached = time_call(get_dynamic_context_from_kg, kg)
+    uncached = time_call(render_from_scratch, kg)
+
+    # Offer state changes every call: the cache has to re-render the dirtied sections
+    def mutate_and_build(kg):
+        kg.update_offer_status(last_agent_offer, "rejected" if kg.version % 2 else "proposed")
+        get_dynamic_context_from_kg(kg)
+
+    def mutate_and_render(kg):
+        kg.update_offer_status(last_agent_offer, "rejected" if kg.version % 2 else "proposed")
+        render_from_scratch(kg)
+
+    dirty_cached = time_call(mutate_and_build, kg)
+    dirty_uncached = time_call(mutate_and_render, kg)
+
+    print(f"turns={turns}")
+    print(f"unchanged state: cached {cached:8.2f} us   full render {uncached:8.2f} us   ({uncached / cached:.1f}x)")
+    print(f"offer changed:   cached {dirty_cached:8.2f} us   full render {dirty_uncached:8.2f} us")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,134 @@
+# Benchmark: per-turn cost of the KG offer queries as a negotiation grows
+#
+#   python bench_kg_queries.py [max_turns]
+#
+# Compares the indexed lookups in NegotiationKnowledgeGraph with the full node scans
+# they replaced (and the similarity index with the rejected-offer and edge scans). Per-turn cost of the indexed path should stay flat with session length.
+
+import sys
+import time
+from typing import Optional
+
+from negotiation_kg import NegotiationKnowledgeGraph, SIMILAR_OFFER_TOLERANCE, offer_shape
+
+CHECKPOINTS = (10, 50, 100, 250, 500, 1000)
+REPEAT = 200
+
+
+def scan_last_offer_details(kg: NegotiationKnowledgeGraph, offered_by: Optional[str] = None):
+    offers = []
+    for node, data in kg.graph.nodes(data=True):
+        if data.get("type") == "Offer":
+            if offered_by is None or data.get("offered_by") == offered_by:
+                details = data.get("details")
+                if isinstance(details, dict):
+                    offers.append((data.get("turn_number", 0), details, node))
+    if not offers:
+        return None
+    offers.sort(key=lambda x: x[0], reverse=True)
+    return offers[0]
+
+
+def scan_offers_by_status(kg: NegotiationKnowledgeGraph, status: str, offered_by: Optional[str] = None):
+    matching_offers = []
+    for node, data in kg.graph.nodes(data=True):
+        if data.get("type") == "Offer" and data.get("status") == status:
+            if offered_by is None or data.get("offered_by") == offered_by:
+                details = data.get("details")
+                if isinstance(details, dict):
+                    matching_offers.append((data.get("turn_number", 0), details, node))
+    matching_offers.sort(key=lambda x: x[0], reverse=True)
+    return matching_offers
+
+
+def scan_similar_offer(kg: NegotiationKnowledgeGraph, details, status: str = "rejected", offered_by: str = "agent"):
+    base, bonus, perks = offer_shape(details)
+    matches = [entry for entry in scan_offers_by_status(kg, status, offered_by)  # newest first
+               if (shape := offer_shape(entry[1])) is not None and shape[1:] == (bonus, perks)
+               and abs(shape[0] - base) <= int(base * SIMILAR_OFFER_TOLERANCE)]
+    # Nearest base, then the lower base; min keeps the first (newest) of equal keys
+    return min(matches, key=lambda entry: (abs(entry[1]["base"] - base), entry[1]["base"]), default=None)
+
+
+def scan_similar_offers(kg: NegotiationKnowledgeGraph, offer_node_id: str):
+    similar = []
+    for u, v, data in kg.graph.edges(data=True):
+        if data.get("type") == "SIMILAR_TO":
+            if u == offer_node_id:
+                similar.append(v)
+            elif v == offer_node_id:
+                similar.append(u)
+    return similar
+
+
+def probe(kg: NegotiationKnowledgeGraph):
+    return {"base": 118_000 + kg.turn_count}
+
+
+# The queries one /negotiate turn issues (limit calculation, prompt context, post-reply linking).
+def indexed_turn_queries(kg: NegotiationKnowledgeGraph):
+    kg.get_last_offer_details("candidate")
+    kg.count_offers_by_status("rejected", "agent")
+    kg.get_offers_by_status("rejected", "agent", limit=2)
+    kg.get_offers_by_status("proposed", "agent", limit=1)
+    kg.get_last_offer_details("agent")
+    kg.get_last_offer_details("candidate")
+    kg.find_similar_offer(probe(kg), "rejected", "agent")
+    kg.get_similar_offers(f"offer_{kg.turn_count}_agent")
+
+
+def scan_turn_queries(kg: NegotiationKnowledgeGraph):
+    scan_last_offer_details(kg, "candidate")
+    len(scan_offers_by_status(kg, "rejected", "agent"))
+    scan_offers_by_status(kg, "rejected", "agent")[:2]
+    scan_offers_by_status(kg, "proposed", "agent")[:1]
+    scan_last_offer_details(kg, "agent")
+    scan_last_offer_details(kg, "candidate")
+    scan_similar_offer(kg, probe(kg))
+    scan_similar_offers(kg, f"offer_{kg.turn_count}_agent")
+
+
+def play_turn(kg: NegotiationKnowledgeGraph, last_agent_offer: Optional[str]) -> str:
+    turn = kg.add_turn("How about $130,000 with remote work?", "We can do $118,000 base.", 115_000 + kg.turn_count)
+    kg.add_offer(turn, {"base": 130_000 + turn, "perks": ["remote work"]}, "candidate")
+    if last_agent_offer:
+        kg.update_offer_status(last_agent_offer, "rejected")
+    agent_offer = kg.add_offer(turn, {"base": 118_000 + turn}, "agent")
+    similar = kg.find_similar_offer({"base": 118_000 + turn}, "rejected", "agent")
+    if similar is not None:
+        kg.add_similar_offer_relation(agent_offer, similar[2])
+    return agent_offer
+
+
+def check_parity(kg: NegotiationKnowledgeGraph):
+    for party in (None, "agent", "candidate"):
+        assert kg.get_last_offer_details(party) == scan_last_offer_details(kg, party)
+        for status in ("proposed", "rejected", "accepted"):
+            assert kg.get_offers_by_status(status, party) == scan_offers_by_status(kg, status, party)
+    assert kg.find_similar_offer(probe(kg), "rejected", "agent") == scan_similar_offer(kg, probe(kg))
+    for turn in range(1, kg.turn_count + 1):
+        assert sorted(kg.get_similar_offers(f"offer_{turn}_agent")) == sorted(scan_similar_offers(kg, f"offer_{turn}_agent"))
+
+
+def time_queries(fn, kg: NegotiationKnowledgeGraph) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn(kg)
+    return (time.perf_counter() - start) / REPEAT * 1e6
+
+
+def main(max_turns: int):
+    kg = NegotiationKnowledgeGraph("bench_session")
+    last_agent_offer = None
+    print(f"{'turns':>6} {'nodes':>7} {'indexed us/turn':>16} {'scan us/turn':>13} {'speedup':>8}")
+    for turn in range(1, max_turns + 1):
+        last_agent_offer = play_turn(kg, last_agent_offer)
+        if turn in CHECKPOINTS:
+            check_parity(kg)
+            indexed = time_queries(indexed_turn_queries, kg)
+            scanned = time_queries(scan_turn_queries, kg)
+            print(f"{turn:>6} {kg.graph.number_of_nodes():>7} {indexed:>16.2f} {scanned:>13.2f} {scanned / indexed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else max(CHECKPOINTS))
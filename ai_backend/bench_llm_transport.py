@@ -0,0 +1,108 @@
+# Benchmark: default ChatOpenAI transport vs llm_transport against a misbehaving endpoint
+#
+#   python bench_llm_transport.py [calls] [concurrency]
+#
+# A local OpenAI-compatible server answers in ~50 ms, but fails some calls with 503 and
+# stalls others for STALL_SECONDS. The default client waits out every stall (its timeout is
+# 10 minutes) and opens connections as its pool sees fit; the tuned transport times out
+# stalled reads, retries within its budget and reports how often connections were reused.
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+warnings.filterwarnings("ignore")
+
+FAILURE_RATE = 0.05
+STALL_RATE = 0.03
+STALL_SECONDS = 8.0
+LATENCY = 0.05
+
+
+class FakeCompletions(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is possible
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("content-length", 0)))
+        roll = random.random()
+        if roll < FAILURE_RATE:
+            return self._reply(503, {"error": {"message": "upstream overloaded"}})
+        time.sleep(STALL_SECONDS if roll < FAILURE_RATE + STALL_RATE else LATENCY)
+        self._reply(200, {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": "bench",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "We can offer a base salary of $118,000."}}],
+            "usage": {"prompt_tokens": 1200, "completion_tokens": 12, "total_tokens": 1212},
+        })
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out and went away
+
+    def log_message(self, *args):
+        pass
+
+
+def run(llm, calls: int, concurrency: int):
+    def call(_):
+        started = time.perf_counter()
+        try:
+            llm.invoke("Could you do $130,000?")
+            ok = True
+        except Exception:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(call, range(calls)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for latency, _ in results)
+    failures = sum(1 for _, ok in results if not ok)
+    return elapsed, latencies, failures
+
+
+def main(calls: int, concurrency: int):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeCompletions)
+    server.daemon_threads = True
+    server.handle_error = lambda request, client_address: None  # clients hanging up on stalls
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_base = f"http://127.0.0.1:{server.server_port}"
+
+    os.environ.update({"OPENAI_API_KEY1": "bench-placeholder", "LITELLM_API_BASE": api_base,
+                       "NEGOTIATION_LLM_READ_TIMEOUT": os.getenv("NEGOTIATION_LLM_READ_TIMEOUT", "1.5")})
+    from langchain_openai import ChatOpenAI
+    import negotiation_bot_kg
+
+    clients = {
+        "default": ChatOpenAI(openai_api_key="bench-placeholder", openai_api_base=api_base, model="bench"),
+        "tuned": negotiation_bot_kg.default_llm_factory(),
+    }
+    print(f"{calls} calls, {concurrency} concurrent; {FAILURE_RATE:.0%} answer 503, {STALL_RATE:.0%} stall {STALL_SECONDS:.0f}s")
+    print(f"{'transport':>9} {'wall s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'failed':>7}")
+    for name, llm in clients.items():
+        random.seed(7)
+        elapsed, latencies, failures = run(llm, calls, concurrency)
+        pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+        print(f"{name:>9} {elapsed:>7.1f} {pick(0.5):>8.0f} {pick(0.95):>8.0f} {pick(0.99):>8.0f} {latencies[-1] * 1000:>8.0f} {failures:>7}")
+    print("tuned transport:", json.dumps(negotiation_bot_kg.llm_transport_stats()))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 400,
+         int(args[1]) if len(args) > 1 else 16)
@@ -0,0 +1,143 @@
+# Load test: the Flask API over real HTTP against a fake chat model
+#
+#   python bench_load.py [--sessions 200] [--concurrency 32] [--turns 4]
+#                        [--latency 0.3] [--latency-sd 0.1] [--seed 7]
+#
+# Serves ai_negotiator_api_cors.app from a threaded werkzeug server on a free local port
+# and replays scripted multi-turn negotiations from `concurrency` simulated candidates,
+# each playing its sessions' turns one after another. The model is a FakeConversation
+# with normally distributed latency and a weighted mix of replies. Each response carries
+# the model time its request spent (X-Fake-LLM-Seconds, added by this script), so latency
+# is reported as total, model time and local overhead (HTTP, session store, KG,
+# extraction). Memory growth is the process RSS delta over the run, per session.
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("OPENAI_API_KEY1", "bench-placeholder")
+os.environ.setdefault("NEGOTIATION_LOG_FILE", "")  # console only; no JSON log file from bench runs
+warnings.filterwarnings("ignore")
+
+from flask import request
+from werkzeug.serving import make_server
+
+import ai_negotiator_api_cors
+import negotiation_session
+from fake_llm import FakeConversation
+
+SCRIPTS = (
+    ("Hi! I'm looking for $140,000 with remote work.",
+     "That's lower than I hoped. Could you do $135,000 and stock options?",
+     "What about relocation assistance? I could go to $132,000.",
+     "How about $130,000 with a $10,000 signing bonus?",
+     "Okay, I think we're close. $128,000 and I'll sign."),
+    ("I was expecting around $150k given my experience.",
+     "Flexible hours and remote work matter a lot to me. Can you reach $138,000?",
+     "I could accept $133,000 if there's a signing bonus.",
+     "Let's say $131,000 with four weeks of PTO?",
+     "Final answer: $129,500."),
+)
+# (weight, template, amount below the current ceiling)
+REPLY_MIX = (
+    (0.7, "We can offer a base salary of ${offer:,} with stock options.", 2_750),
+    (0.2, "I hear you. We could add a relocation bonus and set the base at ${offer:,}.", 6_500),
+    (0.1, "Let me see what flexibility we have; remote work is definitely something we can discuss.", 0),
+)
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+
+def start_server(fake: FakeConversation):
+    app = ai_negotiator_api_cors.app
+
+    @app.before_request
+    def reset_model_time():
+        fake.take_thread_seconds()
+
+    @app.after_request
+    def report_model_time(response):
+        if request.path == "/negotiate":
+            response.headers["X-Fake-LLM-Seconds"] = f"{fake.take_thread_seconds():.6f}"
+        return response
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def post_turn(url: str, session_id: str, message: str):
+    body = json.dumps({"userInput": message, "sessionId": session_id}).encode("utf-8")
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req) as response:
+        reply = json.loads(response.read())["reply"]
+        llm_seconds = float(response.headers.get("X-Fake-LLM-Seconds", 0))
+    return time.perf_counter() - start, llm_seconds, reply.startswith("Error")
+
+
+def main(args):
+    logging.disable(logging.CRITICAL)
+    fake = FakeConversation(args.latency, latency_sd=args.latency_sd, replies=REPLY_MIX, seed=args.seed)
+    negotiation_session.conversation = fake
+    server = start_server(fake)
+    url = f"http://127.0.0.1:{server.server_port}/negotiate"
+
+    def negotiation(n: int):
+        script = SCRIPTS[n % len(SCRIPTS)]
+        return [post_turn(url, f"load-{n}", script[t % len(script)]) for t in range(args.turns)]
+
+    # One warm-up negotiation so imports and first-call costs stay out of the numbers
+    negotiation(-1)
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        samples = [sample for turns in pool.map(negotiation, range(args.sessions)) for sample in turns]
+    elapsed = time.perf_counter() - start
+    rss_after = rss_bytes()
+    server.shutdown()
+
+    totals = sorted(s[0] for s in samples)
+    model = sorted(s[1] for s in samples)
+    overhead = sorted(s[0] - s[1] for s in samples)
+    errors = sum(s[2] for s in samples)
+    print(f"{args.sessions} sessions x {args.turns} turns, {args.concurrency} concurrent, "
+          f"model latency {args.latency * 1000:.0f}±{args.latency_sd * 1000:.0f} ms")
+    print(f"throughput: {len(samples) / elapsed:.1f} turns/s over {elapsed:.2f} s, {errors} error replies")
+    print(f"{'ms':>10} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, values in (("total", totals), ("model", model), ("overhead", overhead)):
+        print(f"{name:>10} " + " ".join(f"{percentile(values, p) * 1000:>8.1f}" for p in (50, 95, 99)))
+    store = ai_negotiator_api_cors.negotiation_sessions.stats()
+    print(f"memory: RSS +{(rss_after - rss_before) / 2**20:.1f} MiB, "
+          f"{(rss_after - rss_before) / args.sessions / 1024:.1f} KiB/session "
+          f"(store estimate {store['approx_memory_bytes'] / max(1, store['resident_sessions']) / 1024:.1f} KiB/session)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--latency-sd", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
@@ -0,0 +1,155 @@
+# Benchmark and check: columnar offer export vs per-session JSON rows
+#
+#   python bench_offer_export.py [sessions] [chunk]
+#
+# Builds `sessions` concluded negotiations (both KG backends), `chunk` at a time, and appends
+# each chunk to an OfferExport as sessions would conclude. The baseline walks every session's
+# graph into per-row dicts and writes them as JSON lines, the ad-hoc way to get the same data
+# out. Only export time is measured, not building the KGs. The columns are then read back and
+# checked against the generated sessions (row counts, accepted bases, opening anchors), and a
+# flush cut short is recovered by reopening the export. "read s" is loading everything back:
+# read_export for the columns, json.loads per line for the rows.
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from negotiation_kg import make_knowledge_graph
+from offer_export import OfferExport, read_export
+
+PERKS = ("remote work", "Stock Options", "signing bonus", "relocation")
+
+
+def negotiate(kg, rng: random.Random):
+    """A random concluded-or-abandoned negotiation; returns (opening agent base, accepted base or None)."""
+    limit, ask, offer = 115_000, rng.randrange(125, 160) * 1_000, rng.randrange(100, 112) * 1_000
+    opening = offer
+    for turn in range(1, rng.randint(3, 12) + 1):
+        kg.add_turn(f"How about ${ask:,}?", f"We can do ${offer:,}.", limit)
+        kg.add_offer(turn, {"base": ask, **({"perks": [rng.choice(PERKS)]} if rng.random() < 0.3 else {})}, "candidate")
+        if turn > 1:
+            kg.update_offer_status(f"offer_{turn - 1}_agent", "rejected")
+        kg.add_offer(turn, {"base": offer, **({"bonus": rng.choice((5_000, "mentioned"))} if rng.random() < 0.2 else {})}, "agent")
+        limit = min(140_000, int(limit * 1.05))
+        ask = max(offer, ask - rng.randrange(0, 6) * 1_000)
+        offer = min(limit, offer + rng.randrange(1, 6) * 1_000)
+    last = kg.turn_count
+    if rng.random() < 0.6:
+        kg.update_offer_status(f"offer_{last}_agent", "accepted")
+        kg.add_turn("Deal.", "Agreement Reached.", limit)
+        kg.add_offer(last + 1, {"status_trigger": "acceptance"}, "candidate", status="accepted_trigger")
+        return opening, kg.get_offers_by_status("accepted", "agent")[0][1]["base"]
+    return opening, None
+
+
+def json_rows(kg, f):
+    # The baseline: one dict per turn and per offer, read off the graph node by node
+    for node_id, data in kg.graph.nodes(data=True):
+        node_type = data.get("type")
+        if node_type == "Turn":
+            limit = kg.graph.nodes[f"limit_{data['turn_number']}"].get("amount")
+            row = {"session": kg.session_id, "table": "turns", "turn": data["turn_number"], "limit": limit,
+                   "timestamp": data["timestamp"].timestamp()}
+        elif node_type == "Offer":
+            details = data["details"]
+            row = {"session": kg.session_id, "table": "offers", "turn": data["turn_number"], "party": data["offered_by"],
+                   "status": data["status"], "base": details.get("base"), "bonus": details.get("bonus"),
+                   "perks": [perk.lower() for perk in details.get("perks", [])]}
+        else:
+            continue
+        f.write(json.dumps(row) + "\n")
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def check(directory: str, expected):
+    tables, dictionaries = read_export(directory)
+    sessions, offers = tables["sessions"], tables["offers"]
+    assert sessions["session_id"] == [session_id for session_id, _, _, _ in expected]
+    assert list(sessions["turn_count"]) == [turns for _, turns, _, _ in expected]
+    assert len(tables["turns"]["limit"]) == sum(sessions["turn_count"])
+    agent, accepted = dictionaries["party"].index("agent"), dictionaries["status"].index("accepted")
+    perk_ends, _ = offers["perks"]
+    assert len(perk_ends) == len(offers["base"])
+
+    # Opening anchor and accepted base per session, straight from the columns
+    openings, deals = [], []
+    for session, first in enumerate(sessions["first_offer"]):
+        end = sessions["first_offer"][session + 1] if session + 1 < len(sessions["first_offer"]) else len(offers["base"])
+        parties, statuses, bases = offers["party"][first:end], offers["status"][first:end], offers["base"][first:end]
+        openings.append(bases[list(parties).index(agent)])
+        deals.append(next((base for party, status, base in zip(parties, statuses, bases)
+                           if party == agent and status == accepted), None))
+    assert openings == [opening for _, _, opening, _ in expected]
+    assert deals == [deal for _, _, _, deal in expected]
+    assert list(sessions["concluded"]) == [deal is not None for _, _, _, deal in expected]
+    closed = [deal for deal in deals if deal is not None]
+    return sum(openings) / len(openings), sum(closed) / len(closed), len(closed)
+
+
+def main(total: int, chunk: int):
+    print(f"{total} sessions, exported {chunk} at a time")
+    print(f"{'backend':>9} {'export':>9} {'s':>6} {'sessions/s':>11} {'MB':>6} {'read s':>7}")
+    for backend in ("networkx", "compact"):
+        directory = tempfile.mkdtemp(prefix="offer_export_")
+        rows_path = os.path.join(directory, "rows.jsonl")
+        columnar = os.path.join(directory, "columns")
+        export = OfferExport(columnar, flush_every=chunk)
+        rng = random.Random(7)
+        expected = []
+        timings = {"columnar": 0.0, "json rows": 0.0}
+        with open(rows_path, "w") as rows_file:
+            for start in range(0, total, chunk):
+                kgs = []
+                for index in range(start, min(total, start + chunk)):
+                    kg = make_knowledge_graph(f"session-{index}", backend=backend)
+                    opening, deal = negotiate(kg, rng)
+                    expected.append((kg.session_id, kg.turn_count, opening, deal))
+                    kgs.append(kg)
+                started = time.perf_counter()
+                for kg in kgs:
+                    export.add(kg)
+                export.flush()
+                timings["columnar"] += time.perf_counter() - started
+                if backend == "networkx":
+                    started = time.perf_counter()
+                    for kg in kgs:
+                        json_rows(kg, rows_file)
+                    rows_file.flush()
+                    timings["json rows"] += time.perf_counter() - started
+        sizes = {"columnar": directory_size(columnar), "json rows": os.path.getsize(rows_path)}
+        reads = {}
+        started = time.perf_counter()
+        read_export(columnar)
+        reads["columnar"] = time.perf_counter() - started
+        started = time.perf_counter()
+        with open(rows_path) as rows_file:
+            [json.loads(line) for line in rows_file]
+        reads["json rows"] = time.perf_counter() - started
+        for name, seconds in timings.items():
+            if backend == "networkx" or name == "columnar":
+                print(f"{backend:>9} {name:>9} {seconds:>6.2f} {total / seconds:>11,.0f} {sizes[name] / 1e6:>6.1f} {reads[name]:>7.2f}")
+
+        opening, deal, closed = check(columnar, expected)
+        # An interrupted flush: half a batch on disk, no manifest update; reopening drops it
+        with open(os.path.join(columnar, "offers.base.bin"), "ab") as f:
+            f.write(b"\0" * 12)
+        reopened = OfferExport(columnar)
+        assert reopened.rows == export.rows
+        reopened.add(make_knowledge_graph("session-extra", backend=backend))
+        reopened.flush()
+        assert read_export(columnar)[0]["sessions"]["session_id"][-1] == "session-extra"
+        print(f"{'':>9} {'':>9} check ok: {closed} deals, mean opening ${opening:,.0f}, mean accepted ${deal:,.0f}")
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 100_000,
+         int(args[1]) if len(args) > 1 else 5_000)
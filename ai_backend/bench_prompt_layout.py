@@ -0,0 +1,74 @@
+# Benchmark: prompt assembly cost and cacheable prefix per layout
+#
+#   python bench_prompt_layout.py
+#
+# Renders a mid-negotiation prompt with the original PromptTemplate and with both
+# PromptLayout modes, and reports how many leading tokens stay identical between two
+# different turns of two different sessions (what a provider prefix cache can reuse).
+
+import gc
+import os
+import time
+import warnings
+
+os.environ.setdefault("OPENAI_API_KEY1", "bench-placeholder")
+warnings.filterwarnings("ignore")
+
+from langchain_core.prompts import PromptTemplate
+
+from conversation_history import approx_tokens
+from negotiation_bot_kg import build_prompt_layout, negotiation_template
+
+REPEAT = 5000
+TURN_A = {
+    "history": "Candidate: I'm looking for $140,000 with remote work.\nEmployer: We can offer $112,250 with stock options.",
+    "subjective_limit": 115_000,
+    "kg_context": "Candidate Preferences: remote work. Last Agent Offer (Turn 1): {\"base\": 112250}.",
+    "message": "Could you do $135,000 and stock options?",
+}
+TURN_B = {
+    "history": "Candidate: What about relocation assistance?\nEmployer: We can include a relocation bonus.",
+    "subjective_limit": 124_200,
+    "kg_context": "Candidate Preferences: relocation. Recently Rejected Agent Offers: [{\"base\": 118000}].",
+    "message": "How about $130,000 with a $10,000 signing bonus?",
+}
+
+
+def as_text(rendered) -> str:
+    if isinstance(rendered, str):
+        return rendered
+    return "\n".join(message.content for message in rendered)
+
+
+def shared_prefix_tokens(a: str, b: str) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return approx_tokens(a[:n])
+
+
+def time_render(render) -> float:
+    gc.collect()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        render(TURN_A)
+    return (time.perf_counter() - start) / REPEAT * 1e6
+
+
+def main():
+    prompt = PromptTemplate.from_template(negotiation_template)
+    renderers = {
+        "PromptTemplate": lambda inputs: prompt.format(**inputs),
+        "legacy": build_prompt_layout("legacy").render,
+        "static_prefix": build_prompt_layout("static_prefix").render,
+    }
+    print(f"{'assembly':>15} {'tokens':>7} {'shared prefix':>14} {'render us':>10}")
+    for name, render in renderers.items():
+        a, b = as_text(render(TURN_A)), as_text(render(TURN_B))
+        print(f"{name:>15} {approx_tokens(a):>7} {shared_prefix_tokens(a, b):>14} {time_render(render):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Benchmark: model calls and latency saved by the response cache on recurring openings
+#
+#   python bench_response_cache.py [sessions] [latency_seconds]
+#
+# Every session plays the same first two candidate messages (with small differences in
+# case and punctuation) against a FakeConversation, once without and once with a
+# ResponseCache, and reports model calls, hit rate and wall time.
+
+import logging
+import os
+import sys
+import time
+import warnings
+
+os.environ.setdefault("OPENAI_API_KEY1", "bench-placeholder")
+warnings.filterwarnings("ignore")
+
+import negotiation_session
+from fake_llm import FakeConversation
+from negotiation_session import NegotiationSessionState
+from response_cache import ResponseCache
+
+OPENINGS = (
+    ("Hi, I'm looking for $140,000 with remote work.", "hi i'm looking for $140,000 with remote work"),
+    ("That's too low. Could you do $135,000?", "That's too low - could you do $135,000 ?"),
+)
+
+
+def run(sessions: int, latency: float, cache):
+    fake = negotiation_session.conversation = FakeConversation(latency)
+    negotiation_session.response_cache = cache
+    start = time.perf_counter()
+    for s in range(sessions):
+        state = NegotiationSessionState(f"cache-{s}")
+        for variants in OPENINGS:
+            state.get_agent_reply(variants[s % len(variants)])
+    return fake.calls, time.perf_counter() - start
+
+
+def main(sessions: int, latency: float):
+    logging.disable(logging.CRITICAL)
+    print(f"{sessions} sessions x {len(OPENINGS)} opening turns, model latency {latency * 1000:.0f} ms")
+    calls, elapsed = run(sessions, latency, None)
+    print(f"no cache:   {calls:>5} model calls {elapsed:>7.2f} s")
+    cache = ResponseCache(max_entries=1024, ttl=3600, variations=3)
+    calls, elapsed = run(sessions, latency, cache)
+    stats = cache.stats()
+    print(f"with cache: {calls:>5} model calls {elapsed:>7.2f} s  hit rate {stats['hit_rate']:.1%}, "
+          f"{stats['llm_seconds_saved']:.2f} s of model time saved, {stats['entries']} entries")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 200,
+         float(args[1]) if len(args) > 1 else 0.02)
@@ -0,0 +1,121 @@
+# Benchmark: turn throughput with N worker processes sharing one SQLite session backend
+#
+#   python bench_session_backend.py [sessions] [rounds] [latency_seconds]
+#
+# Each worker process runs its own SessionStore over the same SQLite file and pulls turns
+# from a shared queue, like workers behind a load balancer: a session's consecutive turns
+# usually land on different processes. Turn r of every session is queued only after turn
+# r-1 of every session finished. The model is a FakeConversation with a fixed latency.
+# A contention phase then sends overlapping turns for a few sessions to every worker at
+# once and checks that optimistic versioning loses none of them.
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+os.environ.setdefault("OPENAI_API_KEY1", "bench-placeholder")
+warnings.filterwarnings("ignore")
+
+import negotiation_session
+from fake_llm import FakeConversation
+from session_backend import SQLiteSessionBackend
+from session_store import SessionStore
+
+MESSAGES = (
+    "I'm looking for $140,000 with remote work.",
+    "Could you do $135,000 and stock options?",
+    "What about relocation assistance? I could go to $132,000.",
+    "How about $130,000 with a $10,000 signing bonus?",
+)
+WORKER_COUNTS = (1, 2, 4, 8)
+
+
+def worker(db_path: str, latency: float, tasks, results):
+    negotiation_session.conversation = FakeConversation(latency)
+    store = SessionStore(backend=SQLiteSessionBackend(db_path), spill_dir=tempfile.mkdtemp(prefix="bench_spill_"))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        session_id, message = task
+        store.run_turn(session_id, lambda state: state.get_agent_reply(message), retries=20)
+        results.put(1)
+    results.put(store.stats()["version_conflicts"])
+
+
+def start_workers(count: int, db_path: str, latency: float):
+    tasks, results = multiprocessing.Queue(), multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(db_path, latency, tasks, results), daemon=True) for _ in range(count)]
+    for p in processes:
+        p.start()
+    return processes, tasks, results
+
+
+def stop_workers(processes, tasks, results) -> int:
+    for _ in processes:
+        tasks.put(None)
+    conflicts = sum(results.get() for _ in processes)
+    for p in processes:
+        p.join()
+    return conflicts
+
+
+def run(workers: int, sessions: int, rounds: int, latency: float) -> float:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench_backend_"), "sessions.db")
+    SQLiteSessionBackend(db_path)
+    processes, tasks, results = start_workers(workers, db_path, latency)
+    start = time.perf_counter()
+    for r in range(rounds):
+        for s in range(sessions):
+            tasks.put((f"session-{s}", MESSAGES[r % len(MESSAGES)]))
+        for _ in range(sessions):
+            results.get()
+    elapsed = time.perf_counter() - start
+    stop_workers(processes, tasks, results)
+
+    backend = SQLiteSessionBackend(db_path)
+    for s in range(sessions):
+        version, state = backend.load(f"session-{s}")
+        assert state.current_turn == state.kg.turn_count == rounds, (s, state.current_turn)
+    return elapsed
+
+
+def contention(workers: int, sessions: int, turns_per_session: int, latency: float):
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench_backend_"), "sessions.db")
+    SQLiteSessionBackend(db_path)
+    processes, tasks, results = start_workers(workers, db_path, latency)
+    for t in range(turns_per_session):
+        for s in range(sessions):
+            tasks.put((f"hot-{s}", MESSAGES[t % len(MESSAGES)]))
+    for _ in range(sessions * turns_per_session):
+        results.get()
+    conflicts = stop_workers(processes, tasks, results)
+
+    backend = SQLiteSessionBackend(db_path)
+    for s in range(sessions):
+        _, state = backend.load(f"hot-{s}")
+        assert state.current_turn == turns_per_session, (s, state.current_turn)
+    print(f"contention: {workers} workers x {sessions} sessions x {turns_per_session} overlapping turns, "
+          f"{conflicts} version conflicts retried, no turns lost")
+
+
+def main(sessions: int, rounds: int, latency: float):
+    turns = sessions * rounds
+    print(f"{sessions} sessions x {rounds} turns, model latency {latency * 1000:.0f} ms")
+    print(f"{'workers':>7} {'seconds':>8} {'turns/s':>8} {'scaling':>8}")
+    baseline = None
+    for workers in WORKER_COUNTS:
+        elapsed = run(workers, sessions, rounds, latency)
+        baseline = baseline or elapsed
+        print(f"{workers:>7} {elapsed:>8.2f} {turns / elapsed:>8.1f} {baseline / elapsed:>7.1f}x")
+    contention(max(WORKER_COUNTS), 4, 12, latency)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 64,
+         int(args[1]) if len(args) > 1 else 4,
+         float(args[2]) if len(args) > 2 else 0.05)
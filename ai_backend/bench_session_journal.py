@@ -0,0 +1,110 @@
+# Benchmark: session journal overhead per turn and restore time after a restart
+#
+#   python bench_session_journal.py [sessions]
+#
+# Turns run through NegotiationSessionState.get_agent_reply with a zero-latency FakeConversation
+# in place of the LLM, so the numbers are local work only. Journal overhead is measured
+# with 1..32 concurrent request threads to show fsyncs being shared by group commit.
+# Restore replays a journal of `sessions` sessions (half folded into snapshots, half
+# still in WAL segments) into a fresh SessionJournal.
+
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("OPENAI_API_KEY1", "bench-placeholder")
+
+import negotiation_session
+from fake_llm import FakeConversation
+from negotiation_session import NegotiationSessionState
+from session_journal import SessionJournal
+
+TURNS = 6
+CANDIDATE_MESSAGES = (
+    "Hi, I'd like to talk about the role. I'm looking for $140,000 with remote work.",
+    "That's a bit low. Could you do $135,000 and stock options?",
+    "What about relocation assistance? I could go to $132,000.",
+    "How about $130,000 with a $10,000 signing bonus?",
+    "I'd settle for $127,000 if remote work is included.",
+    "Deal, I accept.",
+)
+
+
+def play_session(session_id: str, journal):
+    state = NegotiationSessionState(session_id, journal=journal)
+    for message in CANDIDATE_MESSAGES[:TURNS]:
+        state.get_agent_reply(message)
+    return state
+
+
+def time_turns(threads: int, sessions_per_thread: int, journal) -> float:
+    def worker(worker_id):
+        for i in range(sessions_per_thread):
+            play_session(f"bench-{threads}-{worker_id}-{i}", journal)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    gc.collect()
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return (time.perf_counter() - start) / (threads * sessions_per_thread * TURNS) * 1e6
+
+
+def bench_overhead(directory: str):
+    print(f"{'threads':>7} {'no journal us/turn':>19} {'journal us/turn':>16} {'records/fsync':>14}")
+    for threads in (1, 4, 16, 32):
+        sessions_per_thread = max(1, 64 // threads)
+        plain = time_turns(threads, sessions_per_thread, None)
+        journal = SessionJournal(os.path.join(directory, f"overhead-{threads}"), compact_interval=None)
+        journaled = time_turns(threads, sessions_per_thread, journal)
+        stats = journal.stats()
+        journal.close()
+        print(f"{threads:>7} {plain:>19.1f} {journaled:>16.1f} {stats['records_per_fsync']:>14.1f}")
+
+
+def bench_restore(directory: str, sessions: int):
+    path = os.path.join(directory, "restore")
+    journal = SessionJournal(path, compact_interval=None, fsync=False)
+    expected = {}
+    for i in range(sessions):
+        state = play_session(f"restore-{i}", journal)
+        expected[state.session_id] = (state.current_turn, state.kg.graph.number_of_nodes(), state.subjective_limit)
+        if i == sessions // 2:
+            journal.compact()
+    journal.close()
+    wal_bytes = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path) if name.endswith(".log"))
+
+    gc.collect()
+    start = time.perf_counter()
+    restored = SessionJournal(path, compact_interval=None)
+    restored.recover()
+    recover_s = time.perf_counter() - start
+    for session_id, (turn, nodes, limit) in expected.items():
+        state = restored.load(session_id)
+        assert (state.current_turn, state.kg.graph.number_of_nodes(), state.subjective_limit) == (turn, nodes, limit), session_id
+    total_s = time.perf_counter() - start
+    restored.close()
+
+    print(f"restore: {sessions} sessions, {wal_bytes / 1024:.0f} KiB of WAL after the last snapshot")
+    print(f"  recover() {recover_s * 1000:8.1f} ms   + materializing every session {total_s * 1000:8.1f} ms "
+          f"({(total_s - recover_s) / sessions * 1e6:.0f} us/session)")
+
+
+def main(sessions: int):
+    negotiation_session.conversation = FakeConversation(latency=0)
+    directory = tempfile.mkdtemp(prefix="bench_session_journal_")
+    try:
+        bench_overhead(directory)
+        bench_restore(directory, sessions)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,41 @@
+# Benchmark: worker cold start
+#
+#   python bench_startup.py [runs]
+#
+# Times, in fresh interpreters, importing each API module (what a worker does before it
+# can accept connections) and the explicit conversation warmup that follows in the
+# background (OpenAI client and LangChain chain), after which /ready turns 200.
+
+import os
+import subprocess
+import sys
+
+PROBE = """
+import time, warnings
+warnings.filterwarnings("ignore")
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+from negotiation_bot_kg import conversation
+assert conversation.warmup(), conversation.error
+print(imported - start, time.perf_counter() - imported)
+"""
+MODULES = ("ai_negotiator_api_cors", "ai_negotiator_asgi", "negotiation_session")
+
+
+def probe(module: str):
+    env = {**os.environ, "OPENAI_API_KEY1": os.environ.get("OPENAI_API_KEY1", "bench-placeholder")}
+    out = subprocess.run([sys.executable, "-c", PROBE.format(module=module)], env=env, check=True,
+                         capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return [float(x) for x in out.stdout.split()]
+
+
+def main(runs: int):
+    print(f"{'module':>24} {'import s':>9} {'warmup s':>9}  (best of {runs})")
+    for module in MODULES:
+        samples = [probe(module) for _ in range(runs)]
+        print(f"{module:>24} {min(s[0] for s in samples):>9.3f} {min(s[1] for s in samples):>9.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
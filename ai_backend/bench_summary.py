@@ -0,0 +1,78 @@
+# Benchmark: polling the negotiation summary after every turn, full rebuild vs incremental
+#
+#   python bench_summary.py [max_turns]
+#
+# The full rebuild is the node scan and string concatenation get_negotiation_summary used
+# before the summary cache; its cost per poll grows with the session (quadratic over the
+# session), while the cached summary renders only the turns that changed.
+
+import json
+import sys
+import time
+
+from negotiation_kg import NegotiationKnowledgeGraph
+
+CHECKPOINTS = (10, 50, 100, 250, 500, 1000)
+REPEAT = 20
+
+
+def rebuild_summary(kg: NegotiationKnowledgeGraph) -> str:
+    summary = f"Negotiation Summary (Session: {kg.session_id}, Turns: {kg.turn_count}):\n"
+    prefs = kg.get_candidate_preferences()
+    if prefs:
+        summary += f"Candidate Preferences: {', '.join(prefs)}\n"
+    turns = sorted([(data["turn_number"], node_id) for node_id, data in kg.graph.nodes(data=True)
+                    if data.get("type") == "Turn"], key=lambda x: x[0])
+    for turn_num, turn_node_id in turns:
+        turn_data = kg.graph.nodes[turn_node_id]
+        summary += f"\nTurn {turn_num}:\n"
+        summary += f"  Candidate: {turn_data.get('candidate_message', 'N/A')}\n"
+        summary += f"  Agent: {turn_data.get('agent_response', 'N/A')}\n"
+        limit = kg.graph.nodes[f"limit_{turn_num}"].get("amount", "N/A")
+        summary += f"  Agent Limit for this turn: ${limit}\n"
+        offers_in_turn = []
+        for neighbor in kg.graph.successors(turn_node_id):
+            if kg.graph.get_edge_data(turn_node_id, neighbor).get("type") == "CONTAINS_OFFER":
+                data = kg.graph.nodes[neighbor]
+                offers_in_turn.append(f"  {data['offered_by'].capitalize()} Offer ({data['status']}): {json.dumps(data['details'])}")
+        if offers_in_turn:
+            summary += "\n".join(offers_in_turn) + "\n"
+    return summary
+
+
+def play_turn(kg: NegotiationKnowledgeGraph, last_agent_offer):
+    turn = kg.add_turn("Could you do $135,000 and stock options? I'd also like remote work.",
+                       "We can offer a base salary of $118,000 with stock options.", 115_000 + kg.turn_count)
+    kg.add_offer(turn, {"base": 140_000 - turn, "perks": ["remote work"]}, "candidate")
+    if last_agent_offer:
+        kg.update_offer_status(last_agent_offer, "rejected")
+    return kg.add_offer(turn, {"base": 112_000 + turn, "perks": ["stock options"]}, "agent")
+
+
+def time_poll(fn, kg: NegotiationKnowledgeGraph) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn(kg)
+    return (time.perf_counter() - start) / REPEAT * 1e6
+
+
+def main(max_turns: int):
+    kg = NegotiationKnowledgeGraph("bench_session")
+    last_agent_offer = None
+    # A poller that has been watching since the first turn, as /negotiation_summary keeps it
+    poll = lambda kg: kg.negotiation_summary().text()
+    print(f"{'turns':>6} {'rebuild us/poll':>16} {'incremental us/poll':>20} {'json us/poll':>13} {'speedup':>8}")
+    for turn in range(1, max_turns + 1):
+        last_agent_offer = play_turn(kg, last_agent_offer)
+        kg.negotiation_summary()
+        if turn in CHECKPOINTS:
+            assert poll(kg) == rebuild_summary(kg)
+            rebuild = time_poll(rebuild_summary, kg)
+            # One turn's changes since the last poll, as a poller sees between turns
+            incremental = time_poll(lambda kg: (kg._dirty_summary(kg.turn_count), poll(kg)), kg)
+            as_json = time_poll(lambda kg: "".join(kg.negotiation_summary().iter_json()), kg)
+            print(f"{turn:>6} {rebuild:>16.1f} {incremental:>20.1f} {as_json:>13.1f} {rebuild / incremental:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else max(CHECKPOINTS))
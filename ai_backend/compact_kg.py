@@ -0,0 +1,241 @@
+# compact_kg.py
+# Slotted, array-backed negotiation KG with the same API as NegotiationKnowledgeGraph
+
+import datetime
+from array import array
+from typing import Optional, Tuple, List, Dict, Any, Iterator, Sequence
+
+from negotiation_kg import KnowledgeGraphBase
+from negotiation_summary import summary_turn
+
+# Parties with a per-turn offer column; offers by anyone else go to a side dict
+PARTIES = ("candidate", "agent")
+NO_OFFER = -1
+# Stored in the limit column when a turn's limit isn't an int; the value is kept in _odd_limits
+NO_LIMIT = -(2 ** 63)
+
+class OfferRecord:
+    __slots__ = ("turn_number", "offered_by", "details", "status", "key")
+
+    def __init__(self, turn_number: int, offered_by: str, details: Dict[str, Any], status: str):
+        self.turn_number = turn_number
+        self.offered_by = offered_by
+        self.details = details
+        self.status = status
+        # Key in the offer indexes, or None for offers whose details aren't a dict
+        self.key: Optional[Tuple[int, int, int]] = None
+
+    def __getstate__(self):
+        return (self.turn_number, self.offered_by, self.details, self.status, self.key)
+
+    def __setstate__(self, state):
+        self.turn_number, self.offered_by, self.details, self.status, self.key = state
+
+
+class CompactNegotiationKnowledgeGraph(KnowledgeGraphBase):
+    """
+    Same public API and offer ids ("offer_<turn>_<party>") as NegotiationKnowledgeGraph,
+    without the graph: turns are columns indexed by turn number - 1, offers are slotted
+    records addressed by integer position, and similarity links are adjacency lists of
+    those positions. Meant for holding many concurrent sessions in one process.
+    """
+
+    def __init__(self, session_id: str, candidate_id: str = "candidate"):
+        self.session_id = session_id
+        self.candidate_id = candidate_id
+        self.start_time = datetime.datetime.now()
+        self._init_indexes()
+        self._candidate_messages: List[str] = []
+        self._agent_responses: List[str] = []
+        self._timestamps = array("d")
+        self._limits = array("q")
+        self._odd_limits: Dict[int, Any] = {}
+        self._offers: List[OfferRecord] = []
+        # party -> offer position per turn (NO_OFFER when the party made none that turn)
+        self._turn_offers: Dict[str, array] = {party: array("l") for party in PARTIES}
+        self._other_offers: Dict[Tuple[int, str], int] = {}
+        # normalized perk key -> perk name as first given, in insertion order
+        self._preferences: Dict[str, str] = {}
+        self._similar: Dict[int, List[int]] = {}
+
+    def _indexed_offers(self) -> Iterator[Tuple[Tuple[int, int, int], str, str]]:
+        for record in self._offers:
+            if record.key is not None:
+                yield record.key, record.offered_by, record.status
+
+    def _offer_entry(self, key: Tuple[int, int, int]) -> Tuple[int, Dict[str, Any], str]:
+        turn_number, _, position = key
+        record = self._offers[position]
+        return (turn_number, record.details, f"offer_{turn_number}_{record.offered_by}")
+
+    def _offer_at(self, turn_number: int, offered_by: str) -> Optional[int]:
+        column = self._turn_offers.get(offered_by)
+        if column is None:
+            return self._other_offers.get((turn_number, offered_by))
+        if not 1 <= turn_number <= self.turn_count:
+            return None
+        position = column[turn_number - 1]
+        return None if position == NO_OFFER else position
+
+    def _offer_position(self, offer_id: str) -> Optional[int]:
+        if not isinstance(offer_id, str) or not offer_id.startswith("offer_"):
+            return None
+        turn_text, _, offered_by = offer_id[len("offer_"):].partition("_")
+        try:
+            turn_number = int(turn_text)
+        except ValueError:
+            return None
+        return self._offer_at(turn_number, offered_by)
+
+    def _has_turn(self, turn_number: int) -> bool:
+        return isinstance(turn_number, int) and 1 <= turn_number <= self.turn_count
+
+    def add_turn(self, candidate_message: str, agent_response: str, current_subjective_limit: int, timestamp: Optional[datetime.datetime] = None) -> int:
+        timestamp = timestamp or datetime.datetime.now()
+        self._record("add_turn", candidate_message, agent_response, current_subjective_limit, timestamp.isoformat())
+        self.turn_count += 1
+        self._candidate_messages.append(candidate_message)
+        self._agent_responses.append(agent_response)
+        self._timestamps.append(timestamp.timestamp())
+        if isinstance(current_subjective_limit, int) and NO_LIMIT < current_subjective_limit < 2 ** 63:
+            self._limits.append(current_subjective_limit)
+        else:
+            self._limits.append(NO_LIMIT)
+            self._odd_limits[self.turn_count] = current_subjective_limit
+        for column in self._turn_offers.values():
+            column.append(NO_OFFER)
+        self._touch()
+        return self.turn_count
+
+    def add_offer(self, turn_number: int, offer_details: Dict[str, Any], offered_by: str, status: str = "proposed") -> Optional[str]:
+        if not self._has_turn(turn_number):
+            print(f"Warning: Turn node turn_{turn_number} not found for adding offer.")
+            return None
+        self._record("add_offer", turn_number, offer_details, offered_by, status)
+
+        previous_status = None
+        position = self._offer_at(turn_number, offered_by)
+        if position is None:
+            position = len(self._offers)
+            self._offers.append(OfferRecord(turn_number, offered_by, offer_details, status))
+            if offered_by in self._turn_offers:
+                self._turn_offers[offered_by][turn_number - 1] = position
+            else:
+                self._other_offers[(turn_number, offered_by)] = position
+            record = self._offers[position]
+        else:
+            # Re-offering in the same turn replaces the offer in place, as the graph backend does
+            record = self._offers[position]
+            if record.key is not None:
+                previous_status = record.status
+                self._unindex_offer(record.key, record.offered_by, previous_status)
+                record.key = None
+            record.details = offer_details
+            record.status = status
+
+        if isinstance(offer_details, dict):
+            self._offer_seq += 1
+            record.key = (turn_number, -self._offer_seq, position)
+            self._index_offer(record.key, offered_by, status)
+
+        self._touch(*self._offer_sections(offered_by, status, previous_status))
+        self._dirty_summary(turn_number)
+        return f"offer_{turn_number}_{offered_by}"
+
+    def update_offer_status(self, offer_node_id: str, status: str):
+        position = self._offer_position(offer_node_id)
+        if position is None:
+            print(f"Warning: Offer node {offer_node_id} not found for status update.")
+            return
+        self._record("update_offer_status", offer_node_id, status)
+        record = self._offers[position]
+        previous_status = record.status
+        if record.key is not None and previous_status != status:
+            self._unindex_offer(record.key, record.offered_by, previous_status, by_party=False)
+            self._index_offer(record.key, record.offered_by, status, by_party=False)
+        record.status = status
+        self._dirty_summary(record.turn_number)
+        if previous_status != status:
+            # The candidate-offer context doesn't show status, so only agent offers dirty a section
+            agent_offer = record.offered_by == "agent"
+            self._touch(*(self._offer_sections("agent", status, previous_status) if agent_offer else ()))
+
+    def add_candidate_preference(self, perk_name: str):
+        perk_key = perk_name.lower().replace(" ", "_")
+        if perk_key in self._preferences:
+            return
+        self._record("add_candidate_preference", perk_name)
+        self._preferences[perk_key] = perk_name
+        self._touch("preferences")
+
+    def set_agent_response(self, turn_number: int, agent_response: str):
+        if not self._has_turn(turn_number):
+            print(f"Warning: Turn node turn_{turn_number} not found for setting agent response.")
+            return
+        self._record("set_agent_response", turn_number, agent_response)
+        self._agent_responses[turn_number - 1] = agent_response
+        self._dirty_summary(turn_number)
+
+    def approx_memory_bytes(self) -> int:
+        # Per-turn/per-offer cost measured with tracemalloc in bench_kg_backends.py, including
+        # typical message lengths; for memory caps, like the graph backend's estimate
+        return 2_000 + 150 * self.turn_count + 560 * len(self._offers) + 100 * len(self._preferences)
+
+    def get_offer_status(self, offer_node_id: str) -> Optional[str]:
+        position = self._offer_position(offer_node_id)
+        return None if position is None else self._offers[position].status
+
+    def get_candidate_preferences(self) -> List[str]:
+        return list(self._preferences.values())
+
+    def get_turn_messages(self, turn_number: int) -> Optional[Tuple[str, str]]:
+        if not self._has_turn(turn_number):
+            return None
+        return self._candidate_messages[turn_number - 1], self._agent_responses[turn_number - 1]
+
+    def _limit(self, turn_number: int) -> Any:
+        amount = self._limits[turn_number - 1]
+        return self._odd_limits.get(turn_number) if amount == NO_LIMIT else amount
+
+    def get_current_limit(self) -> Optional[int]:
+        for turn_number in (self.turn_count, self.turn_count - 1):
+            if turn_number >= 1:
+                amount = self._limit(turn_number)
+                if isinstance(amount, int):
+                    return amount
+        return None
+
+    def export_rows(self) -> Tuple[Sequence[Any], Sequence[float], List[Tuple[int, str, str, Any]]]:
+        # The columns as they are, unless a limit isn't an int
+        limits: Sequence[Any] = self._limits
+        if self._odd_limits:
+            limits = [self._limit(turn_number) for turn_number in range(1, self.turn_count + 1)]
+        offers = [(record.turn_number, record.offered_by, record.status, record.details) for record in self._offers]
+        return limits, self._timestamps, offers
+
+    def _summary_turn(self, turn_number: int) -> Tuple[str, str]:
+        # Offers in the order they were first made, like the graph's successor order
+        positions = [column[turn_number - 1] for column in self._turn_offers.values() if column[turn_number - 1] != NO_OFFER]
+        positions += [position for (offer_turn, _), position in self._other_offers.items() if offer_turn == turn_number]
+        offers = [(self._offers[position].offered_by, self._offers[position].status, self._offers[position].details)
+                  for position in sorted(positions)]
+        return summary_turn(turn_number, self._candidate_messages[turn_number - 1], self._agent_responses[turn_number - 1],
+                            self._limit(turn_number), offers)
+
+    def add_similar_offer_relation(self, offer_node_id_1: str, offer_node_id_2: str):
+        position_1, position_2 = self._offer_position(offer_node_id_1), self._offer_position(offer_node_id_2)
+        if position_1 is None or position_2 is None:
+            print(f"Warning: One or both nodes ({offer_node_id_1}, {offer_node_id_2}) not found for adding similarity relation.")
+            return
+        # Avoid self-loops and duplicate links (in either direction)
+        if position_1 == position_2 or position_2 in self._similar.get(position_1, ()):
+            return
+        self._record("add_similar_offer_relation", offer_node_id_1, offer_node_id_2)
+        self._similar.setdefault(position_1, []).append(position_2)
+        self._similar.setdefault(position_2, []).append(position_1)
+
+    def get_similar_offers(self, offer_node_id: str) -> List[str]:
+        position = self._offer_position(offer_node_id)
+        if position is None:
+            return []
+        return [f"offer_{self._offers[other].turn_number}_{self._offers[other].offered_by}" for other in self._similar.get(position, ())]
@@ -0,0 +1,142 @@
+# conversation_history.py
+# Bounded per-session chat history for the {history} prompt slot, read from the session's KG
+
+import os
+import weakref
+from typing import TYPE_CHECKING, List, Optional, Sequence
+
+from negotiation_kg import NegotiationKnowledgeGraph
+
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+
+DEFAULT_MAX_TURNS = 4
+DEFAULT_MAX_TOKENS = 600
+
+
+def approx_tokens(text: str) -> int:
+    # ~4 characters per token for English text with OpenAI/Llama tokenizers; close enough
+    # for budgeting without loading a tokenizer
+    return (len(text) + 3) // 4
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars - 3].rstrip() + "..."
+
+
+def _describe_offer(details) -> str:
+    base = details.get("base")
+    return f"${base:,}" if isinstance(base, int) else "a package without a base figure"
+
+
+def kg_digest(kg: NegotiationKnowledgeGraph, up_to_turn: int) -> str:
+    """One-paragraph summary of turns 1..up_to_turn; its length does not grow with the turn count."""
+    parts = [f"Earlier turns 1-{up_to_turn} (summarized):"]
+    for party, label in (("candidate", "the candidate asked for"), ("agent", "you offered")):
+        count, first, last = kg.get_offer_span(party, up_to_turn)
+        if count == 1:
+            parts.append(f"{label} {_describe_offer(first[1])} (turn {first[0]});")
+        elif count > 1:
+            parts.append(f"{label} {_describe_offer(first[1])} at first (turn {first[0]}) and "
+                         f"{_describe_offer(last[1])} most recently (turn {last[0]}), {count} offers in all;")
+    if len(parts) == 1:
+        parts.append("no concrete offers were made;")
+    return " ".join(parts).rstrip(";") + "."
+
+
+class KGChatHistory:
+    """
+    The last `max_turns` turns verbatim, newest kept first when the `max_tokens` budget
+    runs out, preceded by a KG digest of everything older. Nothing is stored here: turns
+    are already on the KG (which is what gets spilled, journaled and shared between
+    workers), so add_messages is a no-op and memory per session does not grow with it.
+    Implements the part of LangChain's BaseChatMessageHistory that
+    RunnableWithMessageHistory calls, without importing LangChain until it is used.
+    """
+
+    def __init__(self, kg: Optional[NegotiationKnowledgeGraph], max_turns: int = DEFAULT_MAX_TURNS, max_tokens: int = DEFAULT_MAX_TOKENS):
+        self.kg = kg
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+
+    @property
+    def messages(self) -> List["BaseMessage"]:
+        from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+        kg = self.kg
+        if kg is None or kg.turn_count == 0:
+            return []
+        # The digest is a few dozen tokens; a single turn may use at most half of the rest
+        budget = self.max_tokens - 80
+        per_message = max(budget // 4, 16)
+        verbatim: List["BaseMessage"] = []
+        oldest = kg.turn_count + 1
+        for turn_number in range(kg.turn_count, max(kg.turn_count - self.max_turns, 0), -1):
+            turn = kg.get_turn_messages(turn_number)
+            if turn is None:
+                break
+            candidate, agent = _clip(turn[0], per_message), _clip(turn[1], per_message)
+            cost = approx_tokens(candidate) + approx_tokens(agent)
+            if cost > budget and verbatim:
+                break
+            budget -= cost
+            verbatim[:0] = [HumanMessage(content=candidate), AIMessage(content=agent)]
+            oldest = turn_number
+        if oldest > 1:
+            verbatim.insert(0, SystemMessage(content=kg_digest(kg, oldest - 1)))
+        return verbatim
+
+    async def aget_messages(self) -> List["BaseMessage"]:
+        # Cheap in-memory reads; no need for the default executor hop
+        return self.messages
+
+    def add_messages(self, messages: Sequence["BaseMessage"]) -> None:
+        # The turn reaches the KG through add_turn once the reply has been post-processed
+        pass
+
+    async def aadd_messages(self, messages: Sequence["BaseMessage"]) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+class HistoryStore:
+    """
+    session_id -> KG of the live session, for RunnableWithMessageHistory's
+    get_session_history. Entries are weak, so a session evicted from the SessionStore
+    drops out of here too; sessions bind their KG before each model call.
+    """
+
+    def __init__(self, max_turns: int = DEFAULT_MAX_TURNS, max_tokens: int = DEFAULT_MAX_TOKENS):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self._kgs: "weakref.WeakValueDictionary[str, NegotiationKnowledgeGraph]" = weakref.WeakValueDictionary()
+
+    @classmethod
+    def from_env(cls) -> "HistoryStore":
+        return cls(
+            max_turns=int(os.getenv("NEGOTIATION_HISTORY_TURNS", DEFAULT_MAX_TURNS)),
+            max_tokens=int(os.getenv("NEGOTIATION_HISTORY_TOKENS", DEFAULT_MAX_TOKENS)),
+        )
+
+    def bind(self, session_id: str, kg: NegotiationKnowledgeGraph):
+        self._kgs[session_id] = kg
+
+    def get(self, session_id: str) -> KGChatHistory:
+        return KGChatHistory(self._kgs.get(session_id), self.max_turns, self.max_tokens)
+
+    def __len__(self) -> int:
+        return len(self._kgs)
+
+
+def format_history(messages: Sequence["BaseMessage"]) -> str:
+    # The negotiation prompt is a plain string template, so render the messages as a transcript
+    from langchain_core.messages import get_buffer_string
+
+    if not messages:
+        return "(This is the first message of the negotiation.)"
+    return get_buffer_string(messages, human_prefix="Candidate", ai_prefix="Employer")
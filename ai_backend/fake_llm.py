@@ -0,0 +1,93 @@
+# fake_llm.py
+# Stand-in for the LangChain conversation with a configurable model latency, for offline benchmarks
+
+import asyncio
+import random
+import threading
+import time
+from typing import Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+# (weight, reply template, amount below the ceiling); the default always offers a little under it
+DEFAULT_REPLIES: Sequence[Tuple[float, str, int]] = (
+    (1.0, "We can offer a base salary of ${offer:,} with stock options.", 2_750),
+)
+
+
+class FakeConversation:
+    """
+    Mimics `conversation` from negotiation_bot_kg: invoke/ainvoke take the same inputs and
+    return an AIMessage after `latency` seconds (drawn from a normal distribution with
+    `latency_sd` when given, and `tail_latency` instead for a `tail_rate` share of calls). The reply is picked from `replies` by weight and offers
+    an amount relative to the current ceiling, so the KG post-processing runs as it
+    would on a real turn. stream/astream yield it word by word: the first chunk after
+    `first_token_latency` (a fifth of the latency by default) and the rest spread over
+    the remaining time.
+    """
+
+    def __init__(self, latency: float = 1.0, first_token_latency: Optional[float] = None,
+                 latency_sd: float = 0.0, replies: Sequence[Tuple[float, str, int]] = DEFAULT_REPLIES,
+                 seed: Optional[int] = None, tail_rate: float = 0.0, tail_latency: float = 0.0):
+        self.latency = latency
+        self.first_token_latency = first_token_latency
+        self.latency_sd = latency_sd
+        self.replies = replies
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _sample_latency(self) -> Tuple[float, str, int]:
+        with self._lock:
+            self.calls += 1
+            if self.tail_rate and self._random.random() < self.tail_rate:
+                latency = self.tail_latency
+            elif not self.latency_sd:
+                latency = self.latency
+            else:
+                latency = max(0.0, self._random.gauss(self.latency, self.latency_sd))
+            weights = [weight for weight, _, _ in self.replies]
+            _, template, below = self._random.choices(self.replies, weights)[0]
+        self._local.seconds = getattr(self._local, "seconds", 0.0) + latency
+        return latency, template, below
+
+    def take_thread_seconds(self) -> float:
+        """Model time spent by calls on the current thread since the last call to this."""
+        seconds, self._local.seconds = getattr(self._local, "seconds", 0.0), 0.0
+        return seconds
+
+    @staticmethod
+    def _reply(inputs, template: str, below: int) -> AIMessage:
+        limit = int(inputs.get("subjective_limit", 115_000))
+        return AIMessage(content=template.format(offer=limit - below))
+
+    def invoke(self, inputs, config=None):
+        latency, template, below = self._sample_latency()
+        time.sleep(latency)
+        return self._reply(inputs, template, below)
+
+    async def ainvoke(self, inputs, config=None):
+        latency, template, below = self._sample_latency()
+        await asyncio.sleep(latency)
+        return self._reply(inputs, template, below)
+
+    def _chunks(self, inputs):
+        latency, template, below = self._sample_latency()
+        first = latency / 5 if self.first_token_latency is None else self.first_token_latency
+        words = self._reply(inputs, template, below).content.split(" ")
+        interval = max(0.0, latency - first) / max(1, len(words) - 1)
+        for i, word in enumerate(words):
+            yield (first if i == 0 else interval), AIMessageChunk(content=word if i == 0 else " " + word)
+
+    def stream(self, inputs, config=None):
+        for delay, chunk in self._chunks(inputs):
+            time.sleep(delay)
+            yield chunk
+
+    async def astream(self, inputs, config=None):
+        for delay, chunk in self._chunks(inputs):
+            await asyncio.sleep(delay)
+            yield chunk
@@ -0,0 +1,135 @@
+# fast_path.py
+# Rule-based replies for turns the system prompt already decides mechanically, served without
+# a model call and recorded in the KG like any other reply
+
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+# A candidate message committing to a number in the first person: "I'll sign today for $125k",
+# "I'd take 125,000", "I'm ready to sign at $120k"
+_SIGN_NOW = re.compile(r"\bi(?:'ll| will|'d| would|'m ready to| am ready to) (?:sign|take)\b|\bready to sign\b")
+# Any negation sends the turn to the model: "No deal at $100k, I can't sign for that"
+_NEGATION = re.compile(r"\b(?:no|not|never|cannot|can'?t|won'?t|don'?t)\b|n't\b")
+# Longest message still treated as a bare restatement of the candidate's counter
+BARE_REPEAT_MAX_WORDS = 12
+
+# Replies quote a single amount, so scan_message reads the agent offer back unambiguously
+TEMPLATES = {
+    "sign_within_limit": "That works for us: a base salary of ${base:,}. I'll send over the formal offer letter for you to sign.",
+    "sign_over_limit": "I'm not able to go that high, but I can offer a base salary of ${base:,}, which is the strongest number I can put forward right now.",
+    "repeat_counter": "I hear you, and I want to make this work. I can move our offer to a base salary of ${base:,}.",
+}
+RULES = tuple(TEMPLATES)
+
+
+def _base_only(scan) -> Optional[int]:
+    # The base of an offer that names nothing but a base salary, and no preferences either.
+    # With two amounts ("I wanted $140k, but I'll sign for $128k") scan_message keeps the
+    # larger, which need not be the one committed to, so only a single amount qualifies.
+    base = scan.offer.get("base")
+    if isinstance(base, int) and scan.salary_amounts == 1 and len(scan.offer) == 1 and not scan.preferences:
+        return base
+    return None
+
+
+class FastPath:
+    """
+    Replies for three states, each rule on or off on its own:
+
+    - sign_within_limit: the candidate commits ("I'll sign", "I'd take") to a base at or under
+      the turn's limit ("accept if it's <= the limit", as the prompt has it); the reply agrees
+      to that base. A bare "ok" or "deal" is not a commitment to a new number.
+    - sign_over_limit: the same commitment above the limit; the reply counters with the limit.
+    - repeat_counter: a bare restatement of the candidate's previous counter, still above the
+      limit, while our standing offer is below it; the reply moves the offer up to the limit.
+
+    A message naming more than one salary amount is never served (the scan can't tell which
+    one is committed to), and neither is one with any negation ("no", "can't", "won't", ...): a rejection
+    read as a commitment would be agreed to and then closed by the next "ok". Neither counter
+    is served when the candidate already rejected an offer of (about) the limit with no perks;
+    that turn goes to the model.
+
+    The reply goes through finish_turn, so the KG, journal and session fields change exactly as
+    they would for a model reply. Model time saved is estimated from the mean model call so far.
+    """
+
+    def __init__(self, rules: Iterable[str] = RULES):
+        unknown = set(rules) - set(RULES)
+        if unknown:
+            raise ValueError(f"Unknown fast-path rules: {', '.join(sorted(unknown))}")
+        self.rules = frozenset(rules)
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._served = {rule: 0 for rule in RULES}
+        self._llm_calls = 0
+        self._llm_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> Optional["FastPath"]:
+        """NEGOTIATION_FAST_PATH=all, or a comma-separated list of rule names; unset leaves it off."""
+        setting = os.getenv("NEGOTIATION_FAST_PATH", "").strip().lower()
+        if setting in ("", "0", "off", "false", "no"):
+            return None
+        if setting in ("1", "on", "true", "yes", "all"):
+            return cls()
+        return cls(name.strip() for name in setting.split(",") if name.strip())
+
+    def _match(self, user_input: str, scan, limit: int, kg, last_agent_offer: Optional[Dict[str, Any]]):
+        base = _base_only(scan)
+        if base is None:
+            return None
+        text = user_input.lower().replace("\u2019", "'")
+        if _NEGATION.search(text):
+            return None
+        if _SIGN_NOW.search(text):
+            if base <= limit:
+                return "sign_within_limit", base
+            rule = "sign_over_limit"
+        else:
+            if "repeat_counter" not in self.rules:
+                return None
+            last_candidate = kg.get_last_offer_details("candidate")
+            agent_base = last_agent_offer.get("base") if last_agent_offer else None
+            if not (last_candidate is not None and last_candidate[1].get("base") == base and base > limit
+                    and isinstance(agent_base, int) and agent_base < limit
+                    and len(user_input.split()) <= BARE_REPEAT_MAX_WORDS):
+                return None
+            rule = "repeat_counter"
+        # Countering with (nearly) a number the candidate already turned down is what the prompt
+        # says to avoid; the model can rework the offer instead
+        if kg.find_similar_offer({"base": limit}, "rejected", "agent") is not None:
+            return None
+        return rule, limit
+
+    def reply(self, user_input: str, scan, limit: int, kg,
+              last_agent_offer: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """The templated reply for this turn, or None when no enabled rule applies."""
+        match = self._match(user_input, scan, limit, kg, last_agent_offer)
+        with self._lock:
+            self._checked += 1
+            if match is None or match[0] not in self.rules:
+                return None
+            self._served[match[0]] += 1
+        rule, base = match
+        return TEMPLATES[rule].format(base=base)
+
+    def record_llm_call(self, seconds: float):
+        with self._lock:
+            self._llm_calls += 1
+            self._llm_seconds += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            served = sum(self._served.values())
+            mean_llm = self._llm_seconds / self._llm_calls if self._llm_calls else None
+            return {
+                "rules": sorted(self.rules),
+                "turns_checked": self._checked,
+                "served": served,
+                "served_rate": round(served / self._checked, 4) if self._checked else None,
+                "by_rule": dict(self._served),
+                # Served turns times the mean model call of this process (None before the first call)
+                "llm_seconds_saved": round(served * mean_llm, 3) if mean_llm is not None else None,
+            }
@@ -0,0 +1,189 @@
+# llm_hedging.py
+# Hedged model calls: if the first call hasn't answered by an adaptive deadline, an identical
+# second call is sent and whichever answers first is used
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Latencies of recent calls that the deadline is computed from
+WINDOW = 200
+# Until this many calls have completed, the deadline is `initial_delay`
+MIN_SAMPLES = 20
+# The deadline is recomputed after this many new samples rather than on every call
+REFRESH_EVERY = 10
+
+
+class HedgeBudget:
+    """
+    Caps the extra load: every call deposits `ratio` tokens and every hedge spends one, the
+    same token bucket as llm_transport.RetryBudget. With ratio 0.1 at most ~10% of calls hedge,
+    even when the upstream slows down for everyone.
+    """
+
+    def __init__(self, ratio: float, burst: float = 5.0):
+        self.ratio = ratio
+        self.maximum = max(burst, 100 * ratio)
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.maximum, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class HedgedCalls:
+    """
+    Runs model calls with a hedge after the `percentile` latency of recent calls (clamped to
+    [min_delay, max_delay]). The first successful answer wins; if one attempt fails, the
+    other's answer is awaited. In the async path the losing call is cancelled; a blocking call
+    can't be interrupted, so in the sync path it finishes on a pool thread and is discarded.
+    """
+
+    def __init__(self, percentile: float = 0.95, initial_delay: float = 3.0, min_delay: float = 0.5,
+                 max_delay: float = 30.0, max_extra_ratio: float = 0.1, threads: int = 256):
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget = HedgeBudget(max_extra_ratio)
+        self.threads = threads
+        self._latencies: deque = deque(maxlen=WINDOW)
+        self._new_samples = 0
+        self._deadline = initial_delay
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.denied = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["HedgedCalls"]:
+        if os.getenv("NEGOTIATION_HEDGE", "").lower() not in ("1", "true", "yes", "on"):
+            return None
+        defaults = cls()
+        return cls(
+            percentile=float(os.getenv("NEGOTIATION_HEDGE_PERCENTILE", defaults.percentile)),
+            initial_delay=float(os.getenv("NEGOTIATION_HEDGE_INITIAL_DELAY", defaults.initial_delay)),
+            min_delay=float(os.getenv("NEGOTIATION_HEDGE_MIN_DELAY", defaults.min_delay)),
+            max_delay=float(os.getenv("NEGOTIATION_HEDGE_MAX_DELAY", defaults.max_delay)),
+            max_extra_ratio=float(os.getenv("NEGOTIATION_HEDGE_MAX_EXTRA", defaults.budget.ratio)),
+        )
+
+    def deadline(self) -> float:
+        with self._lock:
+            if len(self._latencies) >= MIN_SAMPLES and self._new_samples >= REFRESH_EVERY:
+                ordered = sorted(self._latencies)
+                observed = ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+                self._deadline = min(self.max_delay, max(self.min_delay, observed))
+                self._new_samples = 0
+            return self._deadline
+
+    def _record(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+            self._new_samples += 1
+
+    def _start(self) -> float:
+        self.budget.deposit()
+        with self._lock:
+            self.calls += 1
+        return self.deadline()
+
+    def _may_hedge(self) -> bool:
+        allowed = self.budget.withdraw()
+        with self._lock:
+            if allowed:
+                self.hedged += 1
+            else:
+                self.denied += 1
+        return allowed
+
+    def _timed(self, call: Callable[[], Any]) -> Callable[[], Any]:
+        def attempt():
+            started = time.perf_counter()
+            result = call()
+            self._record(time.perf_counter() - started)
+            return result
+        return attempt
+
+    def invoke(self, call: Callable[[], Any]) -> Any:
+        """call() in a pool thread, hedged by a second call() past the deadline."""
+        deadline = self._start()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="llm-hedge")
+        primary = self._executor.submit(self._timed(call))
+        done, _ = wait([primary], timeout=deadline)
+        if done or not self._may_hedge():
+            return primary.result()
+        backup = self._executor.submit(self._timed(call))
+        pending = {primary, backup}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # A success that landed together with a failure wins
+            for future in sorted(done, key=lambda f: f.exception() is not None):
+                if future.exception() is None or not pending:
+                    if future is backup and future.exception() is None:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    for loser in pending:
+                        loser.cancel()
+                    return future.result()
+
+    async def ainvoke(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Async counterpart of invoke; the losing call is cancelled."""
+        deadline = self._start()
+
+        async def attempt():
+            started = time.perf_counter()
+            result = await call()
+            self._record(time.perf_counter() - started)
+            return result
+
+        primary = asyncio.ensure_future(attempt())
+        backup = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=deadline)
+            if done or not self._may_hedge():
+                return await primary
+            backup = asyncio.ensure_future(attempt())
+            pending = {primary, backup}
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda t: t.exception() is not None):
+                    if task.exception() is None or not pending:
+                        if task is backup and task.exception() is None:
+                            with self._lock:
+                                self.hedge_wins += 1
+                        return task.result()
+        finally:
+            # The loser, or both if the caller itself was cancelled
+            for task in (primary, backup):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "hedge_rate": round(self.hedged / self.calls, 4) if self.calls else None,
+                # Of the hedged calls, how often the second call answered first
+                "hedge_wins": self.hedge_wins,
+                "win_rate": round(self.hedge_wins / self.hedged, 4) if self.hedged else None,
+                "denied_by_budget": self.denied,
+                "deadline_seconds": round(self._deadline, 3),
+            }
@@ -0,0 +1,245 @@
+# llm_transport.py
+# HTTP transport for the model client: explicit pool and keep-alive, connect/read timeouts,
+# and retries with jittered backoff under a shared retry budget
+
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+# Responses worth retrying: rate limited, or the upstream/proxy failed without an answer
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class TransportConfig:
+    def __init__(self,
+                 max_connections: int = 64,
+                 max_keepalive_connections: int = 32,
+                 keepalive_seconds: float = 90.0,
+                 connect_timeout: float = 5.0,
+                 read_timeout: float = 60.0,
+                 pool_timeout: float = 10.0,
+                 max_retries: int = 2,
+                 retry_budget_ratio: float = 0.1,
+                 backoff_base: float = 0.25,
+                 backoff_max: float = 4.0):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        # Idle connections stay open this long, so steady traffic doesn't redo TCP/TLS setup
+        self.keepalive_seconds = keepalive_seconds
+        self.connect_timeout = connect_timeout
+        # Longest gap between bytes of a response; a stalled upstream fails after this
+        self.read_timeout = read_timeout
+        # Longest wait for a free pooled connection
+        self.pool_timeout = pool_timeout
+        self.max_retries = max_retries
+        # Retries may add at most this fraction on top of first attempts (see RetryBudget)
+        self.retry_budget_ratio = retry_budget_ratio
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    @classmethod
+    def from_env(cls) -> "TransportConfig":
+        defaults = cls()
+        return cls(
+            max_connections=int(os.getenv("NEGOTIATION_LLM_POOL_SIZE", defaults.max_connections)),
+            max_keepalive_connections=int(os.getenv("NEGOTIATION_LLM_KEEPALIVE_CONNECTIONS", defaults.max_keepalive_connections)),
+            keepalive_seconds=float(os.getenv("NEGOTIATION_LLM_KEEPALIVE_SECONDS", defaults.keepalive_seconds)),
+            connect_timeout=float(os.getenv("NEGOTIATION_LLM_CONNECT_TIMEOUT", defaults.connect_timeout)),
+            read_timeout=float(os.getenv("NEGOTIATION_LLM_READ_TIMEOUT", defaults.read_timeout)),
+            pool_timeout=float(os.getenv("NEGOTIATION_LLM_POOL_TIMEOUT", defaults.pool_timeout)),
+            max_retries=int(os.getenv("NEGOTIATION_LLM_MAX_RETRIES", defaults.max_retries)),
+            retry_budget_ratio=float(os.getenv("NEGOTIATION_LLM_RETRY_BUDGET", defaults.retry_budget_ratio)),
+        )
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(connect=self.connect_timeout, read=self.read_timeout,
+                             write=self.read_timeout, pool=self.pool_timeout)
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_keepalive_connections,
+                            keepalive_expiry=self.keepalive_seconds)
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        # Full jitter: uniform in [0, base * 2^attempt], capped; a server's Retry-After wins if longer
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+
+class RetryBudget:
+    """
+    Token bucket shared by every request: each first attempt deposits `ratio` tokens and each
+    retry spends one, so when the upstream is failing, retries add at most `ratio` extra load
+    instead of multiplying it. `minimum` tokens let a quiet process still retry.
+    """
+
+    def __init__(self, ratio: float, minimum: float = 10.0):
+        self.ratio = ratio
+        self.maximum = max(minimum, 100 * ratio)
+        self._tokens = minimum
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.maximum, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class TransportStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.attempts = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.retries = 0
+        self.retries_denied = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def add(self, **counts: int):
+        with self._lock:
+            for name, amount in counts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def trace(self, event: str, info: Dict[str, Any]):
+        # httpcore trace hook: a new connection shows up as connect_tcp (and start_tls for https)
+        if event == "connection.connect_tcp.complete":
+            self.add(connections_opened=1)
+        elif event == "connection.start_tls.complete":
+            self.add(tls_handshakes=1)
+
+    async def atrace(self, event: str, info: Dict[str, Any]):
+        self.trace(event, info)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            attempts = self.attempts
+            return {
+                "requests": self.requests,
+                "attempts": attempts,
+                "connections_opened": self.connections_opened,
+                "tls_handshakes": self.tls_handshakes,
+                # Attempts served on an already-open connection
+                "connection_reuse_rate": round(1 - self.connections_opened / attempts, 4) if attempts else None,
+                "retries": self.retries,
+                "retries_denied_by_budget": self.retries_denied,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+            }
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+
+class _RetryPolicy:
+    # Shared by the sync and async transports: whether and how long to wait before a retry
+    def __init__(self, config: TransportConfig, budget: RetryBudget, stats: TransportStats):
+        self.config = config
+        self.budget = budget
+        self.stats = stats
+
+    def start(self):
+        self.budget.deposit()
+        self.stats.add(requests=1)
+
+    def retry_delay(self, attempt: int, response: Optional[httpx.Response] = None,
+                    error: Optional[Exception] = None) -> Optional[float]:
+        """Seconds to wait before another attempt, or None to give up (returning/raising this one)."""
+        if error is not None:
+            self.stats.add(timeouts=1 if isinstance(error, httpx.TimeoutException) else 0,
+                           errors=0 if isinstance(error, httpx.TimeoutException) else 1)
+        elif response.status_code not in RETRY_STATUSES:
+            return None
+        if attempt >= self.config.max_retries:
+            return None
+        if not self.budget.withdraw():
+            self.stats.add(retries_denied=1)
+            return None
+        self.stats.add(retries=1)
+        return self.config.backoff(attempt, _retry_after(response) if response is not None else None)
+
+
+class RetryingTransport(httpx.BaseTransport):
+    def __init__(self, config: TransportConfig, budget: RetryBudget, stats: TransportStats):
+        self.policy = _RetryPolicy(config, budget, stats)
+        self.stats = stats
+        self._transport = httpx.HTTPTransport(limits=config.limits())
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.policy.start()
+        request.extensions["trace"] = self.stats.trace
+        attempt = 0
+        while True:
+            self.stats.add(attempts=1)
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError as e:
+                delay = self.policy.retry_delay(attempt, error=e)
+                if delay is None:
+                    raise
+            else:
+                delay = self.policy.retry_delay(attempt, response=response)
+                if delay is None:
+                    return response
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncRetryingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, config: TransportConfig, budget: RetryBudget, stats: TransportStats):
+        self.policy = _RetryPolicy(config, budget, stats)
+        self.stats = stats
+        self._transport = httpx.AsyncHTTPTransport(limits=config.limits())
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.policy.start()
+        request.extensions["trace"] = self.stats.atrace
+        attempt = 0
+        while True:
+            self.stats.add(attempts=1)
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                delay = self.policy.retry_delay(attempt, error=e)
+                if delay is None:
+                    raise
+            else:
+                delay = self.policy.retry_delay(attempt, response=response)
+                if delay is None:
+                    return response
+                await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def build_http_clients(config: TransportConfig, stats: TransportStats):
+    """(httpx.Client, httpx.AsyncClient) sharing one retry budget and one set of counters."""
+    budget = RetryBudget(config.retry_budget_ratio)
+    timeout = config.timeout()
+    return (httpx.Client(transport=RetryingTransport(config, budget, stats), timeout=timeout),
+            httpx.AsyncClient(transport=AsyncRetryingTransport(config, budget, stats), timeout=timeout))
@@ -0,0 +1,219 @@
+# log_pipeline.py
+# Queue-based logging: request threads only enqueue records; a background thread writes them
+# as JSON lines (with size-based rotation, one flush per batch) and echoes them to the console.
+
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_LOG_FILE = "negotiation_api.jsonl"
+DEFAULT_MAX_BYTES = 16 * 2 ** 20
+DEFAULT_BACKUP_COUNT = 5
+# Records waiting for the writer; past this, records are dropped (and counted) rather than
+# making a request thread wait on the disk
+QUEUE_SIZE = 10_000
+BATCH_SIZE = 512
+
+# (session id, turn number) of the turn being handled in this thread/task
+_log_context: contextvars.ContextVar[Tuple[Optional[str], Optional[int]]] = contextvars.ContextVar(
+    "negotiation_log_context", default=(None, None))
+
+# LogRecord attributes that aren't `extra` fields
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "session_id", "turn"}
+
+
+def set_log_context(session_id: Optional[str], turn: Optional[int] = None) -> contextvars.Token:
+    """Tags records logged from here on in this thread/task; undo with reset_log_context."""
+    return _log_context.set((session_id, turn))
+
+
+def reset_log_context(token: contextvars.Token):
+    _log_context.reset(token)
+
+
+@contextmanager
+def log_context(session_id: Optional[str], turn: Optional[int] = None):
+    token = set_log_context(session_id, turn)
+    try:
+        yield
+    finally:
+        reset_log_context(token)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, session/turn and any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "session_id": getattr(record, "session_id", None),
+            "turn": getattr(record, "turn", None),
+        }
+        for name, value in record.__dict__.items():
+            if name not in _RECORD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class ContextQueueHandler(logging.Handler):
+    """
+    The handler request threads see. Stamps the record with the session/turn context (which
+    only the emitting thread knows), renders its message and exception text so the record
+    no longer references request objects, and enqueues it without blocking.
+    """
+
+    def __init__(self, records: "queue.SimpleQueue[Optional[logging.LogRecord]]", max_queued: int = QUEUE_SIZE):
+        super().__init__()
+        self.max_queued = max_queued
+        self.records = records
+        self.dropped = 0
+
+    def emit(self, record: logging.LogRecord):
+        if self.records.qsize() >= self.max_queued:
+            self.dropped += 1
+            return
+        try:
+            if not hasattr(record, "session_id"):
+                record.session_id, record.turn = _log_context.get()
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self.records.put(record)
+        except Exception:
+            self.handleError(record)
+
+
+class JsonLogWriter:
+    """
+    Owns the queue and its ContextQueueHandler (`handler`). A background thread drains the
+    queue: writes up to BATCH_SIZE records as JSON lines, flushes once, rotates the file past
+    `max_bytes` (keeping `backup_count` old files as path.1 .. path.N), and hands each record
+    to the console handlers.
+    """
+
+    def __init__(self, path: Optional[str], max_bytes: int = DEFAULT_MAX_BYTES,
+                 backup_count: int = DEFAULT_BACKUP_COUNT, handlers: Iterable[logging.Handler] = ()):
+        # SimpleQueue: a few microseconds cheaper per record than queue.Queue; the bound is checked by the handler
+        self.records: "queue.SimpleQueue[Optional[logging.LogRecord]]" = queue.SimpleQueue()
+        self.handler = ContextQueueHandler(self.records)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.handlers = list(handlers)
+        self.formatter = JsonLinesFormatter()
+        self.batches = 0
+        self.written = 0
+        self._file = None
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+
+    def start(self):
+        if self.path:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self.records.put(None)
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {"written": self.written, "batches": self.batches, "queued": self.records.qsize(), "dropped": self.handler.dropped}
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _write(self, batch: List[logging.LogRecord]):
+        if self._file is not None:
+            data = "".join(self.formatter.format(record) + "\n" for record in batch)
+            if self.max_bytes and self._file.tell() + len(data) > self.max_bytes and self._file.tell() > 0:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+        for record in batch:
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+        self.batches += 1
+        self.written += len(batch)
+
+    def _run(self):
+        running = True
+        while running:
+            batch = []
+            record = self.records.get()
+            while record is not None:
+                batch.append(record)
+                if len(batch) >= BATCH_SIZE:
+                    break
+                try:
+                    record = self.records.get_nowait()
+                except queue.Empty:
+                    break
+            running = record is not None
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    print(f"log-writer: could not write {len(batch)} records: {e}", file=sys.stderr)
+        if self._file is not None:
+            self._file.close()
+
+
+def configure_logging(log_file: Optional[str] = DEFAULT_LOG_FILE,
+                      console_format: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+                      level: int = logging.INFO,
+                      max_bytes: int = DEFAULT_MAX_BYTES,
+                      backup_count: int = DEFAULT_BACKUP_COUNT) -> JsonLogWriter:
+    """
+    Replaces the root logger's handlers with the queue pipeline: JSON lines to `log_file`
+    (None for console only) and `console_format` lines to stderr, both written off the
+    calling thread. Returns the writer, which is stopped (and drained) at exit.
+    """
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(console_format, datefmt="%Y-%m-%d %H:%M:%S"))
+    writer = JsonLogWriter(log_file, max_bytes, backup_count, handlers=[console])
+    writer.start()
+    atexit.register(writer.stop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(writer.handler)
+    root.setLevel(level)
+    return writer
+
+
+def configure_logging_from_env(**overrides) -> JsonLogWriter:
+    # NEGOTIATION_LOG_FILE="" turns the JSON file off and keeps console output
+    settings = {
+        "log_file": os.getenv("NEGOTIATION_LOG_FILE", DEFAULT_LOG_FILE) or None,
+        "max_bytes": int(float(os.getenv("NEGOTIATION_LOG_MAX_MB", DEFAULT_MAX_BYTES / 2 ** 20)) * 2 ** 20),
+        "backup_count": int(os.getenv("NEGOTIATION_LOG_BACKUPS", DEFAULT_BACKUP_COUNT)),
+    }
+    settings.update(overrides)
+    return configure_logging(**settings)
@@ -0,0 +1,108 @@
+# negotiation_batch.py
+# Many (sessionId, userInput) turns in one request: sessions run concurrently, each session's
+# turns run in the order given, and replies come back in request order
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from session_backend import VersionConflict
+
+# Most turns one request may carry
+MAX_BATCH_TURNS = int(os.getenv("NEGOTIATION_BATCH_MAX_TURNS", 500))
+# Sessions of a batch in flight at once (threads in the Flask apps, coroutines in the ASGI app);
+# each holds at most one model call, so this is the batch's upstream concurrency
+BATCH_CONCURRENCY = int(os.getenv("NEGOTIATION_BATCH_CONCURRENCY", 32))
+
+
+def parse_batch(data: Any) -> Tuple[Optional[List[Any]], Optional[str]]:
+    """
+    Reads {"turns": [{"sessionId", "userInput", "requestId"?}, ...]}. Returns (turns, None) with
+    a (session_id, user_input, request_id) tuple per entry (or the error string for an unusable
+    entry, so the other turns still run), or (None, error) when the body as a whole is unusable.
+    """
+    turns = data.get("turns") if isinstance(data, dict) else None
+    if not isinstance(turns, list) or not turns:
+        return None, "Request body must be a JSON object with a non-empty \"turns\" list"
+    if len(turns) > MAX_BATCH_TURNS:
+        return None, f"At most {MAX_BATCH_TURNS} turns per batch"
+    parsed = []
+    for entry in turns:
+        if not isinstance(entry, dict) or not entry.get("userInput"):
+            parsed.append("No userInput provided")
+        else:
+            parsed.append((entry.get("sessionId", "default_session"), entry["userInput"], entry.get("requestId")))
+    return parsed, None
+
+
+def _by_session(turns: List[Any]) -> Dict[str, List[int]]:
+    # session id -> positions of its turns, sessions in order of first appearance
+    groups: Dict[str, List[int]] = {}
+    for index, turn in enumerate(turns):
+        if isinstance(turn, tuple):
+            groups.setdefault(turn[0], []).append(index)
+    return groups
+
+
+def _error_results(turns: List[Any]) -> List[Optional[Dict[str, Any]]]:
+    return [{"error": turn} if isinstance(turn, str) else None for turn in turns]
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _shared_executor() -> ThreadPoolExecutor:
+    # One pool for every batch request, so concurrent batches share the upstream budget
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="negotiate-batch")
+        return _executor
+
+
+def run_batch(store, turns: List[Any]) -> List[Dict[str, Any]]:
+    """Blocking version for the Flask apps: each session's turns run on a pool thread."""
+    results = _error_results(turns)
+
+    def run_session(indexes: List[int]):
+        for index in indexes:
+            session_id, user_input, request_id = turns[index]
+            try:
+                reply = store.run_turn(session_id, lambda session_state: session_state.get_agent_reply(user_input, request_id))
+                results[index] = {"sessionId": session_id, "reply": reply}
+            except VersionConflict:
+                results[index] = {"sessionId": session_id, "error": "Session was updated by another request; please resend"}
+            except Exception as e:
+                logging.error(f"Batch turn for session {session_id} failed: {e}")
+                results[index] = {"sessionId": session_id, "error": str(e)}
+
+    futures = [_shared_executor().submit(run_session, indexes) for indexes in _by_session(turns).values()]
+    for future in futures:
+        future.result()
+    return results
+
+
+async def arun_batch(store, turns: List[Any]) -> List[Dict[str, Any]]:
+    """Asyncio version for the ASGI app: one coroutine per session, BATCH_CONCURRENCY at a time."""
+    results = _error_results(turns)
+    limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_session(indexes: List[int]):
+        async with limit:
+            for index in indexes:
+                session_id, user_input, request_id = turns[index]
+                try:
+                    reply = await store.arun_turn(session_id, lambda session_state: session_state.aget_agent_reply(user_input, request_id))
+                    results[index] = {"sessionId": session_id, "reply": reply}
+                except VersionConflict:
+                    results[index] = {"sessionId": session_id, "error": "Session was updated by another request; please resend"}
+                except Exception as e:
+                    logging.error(f"Batch turn for session {session_id} failed: {e}")
+                    results[index] = {"sessionId": session_id, "error": str(e)}
+
+    await asyncio.gather(*(run_session(indexes) for indexes in _by_session(turns).values()))
+    return results
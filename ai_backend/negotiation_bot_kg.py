@@ -1,151 +1,71 @@
 import os
-import re
 import logging
 import json
 import datetime
-from dotenv import load_dotenv
-from typing import List, Optional, Dict, Any
-
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.memory import ConversationBufferMemory
-from langchain_core.runnables.history import RunnableWithMessageHistory
-
-from negotiation_kg import NegotiationKnowledgeGraph
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s  %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("conversation_kg_enhanced.log", "a", encoding="utf-8")
-    ]
-)
+import threading
+from typing import Optional, Dict, Any, Callable
 
-TRUE_MAX_SALARY = 135_000
-INITIAL_SUBJECTIVE_LIMIT = 115_000
+from negotiation_kg import NegotiationKnowledgeGraph, CONTEXT_SECTIONS, make_knowledge_graph
+from offer_extraction import scan_message, MessageScan
+from conversation_history import HistoryStore, format_history
+from prompt_layout import PromptLayout
+import log_pipeline
 
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY1")
-api_base = os.getenv("LITELLM_API_BASE")
+# Importing this module has no side effects: logging, .env loading, the OpenAI client and
+# the LangChain chain are all set up by the functions below, when an entry point asks.
 
-if not api_key:
-    print("Error: OPENAI_API_KEY1 environment variable not set.")
-    exit()
+# JSON lines (see log_pipeline.py); replay_negotiations.py --log reads it back
+CONVERSATION_LOG_FILE = "conversation_kg_enhanced.jsonl"
 
-def extract_structured_offer(text: str) -> Dict[str, Any]:
-    offer = {}
-    
-    base_salary_matches = re.findall(r"(?:base(?: salary)? of|salary of|offer(?:ing)?|at|is|around|for)\s*\$?(\d{1,3}(?:,\d{3})*|\d+)[kK]?", text, re.IGNORECASE)
-    salary_matches = re.findall(r"\$?(\d{1,3}(?:,\d{3})*|\d+)[kK]?\b(?!\s*(?:bonus|relocation|stock|year|month))", text)
-    all_numeric_matches = re.findall(r"\$?(\d{1,3}(?:,\d{3})*|\d+)\b", text)
-
-    potential_salaries = []
-    processed_matches = set()
-
-    for m in base_salary_matches:
-        num_str = m.replace(",", "").lower()
-        if num_str in processed_matches:
-            continue
-        multiplier = 1000 if 'k' in num_str else 1
-        try:
-            salary = int(re.sub(r"[k$]", "", num_str)) * multiplier
-            if 10000 < salary < 1000000:
-                 potential_salaries.append(salary)
-                 processed_matches.add(num_str)
-        except ValueError:
-            continue
-            
-    for m in salary_matches:
-        num_str = m.replace(",", "").lower()
-        if num_str in processed_matches:
-            continue
-        multiplier = 1000 if 'k' in num_str else 1
-        try:
-            salary = int(re.sub(r"[k$]", "", num_str)) * multiplier
-            if 10000 < salary < 1000000:
-                 potential_salaries.append(salary)
-                 processed_matches.add(num_str)
-        except ValueError:
-            continue
-
-    if potential_salaries:
-        offer["base"] = max(potential_salaries)
-    elif all_numeric_matches:
-         try:
-             numeric_values = [int(m.replace(",", "")) for m in all_numeric_matches if m not in processed_matches]
-             valid_salaries = [s for s in numeric_values if 10000 < s < 1000000]
-             if valid_salaries:
-                 offer["base"] = max(valid_salaries)
-         except ValueError:
-             pass
-
-    if re.search(r"\b(?:remote(?: work)?|work from home|wfh)\b", text, re.IGNORECASE):
-        offer.setdefault("perks", []).append("remote work")
-    if re.search(r"\b(?:stock options?|equity|rsus?)\b", text, re.IGNORECASE):
-        offer.setdefault("perks", []).append("stock options")
-    if re.search(r"\b(?:relocation(?: bonus| package| assistance)?|moving expenses)\b", text, re.IGNORECASE):
-        offer.setdefault("perks", []).append("relocation assistance")
-    if re.search(r"\b(?:bonus)\b", text, re.IGNORECASE):
-         bonus_matches = re.findall(r"\$?(\d{1,3}(?:,\d{3})*|\d+)[kK]?\s*(?:bonus)", text, re.IGNORECASE)
-         if bonus_matches:
-             num_str = bonus_matches[0].replace(",", "").lower()
-             multiplier = 1000 if 'k' in num_str else 1
-             try:
-                 offer["bonus"] = int(re.sub(r"[k$]", "", num_str)) * multiplier
-             except ValueError:
-                 pass
-         else:
-             offer["bonus"] = "mentioned"
-             
-    if "perks" in offer:
-        offer["perks"] = sorted(list(set(offer["perks"])))
-        if not offer["perks"]:
-            del offer["perks"]
-            
-    if "base" not in offer:
-        return {}
-        
-    return offer
+TRUE_MAX_SALARY = 135_000
+INITIAL_SUBJECTIVE_LIMIT = 115_000
 
-def extract_preferences(text: str, kg: NegotiationKnowledgeGraph):
-    if re.search(r"\b(?:remote(?: work)?|work from home|wfh)\b", text, re.IGNORECASE):
-        kg.add_candidate_preference("remote work")
-    if re.search(r"\b(?:stock options?|equity|rsus?)\b", text, re.IGNORECASE):
-        kg.add_candidate_preference("stock options")
-    if re.search(r"\b(?:relocation|moving)\b", text, re.IGNORECASE):
-        kg.add_candidate_preference("relocation assistance")
+def configure_logging(log_file: Optional[str] = CONVERSATION_LOG_FILE):
+    """Console logging, plus the conversation log file unless `log_file` is None; both written off-thread."""
+    log_pipeline.configure_logging(log_file, console_format="%(asctime)s  %(message)s")
 
-class CustomConversationBufferMemory(ConversationBufferMemory):
-    @property
-    def messages(self):
-        if hasattr(self, "chat_memory") and hasattr(self.chat_memory, "messages"):
-            return self.chat_memory.messages
-        if isinstance(self.buffer, str):
-            return [msg for msg in self.buffer.split("\n") if msg] 
-        return self.buffer
-
-    def add_messages(self, messages: List):
-        if hasattr(self, "chat_memory") and hasattr(self.chat_memory, "add_messages"):
-            self.chat_memory.add_messages(messages)
-        else:
-            if not isinstance(self.buffer, list):
-                self.buffer = []
-            self.buffer.extend(messages)
-
-llm_params = {
-    "openai_api_key": api_key,
-    "temperature": 0.6
-}
-if api_base:
-    llm_params["openai_api_base"] = api_base
-    llm_params["model"] = "llama-3.1-70b-instruct"
-    print(f"Using API Base: {api_base} with Model: {llm_params['model']}")
-else:
-    pass
-
-llm = ChatOpenAI(**llm_params)
+def extract_structured_offer(text: str) -> Dict[str, Any]:
+    return scan_message(text).offer
+
+def extract_preferences(text: str, kg: NegotiationKnowledgeGraph, scan: Optional[MessageScan] = None):
+    for perk_name in (scan or scan_message(text)).preferences:
+        kg.add_candidate_preference(perk_name)
+
+# Counters of the model client's HTTP transport; set once default_llm_factory has built it
+_transport_stats = None
+
+def llm_transport_stats() -> Optional[Dict[str, Any]]:
+    return _transport_stats.snapshot() if _transport_stats is not None else None
+
+def default_llm_factory():
+    """ChatOpenAI configured from OPENAI_API_KEY1 / LITELLM_API_BASE (.env is read first)."""
+    from dotenv import load_dotenv
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY1")
+    api_base = os.getenv("LITELLM_API_BASE")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY1 environment variable not set.")
+
+    from langchain_openai import ChatOpenAI
+    from llm_transport import TransportConfig, TransportStats, build_http_clients
+    global _transport_stats
+    transport = TransportConfig.from_env()
+    _transport_stats = TransportStats()
+    http_client, http_async_client = build_http_clients(transport, _transport_stats)
+    llm_params = {
+        "openai_api_key": api_key,
+        "temperature": 0.6,
+        # Retries happen in the transport, under its budget; the SDK's own would bypass it
+        "http_client": http_client,
+        "http_async_client": http_async_client,
+        "timeout": transport.timeout(),
+        "max_retries": 0,
+    }
+    if api_base:
+        llm_params["openai_api_base"] = api_base
+        llm_params["model"] = "llama-3.1-70b-instruct"
+        logging.info(f"Using API Base: {api_base} with Model: {llm_params['model']}")
+    return ChatOpenAI(**llm_params)
 
 negotiation_template = f'''
 ## Dialogue So Far
@@ -221,67 +141,186 @@ Candidate says: "{{message}}"
 
 ## Your Response:
 '''
-prompt = PromptTemplate.from_template(negotiation_template)
+# Static-prefix layout: the persona and rules go first with every per-turn value replaced
+# by a pointer to the sections after them, so that part is identical on every call and a
+# provider's prefix cache can reuse it; history, ceiling, KG context and message come last
+_STATIC_REFERENCES = (
+    ("(Current ceiling: ${subjective_limit})", "(see the offer ceiling below)"),
+    ("Your current operational ceiling is ${subjective_limit}.", "Your current operational ceiling is given below."),
+    ("({history})", "(the dialogue below)"),
+    ("({kg_context})", "(the KG context below)"),
+    ("${subjective_limit}", "your current ceiling"),
+)
+
+def build_prompt_layout(layout: str) -> PromptLayout:
+    if layout == "legacy":
+        return PromptLayout("legacy", "", negotiation_template)
+    if layout != "static_prefix":
+        raise ValueError(f"Unsupported NEGOTIATION_PROMPT_LAYOUT: {layout}")
+    dynamic_head, rest = negotiation_template.split("# Human‑Like Negotiation Agent", 1)
+    rules, message_tail = rest.split("Candidate says:", 1)
+    static_text = "# Human‑Like Negotiation Agent" + rules.rstrip()
+    for placeholder, reference in _STATIC_REFERENCES:
+        static_text = static_text.replace(placeholder, reference)
+    assert "{" not in static_text, "static prompt still has a per-turn slot"
+    return PromptLayout("static_prefix", static_text, dynamic_head.strip() + "\n\nCandidate says:" + message_tail)
+
+# The original single-message prompt unless NEGOTIATION_PROMPT_LAYOUT=static_prefix opts in
+prompt_layout = build_prompt_layout(os.getenv("NEGOTIATION_PROMPT_LAYOUT", "legacy"))
+
+# Per-session history: the last few turns verbatim plus a KG digest of the rest, within a
+# token budget (NEGOTIATION_HISTORY_TURNS / NEGOTIATION_HISTORY_TOKENS)
+history_store = HistoryStore.from_env()
 
 def get_memory(session_id: str):
-    return CustomConversationBufferMemory(
-        memory_key="history",
-        return_messages=True,
-        input_key="message"
+    return history_store.get(session_id)
+
+def build_chain(llm, layout: Optional[PromptLayout] = None):
+    """The conversation runnable: bounded history -> prompt layout -> `llm`."""
+    from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+    from langchain_core.runnables.history import RunnableWithMessageHistory
+
+    chain = RunnablePassthrough.assign(history=lambda inputs: format_history(inputs["history"])) | RunnableLambda((layout or prompt_layout).render) | llm
+    return RunnableWithMessageHistory(
+        runnable=chain,
+        get_session_history=get_memory,
+        input_messages_key="message",
+        history_messages_key="history"
     )
 
-chain = prompt | llm
-conversation = RunnableWithMessageHistory(
-    runnable=chain,
-    get_session_history=get_memory,
-    input_messages_key="message",
-    history_messages_key="history"
-)
+class LazyConversation:
+    """
+    Stands in for the conversation runnable and builds it from `llm_factory` and
+    `chain_factory` on first use. Servers call warmup() at startup so the first request
+    doesn't pay for it, and report `ready` once it has run; tests and offline tools can
+    configure() other factories (or replace `conversation` outright) before that.
+    """
+
+    def __init__(self, llm_factory: Callable[[], Any] = default_llm_factory, chain_factory: Callable[[Any], Any] = build_chain):
+        self._lock = threading.Lock()
+        self.configure(llm_factory, chain_factory)
+
+    def configure(self, llm_factory: Optional[Callable[[], Any]] = None, chain_factory: Optional[Callable[[Any], Any]] = None):
+        with self._lock:
+            if llm_factory is not None:
+                self.llm_factory = llm_factory
+            if chain_factory is not None:
+                self.chain_factory = chain_factory
+            self._runnable = None
+            self.error: Optional[str] = None
 
-def get_dynamic_context_from_kg(kg: NegotiationKnowledgeGraph) -> str:
-    context_parts = []
-    prefs = kg.get_candidate_preferences()
-    if prefs:
-        context_parts.append(f"Candidate Preferences: {', '.join(prefs)}.")
-        
-    rejected_agent_offers = kg.get_offers_by_status("rejected", "agent")
-    if rejected_agent_offers:
-        offer_summaries = []
-        for turn, details, node_id in rejected_agent_offers[:2]: # Limit context
-             offer_summaries.append(f"Turn {turn}: {json.dumps(details)}")
-        context_parts.append(f"Recently Rejected Agent Offers: [{'; '.join(offer_summaries)}]. Avoid similar offers.")
+    @property
+    def ready(self) -> bool:
+        return self._runnable is not None
+
+    def get(self):
+        runnable = self._runnable
+        if runnable is None:
+            with self._lock:
+                if self._runnable is None:
+                    try:
+                        self._runnable = self.chain_factory(self.llm_factory())
+                        self.error = None
+                    except Exception as e:
+                        self.error = str(e)
+                        raise
+                runnable = self._runnable
+        return runnable
+
+    def warmup(self) -> bool:
+        """Builds the chain now; returns readiness instead of raising, for startup hooks."""
+        try:
+            self.get()
+        except Exception as e:
+            logging.error(f"Conversation warmup failed: {e}")
+        return self.ready
+
+    def invoke(self, inputs, config=None):
+        return self.get().invoke(inputs, config=config)
+
+    async def ainvoke(self, inputs, config=None):
+        return await self.get().ainvoke(inputs, config=config)
+
+    def stream(self, inputs, config=None):
+        return self.get().stream(inputs, config=config)
+
+    def astream(self, inputs, config=None):
+        return self.get().astream(inputs, config=config)
 
+conversation = LazyConversation()
+
+def _render_preferences(kg: NegotiationKnowledgeGraph) -> str:
+    prefs = kg.get_candidate_preferences()
+    if not prefs:
+        return ""
+    return f"Candidate Preferences: {', '.join(prefs)}."
+
+def _render_rejected_agent_offers(kg: NegotiationKnowledgeGraph) -> str:
+    rejected_agent_offers = kg.get_offers_by_status("rejected", "agent", limit=2) # Limit context
+    if not rejected_agent_offers:
+        return ""
+    offer_summaries = []
+    for turn, details, node_id in rejected_agent_offers:
+         offer_summaries.append(f"Turn {turn}: {json.dumps(details)}")
+    return f"Recently Rejected Agent Offers: [{'; '.join(offer_summaries)}]. Avoid similar offers."
+
+def _render_last_agent_offer(kg: NegotiationKnowledgeGraph) -> str:
     last_agent_offer_info = None
-    agent_offers_proposed = kg.get_offers_by_status("proposed", "agent")
+    agent_offers_proposed = kg.get_offers_by_status("proposed", "agent", limit=1)
     if agent_offers_proposed:
         last_agent_offer_info = agent_offers_proposed[0]
     else:
-        all_agent_offers = kg.get_last_offer_details("agent") 
-        if all_agent_offers:
-            last_agent_offer_info = all_agent_offers
-            
-    if last_agent_offer_info:
-        turn, details, node_id = last_agent_offer_info
-        status = kg.graph.nodes[node_id].get("status", "proposed")
-        context_parts.append(f"Last Agent Offer (Turn {turn}, Status: {status}): {json.dumps(details)}.")
-        
+        last_agent_offer_info = kg.get_last_offer_details("agent")
+
+    if not last_agent_offer_info:
+        return ""
+    turn, details, node_id = last_agent_offer_info
+    status = kg.get_offer_status(node_id) or "proposed"
+    return f"Last Agent Offer (Turn {turn}, Status: {status}): {json.dumps(details)}."
+
+def _render_last_candidate_offer(kg: NegotiationKnowledgeGraph) -> str:
     last_candidate_offer_info = kg.get_last_offer_details("candidate")
-    if last_candidate_offer_info:
-        turn, details, node_id = last_candidate_offer_info
-        context_parts.append(f"Last Candidate Offer (Turn {turn}): {json.dumps(details)}.")
-        
+    if not last_candidate_offer_info:
+        return ""
+    turn, details, node_id = last_candidate_offer_info
+    return f"Last Candidate Offer (Turn {turn}): {json.dumps(details)}."
+
+# Section renderers in prompt order; names match negotiation_kg.CONTEXT_SECTIONS
+CONTEXT_RENDERERS = (
+    ("preferences", _render_preferences),
+    ("rejected_agent_offers", _render_rejected_agent_offers),
+    ("last_agent_offer", _render_last_agent_offer),
+    ("last_candidate_offer", _render_last_candidate_offer),
+)
+
+def _render_dynamic_context(kg: NegotiationKnowledgeGraph) -> str:
+    context_parts = []
+    for section, render in CONTEXT_RENDERERS:
+        text = kg.get_cached_context((section,), lambda render=render: render(kg))
+        if text:
+            context_parts.append(text)
+
     if not context_parts:
         return "No specific context from Knowledge Graph yet."
-        
+
     return " ".join(context_parts)
 
+def get_dynamic_context_from_kg(kg: NegotiationKnowledgeGraph) -> str:
+    # Sections are cached on the KG and only re-rendered after a mutation that affects them
+    return kg.get_cached_context(CONTEXT_SECTIONS, lambda: _render_dynamic_context(kg))
+
 # Only run the command-line interface if this file is executed directly
 if __name__ == "__main__":
+    configure_logging()
+    if not conversation.warmup():
+        print(f"Error: {conversation.error}")
+        exit()
     print("\nEnhanced Negotiation Agent Active! Type your message as the candidate.\nType 'exit' to stop.\n")
     logging.info("=== Enhanced Negotiation Agent Active ===")
     session_id = f"negotiation-session-kg-enhanced-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
 
-    kg = NegotiationKnowledgeGraph(session_id)
+    kg = make_knowledge_graph(session_id)
+    history_store.bind(session_id, kg)
 
     current_turn = 0
     subjective_limit = INITIAL_SUBJECTIVE_LIMIT
@@ -300,12 +339,14 @@ if __name__ == "__main__":
             print(kg.get_negotiation_summary())
             break
 
+        log_pipeline.set_log_context(session_id, current_turn + 1)
         logging.info(f"Candidate (Turn {current_turn + 1}): {user_input}")
 
+        scan = scan_message(user_input)
         accepted = False
-        if previous_agent_offer_node_id and re.search(r"\b(deal|accept|agree|sounds good|let'?s do it|i'?ll take it|happy to take it|ok)\b", user_input, re.IGNORECASE):
+        if previous_agent_offer_node_id and scan.accepted:
             prev_base = previous_agent_offer_details.get("base") if previous_agent_offer_details else None
-            user_offer_details = extract_structured_offer(user_input)
+            user_offer_details = scan.offer
             user_base = user_offer_details.get("base")
             
             if isinstance(prev_base, int) and (user_base is None or user_base == prev_base):
@@ -322,8 +363,9 @@ if __name__ == "__main__":
                      
                 concluding_reply = f"Great! Then we have a deal based on our last offer: {json.dumps(previous_agent_offer_details)}. I'm thrilled to have you join the team and will follow up with the formal offer letter shortly."
                 print(f"\nEmployer Agent (Conclusion):", concluding_reply, "\n")
-                logging.info(f"Employer Agent (Conclusion): {concluding_reply}")
-                kg.graph.nodes[kg._get_turn_node_id(current_turn)]["agent_response"] = concluding_reply
+                logging.info(f"Employer Agent (Conclusion): {concluding_reply}",
+                             extra={"candidate": user_input, "agent": concluding_reply, "concluded": True})
+                kg.set_agent_response(current_turn, concluding_reply)
                 
                 print("\n--- Negotiation Concluded (Accepted) ---")
                 print(kg.get_negotiation_summary())
@@ -333,11 +375,11 @@ if __name__ == "__main__":
         if accepted:
             continue # Should not be reached due to break, but for safety
 
-        extract_preferences(user_input, kg)
-        candidate_offer_details = extract_structured_offer(user_input)
+        extract_preferences(user_input, kg, scan)
+        candidate_offer_details = scan.offer
 
         last_candidate_offer_info = kg.get_last_offer_details("candidate")
-        rejected_agent_offers_count = len(kg.get_offers_by_status("rejected", "agent"))
+        rejected_agent_offers_count = kg.count_offers_by_status("rejected", "agent")
         prev_limit_from_kg = kg.get_current_limit() or INITIAL_SUBJECTIVE_LIMIT
 
         if current_turn == 0:
@@ -371,7 +413,8 @@ if __name__ == "__main__":
                 config={"configurable": {"session_id": session_id}}
             )
             reply = result.content.strip()
-            logging.info(f"Employer Agent (Turn {current_turn + 1}, Limit: ${current_subjective_limit}): {reply}")
+            logging.info(f"Employer Agent (Turn {current_turn + 1}, Limit: ${current_subjective_limit}): {reply}",
+                         extra={"candidate": user_input, "agent": reply, "limit": current_subjective_limit})
             print(f"\nEmployer Agent (Limit: ${current_subjective_limit}):", reply, "\n")
 
             current_turn = kg.add_turn(user_input, reply, current_subjective_limit)
@@ -379,7 +422,7 @@ if __name__ == "__main__":
             if candidate_offer_details:
                 new_candidate_offer_node_id = kg.add_offer(current_turn, candidate_offer_details, "candidate")
                 logging.info(f"KG: Added Candidate Offer: {candidate_offer_details} for Turn {current_turn}")
-                if previous_agent_offer_node_id and kg.graph.nodes[previous_agent_offer_node_id].get("status") == "proposed":
+                if previous_agent_offer_node_id and kg.get_offer_status(previous_agent_offer_node_id) == "proposed":
                      kg.update_offer_status(previous_agent_offer_node_id, "rejected")
                      logging.info(f"KG: Marked previous agent offer {previous_agent_offer_node_id} as rejected due to candidate counter.")
 
@@ -392,12 +435,10 @@ if __name__ == "__main__":
                     last_agent_offer_node_id = new_agent_offer_node_id
                     last_agent_offer_details = agent_offer_details
                     
-                    rejected_agent_offers = kg.get_offers_by_status("rejected", "agent")
-                    for _, rejected_details, rejected_node_id in rejected_agent_offers:
-                        if rejected_details.get("base") == agent_base:
-                             kg.add_similar_offer_relation(new_agent_offer_node_id, rejected_node_id)
-                             logging.warning(f"KG: Agent offer {new_agent_offer_node_id} is similar to rejected offer {rejected_node_id}.")
-                             break
+                    similar = kg.find_similar_offer(agent_offer_details, "rejected", "agent")
+                    if similar is not None:
+                         kg.add_similar_offer_relation(new_agent_offer_node_id, similar[2])
+                         logging.warning(f"KG: Agent offer {new_agent_offer_node_id} is similar to rejected offer {similar[2]}.")
                 elif isinstance(agent_base, int):
                      logging.warning(f"KG: Agent offer base ${agent_base} exceeded limit ${current_subjective_limit} in Turn {current_turn}. Not adding to KG.")
                      last_agent_offer_node_id = None
@@ -2,10 +2,266 @@
 
 import networkx as nx
 import datetime
-import json
-from typing import Optional, Tuple, List, Dict, Any
+import os
+from abc import ABC, abstractmethod
+from bisect import insort, bisect_left
+from typing import Optional, Tuple, List, Dict, Any, Callable, Iterator, Sequence, Set
 
-class NegotiationKnowledgeGraph:
+from negotiation_summary import NegotiationSummary, summary_turn
+
+# Mutators recorded to `journal_ops` when journaling is on, and replayable via apply_journal_op
+JOURNALED_OPS = ("add_turn", "add_offer", "update_offer_status", "add_candidate_preference", "add_similar_offer_relation", "set_agent_response")
+
+# Prompt-context sections that can be cached independently of each other
+CONTEXT_SECTIONS = ("preferences", "rejected_agent_offers", "last_agent_offer", "last_candidate_offer")
+
+# Default relative base-salary distance within which find_similar_offer treats offers as near-duplicates
+SIMILAR_OFFER_TOLERANCE = float(os.getenv("NEGOTIATION_SIMILAR_OFFER_TOLERANCE", 0.02))
+
+def offer_shape(details: Any) -> Optional[Tuple[int, Any, Tuple[str, ...]]]:
+    """(base, bonus, perk set) an offer is compared on, or None for offers without an int base."""
+    if not isinstance(details, dict) or not isinstance(details.get("base"), int):
+        return None
+    perks = details.get("perks")
+    # A sorted tuple rather than a frozenset: the same as a key, at a fraction of the memory
+    perk_set = tuple(sorted({str(perk).lower() for perk in perks})) if isinstance(perks, (list, tuple)) else ()
+    return details["base"], details.get("bonus"), perk_set
+
+def _shape_bucket(offered_by: str, status: str, shape: Tuple[int, Any, Tuple[str, ...]]) -> Tuple[str, str, Any, Tuple[str, ...]]:
+    # The similarity bucket of an offer: everything but the base has to match exactly
+    bonus = shape[1]
+    try:
+        hash(bonus)
+    except TypeError:
+        # Not a valid key (a list or dict from odd details); find_similar_offer still compares with ==
+        bonus = ("unhashable", repr(bonus))
+    return offered_by, status, bonus, shape[2]
+
+class KnowledgeGraphBase(ABC):
+    """
+    Storage-independent parts of the negotiation KG: the session journal hooks, the
+    versioned prompt-context cache and the offer indexes with the queries served from
+    them. Backends store turns, offers and preferences and implement the abstract methods
+    (_offer_entry, _indexed_offers, _summary_turn, export_rows); see NegotiationKnowledgeGraph (networkx) and
+    compact_kg.CompactNegotiationKnowledgeGraph.
+    """
+
+    def _init_indexes(self):
+        self.turn_count = 0
+        # When a list, every mutation is appended to it as [op, *args] for the session journal
+        self.journal_ops: Optional[List[List[Any]]] = None
+        # Offer indexes, maintained by add_offer/update_offer_status. Each list holds
+        # (turn_number, -insertion_seq, offer_ref) sorted ascending, so the newest turn is
+        # last and ties within a turn keep insertion order when read back-to-front.
+        # A party/status of None indexes offers regardless of that field.
+        self._offer_seq = 0
+        self._offers_by_party: Dict[Optional[str], List[Tuple[int, int, Any]]] = {}
+        self._offers_by_party_status: Dict[Tuple[Optional[str], str], List[Tuple[int, int, Any]]] = {}
+        # Similarity index: (party, status, bonus, perk set) -> (base, index key) sorted by base,
+        # for offers with an int base, so near-duplicates are a bisect away (see find_similar_offer)
+        self._offers_by_shape: Dict[Tuple[str, str, Any, Tuple[str, ...]], List[Tuple[int, Tuple[int, int, Any]]]] = {}
+        # Versioned prompt-context cache. Every mutator bumps `version`; the ones that
+        # change what a context section shows also bump that section, so rendered text
+        # is reused until something it depends on changes.
+        self.version = 0
+        self._section_versions: Dict[str, int] = {section: 0 for section in CONTEXT_SECTIONS}
+        self._context_cache: Dict[Tuple[str, ...], Tuple[Tuple[int, ...], str]] = {}
+        # Summary cache: (JSON object, text block) per turn, built on the first summary request and
+        # from then on re-rendered only for turns that changed (turn numbers in _summary_dirty)
+        # (both None until then, so sessions nobody polls carry nothing for it)
+        self._summary_turns: Optional[List[Tuple[str, str]]] = None
+        self._summary_dirty: Optional[Set[int]] = None
+
+    def __getstate__(self):
+        # Offer indexes and rendered context are derived from the stored offers, so they
+        # are rebuilt on load instead of being serialized with them
+        state = self.__dict__.copy()
+        del state["_offers_by_party"], state["_offers_by_party_status"], state["_offers_by_shape"]
+        state["_context_cache"] = {}
+        state["_summary_turns"] = state["_summary_dirty"] = None
+        state["journal_ops"] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.setdefault("_summary_turns", None)
+        self.__dict__.setdefault("_summary_dirty", None)
+        self.__dict__.update(state)
+        if "_offers_by_party" not in state:
+            self._offers_by_party = {}
+            self._offers_by_party_status = {}
+            self._offers_by_shape = {}
+            for key, offered_by, status in self._indexed_offers():
+                self._index_offer(key, offered_by, status)
+
+    @abstractmethod
+    def _indexed_offers(self) -> Iterator[Tuple[Tuple[int, int, Any], str, str]]:
+        """(index key, offered_by, status) of every indexed offer."""
+
+    @abstractmethod
+    def _offer_entry(self, key: Tuple[int, int, Any]) -> Tuple[int, Dict[str, Any], str]:
+        """(turn_number, details, offer id) for an index key."""
+
+    @abstractmethod
+    def _summary_turn(self, turn_number: int) -> Tuple[str, str]:
+        """negotiation_summary.summary_turn() for one existing turn."""
+
+    @abstractmethod
+    def export_rows(self) -> Tuple[Sequence[Any], Sequence[float], List[Tuple[int, str, str, Any]]]:
+        """
+        For offer_export: (limit per turn, timestamp per turn, offers as (turn_number,
+        offered_by, status, details) in the order they were first made), read in one pass.
+        """
+
+    def _dirty_summary(self, turn_number: Any):
+        if self._summary_turns is not None and isinstance(turn_number, int) and 1 <= turn_number <= len(self._summary_turns):
+            self._summary_dirty.add(turn_number)
+
+    def negotiation_summary(self) -> NegotiationSummary:
+        """
+        The summary as an immutable snapshot. Only turns added or changed since the last call
+        are rendered; the rest come from the cache, so polling a long session is cheap.
+        """
+        turns = self._summary_turns
+        if turns is None:
+            turns = self._summary_turns = []
+            self._summary_dirty = set()
+        for turn_number in self._summary_dirty:
+            turns[turn_number - 1] = self._summary_turn(turn_number)
+        self._summary_dirty.clear()
+        for turn_number in range(len(turns) + 1, self.turn_count + 1):
+            turns.append(self._summary_turn(turn_number))
+        return NegotiationSummary(self.session_id, self.turn_count, self.version, self.get_candidate_preferences(), turns)
+
+    def get_negotiation_summary(self) -> str:
+        return self.negotiation_summary().text()
+
+    def _index_offer(self, key: Tuple[int, int, Any], offered_by: str, status: str, by_party: bool = True):
+        for party in (offered_by, None):
+            if by_party:
+                insort(self._offers_by_party.setdefault(party, []), key)
+            insort(self._offers_by_party_status.setdefault((party, status), []), key)
+        shape = offer_shape(self._offer_entry(key)[1])
+        if shape is not None:
+            insort(self._offers_by_shape.setdefault(_shape_bucket(offered_by, status, shape), []), (shape[0], key))
+
+    def _unindex_offer(self, key: Tuple[int, int, Any], offered_by: str, status: str, by_party: bool = True):
+        buckets = [self._offers_by_party_status.get((offered_by, status)), self._offers_by_party_status.get((None, status))]
+        if by_party:
+            buckets += [self._offers_by_party.get(offered_by), self._offers_by_party.get(None)]
+        for bucket in buckets:
+            if bucket:
+                pos = bisect_left(bucket, key)
+                if pos < len(bucket) and bucket[pos] == key:
+                    del bucket[pos]
+        shape = offer_shape(self._offer_entry(key)[1])
+        bucket_key = _shape_bucket(offered_by, status, shape) if shape is not None else None
+        bucket = self._offers_by_shape.get(bucket_key) if shape is not None else None
+        if bucket:
+            entry = (shape[0], key)
+            pos = bisect_left(bucket, entry)
+            if pos < len(bucket) and bucket[pos] == entry:
+                del bucket[pos]
+                if not bucket:
+                    # Offers move between statuses every turn; don't keep their old buckets around
+                    del self._offers_by_shape[bucket_key]
+
+    def _record(self, op: str, *args: Any):
+        if self.journal_ops is not None:
+            self.journal_ops.append([op, *args])
+
+    def apply_journal_op(self, op: str, *args: Any):
+        if op not in JOURNALED_OPS:
+            raise ValueError(f"Unknown journal op: {op}")
+        if op == "add_turn" and len(args) > 3 and isinstance(args[3], str):
+            args = (*args[:3], datetime.datetime.fromisoformat(args[3]))
+        getattr(self, op)(*args)
+
+    def _touch(self, *sections: str):
+        self.version += 1
+        for section in sections:
+            self._section_versions[section] += 1
+
+    def _offer_sections(self, offered_by: str, *statuses: str) -> Tuple[str, ...]:
+        if offered_by == "candidate":
+            return ("last_candidate_offer",)
+        if offered_by == "agent":
+            if "rejected" in statuses:
+                return ("last_agent_offer", "rejected_agent_offers")
+            return ("last_agent_offer",)
+        return ()
+
+    def get_cached_context(self, sections: Tuple[str, ...], render: Callable[[], str]) -> str:
+        versions = tuple(self._section_versions[section] for section in sections)
+        cached = self._context_cache.get(sections)
+        if cached is not None and cached[0] == versions:
+            return cached[1]
+        text = render()
+        self._context_cache[sections] = (versions, text)
+        return text
+
+    def get_last_offer_details(self, offered_by: Optional[str] = None) -> Optional[Tuple[int, Dict[str, Any], str]]:
+        offers = self._offers_by_party.get(offered_by)
+        if not offers:
+            return None
+        return self._offer_entry(offers[-1])
+
+    def get_offers_by_status(self, status: str, offered_by: Optional[str] = None, limit: Optional[int] = None) -> List[Tuple[int, Dict[str, Any], str]]:
+        offers = self._offers_by_party_status.get((offered_by, status))
+        if not offers:
+            return []
+        start = 0 if limit is None else max(len(offers) - limit, 0)
+        return [self._offer_entry(key) for key in reversed(offers[start:])]
+
+    def count_offers_by_status(self, status: str, offered_by: Optional[str] = None) -> int:
+        return len(self._offers_by_party_status.get((offered_by, status), ()))
+
+    def find_similar_offer(self, details: Dict[str, Any], status: str = "rejected", offered_by: str = "agent",
+                           tolerance: Optional[float] = None) -> Optional[Tuple[int, Dict[str, Any], str]]:
+        """
+        The `offered_by` offer with `status` closest in base to `details`: same perk set and
+        bonus, base within `tolerance` (a fraction of the base; SIMILAR_OFFER_TOLERANCE by
+        default). Ties go to the lower base, then the newer offer. A bisect into the offers
+        sharing the perk set and bonus, then a walk outwards to the nearest base in range.
+        """
+        shape = offer_shape(details)
+        if shape is None:
+            return None
+        base, bonus, perk_set = shape
+        bucket = self._offers_by_shape.get(_shape_bucket(offered_by, status, shape))
+        if not bucket:
+            return None
+        margin = int(abs(base) * (SIMILAR_OFFER_TOLERANCE if tolerance is None else tolerance))
+        above = bisect_left(bucket, (base + 1,))
+        below = above - 1
+        while True:
+            below_gap = base - bucket[below][0] if below >= 0 else None
+            above_gap = bucket[above][0] - base if above < len(bucket) else None
+            if below_gap is not None and below_gap > margin:
+                below, below_gap = -1, None
+            if above_gap is not None and above_gap > margin:
+                above, above_gap = len(bucket), None
+            if below_gap is None and above_gap is None:
+                return None
+            if above_gap is None or (below_gap is not None and below_gap <= above_gap):
+                entry = self._offer_entry(bucket[below][1])
+                below -= 1
+            else:
+                entry = self._offer_entry(bucket[above][1])
+                above += 1
+            # Always true but for unhashable bonuses, which share a bucket by repr
+            if entry[1].get("bonus") == bonus:
+                return entry
+
+    def get_offer_span(self, offered_by: Optional[str], up_to_turn: int) -> Tuple[int, Optional[Tuple[int, Dict[str, Any], str]], Optional[Tuple[int, Dict[str, Any], str]]]:
+        """(count, first, last) of the offers made in turns 1..up_to_turn, without walking them."""
+        offers = self._offers_by_party.get(offered_by) or []
+        end = bisect_left(offers, (up_to_turn + 1,))
+        if end == 0:
+            return 0, None, None
+        return end, self._offer_entry(offers[0]), self._offer_entry(offers[end - 1])
+
+
+class NegotiationKnowledgeGraph(KnowledgeGraphBase):
     def __init__(self, session_id: str, candidate_id: str = "candidate"):
         self.graph = nx.DiGraph()
         self.session_id = session_id
@@ -13,7 +269,14 @@ class NegotiationKnowledgeGraph:
         self.graph.add_node(session_id, type="NegotiationSession", start_time=datetime.datetime.now())
         self.graph.add_node(candidate_id, type="Candidate")
         self.graph.add_edge(session_id, candidate_id, type="PARTICIPANT")
-        self.turn_count = 0
+        self._init_indexes()
+        # Offer node id -> its key in the offer indexes
+        self._offer_keys: Dict[str, Tuple[int, int, str]] = {}
+
+    def _indexed_offers(self) -> Iterator[Tuple[Tuple[int, int, str], str, str]]:
+        for offer_node_id, key in self._offer_keys.items():
+            data = self.graph.nodes[offer_node_id]
+            yield key, data["offered_by"], data["status"]
 
     def _get_turn_node_id(self, turn_number: int) -> str:
         return f"turn_{turn_number}"
@@ -27,7 +290,13 @@ class NegotiationKnowledgeGraph:
     def _get_perk_node_id(self, perk_name: str) -> str:
         return f"perk_{perk_name.lower().replace(' ', '_')}"
 
-    def add_turn(self, candidate_message: str, agent_response: str, current_subjective_limit: int) -> int:
+    def _offer_entry(self, key: Tuple[int, int, str]) -> Tuple[int, Dict[str, Any], str]:
+        turn_number, _, node_id = key
+        return (turn_number, self.graph.nodes[node_id]["details"], node_id)
+
+    def add_turn(self, candidate_message: str, agent_response: str, current_subjective_limit: int, timestamp: Optional[datetime.datetime] = None) -> int:
+        timestamp = timestamp or datetime.datetime.now()
+        self._record("add_turn", candidate_message, agent_response, current_subjective_limit, timestamp.isoformat())
         self.turn_count += 1
         turn_node_id = self._get_turn_node_id(self.turn_count)
         limit_node_id = self._get_limit_node_id(self.turn_count)
@@ -37,7 +306,7 @@ class NegotiationKnowledgeGraph:
                             turn_number=self.turn_count, 
                             candidate_message=candidate_message,
                             agent_response=agent_response,
-                            timestamp=datetime.datetime.now())
+                            timestamp=timestamp)
         
         self.graph.add_node(limit_node_id,
                             type="Limit",
@@ -50,7 +319,8 @@ class NegotiationKnowledgeGraph:
         if self.turn_count > 1:
             prev_turn_node_id = self._get_turn_node_id(self.turn_count - 1)
             self.graph.add_edge(prev_turn_node_id, turn_node_id, type="PRECEDES")
-            
+
+        self._touch()
         return self.turn_count
 
     def add_offer(self, turn_number: int, offer_details: Dict[str, Any], offered_by: str, status: str = "proposed") -> Optional[str]:
@@ -60,7 +330,15 @@ class NegotiationKnowledgeGraph:
         if not self.graph.has_node(turn_node_id):
             print(f"Warning: Turn node {turn_node_id} not found for adding offer.")
             return None
-            
+        self._record("add_offer", turn_number, offer_details, offered_by, status)
+
+        previous_status = None
+        if offer_node_id in self._offer_keys:
+            previous = self.graph.nodes[offer_node_id]
+            previous_status = previous["status"]
+            self._unindex_offer(self._offer_keys[offer_node_id], previous["offered_by"], previous_status)
+            del self._offer_keys[offer_node_id]
+
         self.graph.add_node(offer_node_id,
                             type="Offer",
                             details=offer_details, 
@@ -69,6 +347,11 @@ class NegotiationKnowledgeGraph:
                             turn_number=turn_number)
         
         self.graph.add_edge(turn_node_id, offer_node_id, type="CONTAINS_OFFER")
+
+        if isinstance(offer_details, dict):
+            self._offer_seq += 1
+            self._offer_keys[offer_node_id] = (turn_number, -self._offer_seq, offer_node_id)
+            self._index_offer(self._offer_keys[offer_node_id], offered_by, status)
         
         if offered_by == "agent":
             agent_response_node = f"agent_response_{turn_number}"
@@ -76,12 +359,26 @@ class NegotiationKnowledgeGraph:
                  self.graph.add_node(agent_response_node, type="AgentResponse", turn=turn_number)
                  self.graph.add_edge(turn_node_id, agent_response_node, type="HAS_RESPONSE")
             self.graph.add_edge(agent_response_node, offer_node_id, type="JUSTIFIES")
-            
+
+        self._touch(*self._offer_sections(offered_by, status, previous_status))
+        self._dirty_summary(turn_number)
         return offer_node_id
 
     def update_offer_status(self, offer_node_id: str, status: str):
         if self.graph.has_node(offer_node_id) and self.graph.nodes[offer_node_id].get("type") == "Offer":
-            self.graph.nodes[offer_node_id]["status"] = status
+            self._record("update_offer_status", offer_node_id, status)
+            offer_data = self.graph.nodes[offer_node_id]
+            previous_status = offer_data["status"]
+            if offer_node_id in self._offer_keys and previous_status != status:
+                key = self._offer_keys[offer_node_id]
+                self._unindex_offer(key, offer_data["offered_by"], previous_status, by_party=False)
+                self._index_offer(key, offer_data["offered_by"], status, by_party=False)
+            offer_data["status"] = status
+            if previous_status != status:
+                # The candidate-offer context doesn't show status, so only agent offers dirty a section
+                agent_offer = offer_data["offered_by"] == "agent"
+                self._touch(*(self._offer_sections("agent", status, previous_status) if agent_offer else ()))
+            self._dirty_summary(offer_data.get("turn_number"))
             if status == "rejected":
                  self.graph.add_edge(self.candidate_id, offer_node_id, type="REJECTED")
             elif status == "accepted":
@@ -91,11 +388,32 @@ class NegotiationKnowledgeGraph:
 
     def add_candidate_preference(self, perk_name: str):
         perk_node_id = self._get_perk_node_id(perk_name)
+        # Avoid adding duplicate preference edges
+        if self.graph.has_edge(self.candidate_id, perk_node_id):
+            return
+        self._record("add_candidate_preference", perk_name)
         if not self.graph.has_node(perk_node_id):
             self.graph.add_node(perk_node_id, type="Perk", name=perk_name)
-        # Avoid adding duplicate preference edges
-        if not self.graph.has_edge(self.candidate_id, perk_node_id):
-            self.graph.add_edge(self.candidate_id, perk_node_id, type="PREFERS")
+        self.graph.add_edge(self.candidate_id, perk_node_id, type="PREFERS")
+        self._touch("preferences")
+
+    def set_agent_response(self, turn_number: int, agent_response: str):
+        turn_node_id = self._get_turn_node_id(turn_number)
+        if not self.graph.has_node(turn_node_id):
+            print(f"Warning: Turn node {turn_node_id} not found for setting agent response.")
+            return
+        self._record("set_agent_response", turn_number, agent_response)
+        self.graph.nodes[turn_node_id]["agent_response"] = agent_response
+        self._dirty_summary(turn_number)
+
+    def approx_memory_bytes(self) -> int:
+        # Rough per-node/per-edge cost of the networkx dict-of-dicts layout, for memory caps
+        return 2_500 + 500 * self.graph.number_of_nodes() + 200 * self.graph.number_of_edges()
+
+    def get_offer_status(self, offer_node_id: str) -> Optional[str]:
+        if not self.graph.has_node(offer_node_id) or self.graph.nodes[offer_node_id].get("type") != "Offer":
+            return None
+        return self.graph.nodes[offer_node_id].get("status", "proposed")
 
     def get_candidate_preferences(self) -> List[str]:
         preferences = []
@@ -106,31 +424,12 @@ class NegotiationKnowledgeGraph:
                         preferences.append(self.graph.nodes[target].get("name", "Unknown Perk"))
         return preferences
 
-    def get_last_offer_details(self, offered_by: Optional[str] = None) -> Optional[Tuple[int, Dict[str, Any], str]]:
-        offers = []
-        for node, data in self.graph.nodes(data=True):
-            if data.get("type") == "Offer":
-                if offered_by is None or data.get("offered_by") == offered_by:
-                    details = data.get("details")
-                    if isinstance(details, dict):
-                         offers.append((data.get("turn_number", 0), details, node))
-        
-        if not offers:
+    def get_turn_messages(self, turn_number: int) -> Optional[Tuple[str, str]]:
+        turn_node_id = self._get_turn_node_id(turn_number)
+        if not self.graph.has_node(turn_node_id):
             return None
-        
-        offers.sort(key=lambda x: x[0], reverse=True)
-        return offers[0]
-        
-    def get_offers_by_status(self, status: str, offered_by: Optional[str] = None) -> List[Tuple[int, Dict[str, Any], str]]:
-        matching_offers = []
-        for node, data in self.graph.nodes(data=True):
-            if data.get("type") == "Offer" and data.get("status") == status:
-                if offered_by is None or data.get("offered_by") == offered_by:
-                    details = data.get("details")
-                    if isinstance(details, dict):
-                        matching_offers.append((data.get("turn_number", 0), details, node))
-        matching_offers.sort(key=lambda x: x[0], reverse=True)
-        return matching_offers
+        data = self.graph.nodes[turn_node_id]
+        return data.get("candidate_message", ""), data.get("agent_response", "")
 
     def get_current_limit(self) -> Optional[int]:
          if self.turn_count == 0:
@@ -148,48 +447,43 @@ class NegotiationKnowledgeGraph:
                      return prev_limit_amount
          return None
 
-    def get_negotiation_summary(self) -> str:
-        summary = f"Negotiation Summary (Session: {self.session_id}, Turns: {self.turn_count}):\n"
-        prefs = self.get_candidate_preferences()
-        if prefs:
-            summary += f"Candidate Preferences: {', '.join(prefs)}\n"
-            
-        turns = sorted([ (data["turn_number"], node_id) 
-                         for node_id, data in self.graph.nodes(data=True) 
-                         if data.get("type") == "Turn"], key=lambda x: x[0])
-
-        for turn_num, turn_node_id in turns:
-            turn_data = self.graph.nodes[turn_node_id]
-            summary += f"\nTurn {turn_num}:\n"
-            summary += f"  Candidate: {turn_data.get('candidate_message', 'N/A')}\n"
-            summary += f"  Agent: {turn_data.get('agent_response', 'N/A')}\n"
-            
-            limit = "N/A"
-            limit_node_id = self._get_limit_node_id(turn_num)
-            if self.graph.has_node(limit_node_id):
-                limit = self.graph.nodes[limit_node_id].get("amount", "N/A")
-            summary += f"  Agent Limit for this turn: ${limit}\n"
-
-            offers_in_turn = []
-            for neighbor in self.graph.successors(turn_node_id):
+    def export_rows(self) -> Tuple[List[Any], List[float], List[Tuple[int, str, str, Any]]]:
+        limits: List[Any] = [None] * self.turn_count
+        timestamps = [0.0] * self.turn_count
+        offers = []
+        # Node insertion order: offers come out in the order they were first made
+        for _, data in self.graph.nodes(data=True):
+            node_type = data.get("type")
+            if node_type == "Offer":
+                offers.append((data["turn_number"], data["offered_by"], data["status"], data["details"]))
+            elif node_type == "Limit":
+                limits[data["turn_number"] - 1] = data["amount"]
+            elif node_type == "Turn":
+                timestamps[data["turn_number"] - 1] = data["timestamp"].timestamp()
+        return limits, timestamps, offers
+
+    def _summary_turn(self, turn_number: int) -> Tuple[str, str]:
+        turn_node_id = self._get_turn_node_id(turn_number)
+        turn_data = self.graph.nodes[turn_node_id]
+        limit = "N/A"
+        limit_node_id = self._get_limit_node_id(turn_number)
+        if self.graph.has_node(limit_node_id):
+            limit = self.graph.nodes[limit_node_id].get("amount", "N/A")
+
+        offers = []
+        for neighbor, edge_data in self.graph.succ[turn_node_id].items():
+            if edge_data.get("type") == "CONTAINS_OFFER":
                 neighbor_data = self.graph.nodes[neighbor]
-                edge_data = self.graph.get_edge_data(turn_node_id, neighbor)
-                if edge_data.get("type") == "CONTAINS_OFFER":
-                    offer_details = neighbor_data.get("details", {})
-                    offered_by = neighbor_data.get("offered_by", "unknown")
-                    status = neighbor_data.get("status", "proposed")
-                    offers_in_turn.append(f"  {offered_by.capitalize()} Offer ({status}): {json.dumps(offer_details)}")
-            
-            if offers_in_turn:
-                summary += "\n".join(offers_in_turn) + "\n"
-                 
-        return summary
+                offers.append((neighbor_data.get("offered_by", "unknown"), neighbor_data.get("status", "proposed"), neighbor_data.get("details", {})))
+        return summary_turn(turn_number, turn_data.get("candidate_message", "N/A"), turn_data.get("agent_response", "N/A"), limit, offers)
 
     def add_similar_offer_relation(self, offer_node_id_1: str, offer_node_id_2: str):
         if self.graph.has_node(offer_node_id_1) and self.graph.has_node(offer_node_id_2):
             if self.graph.nodes[offer_node_id_1].get("type") == "Offer" and self.graph.nodes[offer_node_id_2].get("type") == "Offer":
                  # Avoid self-loops and duplicate edges
-                 if offer_node_id_1 != offer_node_id_2 and not self.graph.has_edge(offer_node_id_1, offer_node_id_2, key="SIMILAR_TO") and not self.graph.has_edge(offer_node_id_2, offer_node_id_1, key="SIMILAR_TO"):
+                 # (offer-to-offer edges are only ever SIMILAR_TO, so any edge between them is one)
+                 if offer_node_id_1 != offer_node_id_2 and not self.graph.has_edge(offer_node_id_1, offer_node_id_2) and not self.graph.has_edge(offer_node_id_2, offer_node_id_1):
+                     self._record("add_similar_offer_relation", offer_node_id_1, offer_node_id_2)
                      self.graph.add_edge(offer_node_id_1, offer_node_id_2, type="SIMILAR_TO")
             else:
                  print(f"Warning: One or both nodes ({offer_node_id_1}, {offer_node_id_2}) are not Offer nodes.")
@@ -199,14 +493,28 @@ class NegotiationKnowledgeGraph:
     def get_similar_offers(self, offer_node_id: str) -> List[str]:
         similar = []
         if self.graph.has_node(offer_node_id) and self.graph.nodes[offer_node_id].get("type") == "Offer":
-            # Check both incoming and outgoing similarity edges
-            for u, v, data in self.graph.edges(data=True):
-                if data.get("type") == "SIMILAR_TO":
-                    if u == offer_node_id:
-                        similar.append(v)
-                    elif v == offer_node_id:
-                        similar.append(u)
-        return list(set(similar)) # Return unique list
+            # Both directions, read from the node's own adjacency rather than every edge in the graph
+            for adjacency in (self.graph.succ[offer_node_id], self.graph.pred[offer_node_id]):
+                for other, data in adjacency.items():
+                    if data.get("type") == "SIMILAR_TO":
+                        similar.append(other)
+        return similar
+
+KG_BACKENDS = ("networkx", "compact")
+
+def make_knowledge_graph(session_id: str, candidate_id: str = "candidate", backend: Optional[str] = None) -> KnowledgeGraphBase:
+    """
+    The KG for a new session. `backend` is "networkx" (NegotiationKnowledgeGraph) or
+    "compact" (compact_kg.CompactNegotiationKnowledgeGraph, same API in far less memory);
+    it defaults to NEGOTIATION_KG_BACKEND, else "networkx".
+    """
+    backend = backend or os.getenv("NEGOTIATION_KG_BACKEND") or "networkx"
+    if backend == "networkx":
+        return NegotiationKnowledgeGraph(session_id, candidate_id)
+    if backend == "compact":
+        from compact_kg import CompactNegotiationKnowledgeGraph
+        return CompactNegotiationKnowledgeGraph(session_id, candidate_id)
+    raise ValueError(f"Unsupported KG backend: {backend} (expected one of {', '.join(KG_BACKENDS)})")
 
 # Example Usage (for testing)
 if __name__ == "__main__":
@@ -0,0 +1,466 @@
+# negotiation_session.py
+# Per-session negotiation state and turn logic shared by the API entry points
+
+from negotiation_bot_kg import conversation, history_store, format_history, prompt_layout, extract_preferences, get_dynamic_context_from_kg, INITIAL_SUBJECTIVE_LIMIT, TRUE_MAX_SALARY
+from negotiation_kg import make_knowledge_graph
+from offer_extraction import scan_message
+from response_cache import ResponseCache
+from llm_hedging import HedgedCalls
+from fast_path import FastPath
+from offer_export import OfferExport
+from turn_metrics import metrics as turn_metrics
+from log_pipeline import set_log_context
+from collections import OrderedDict
+import asyncio
+import logging
+import json
+import time
+
+class PreparedTurn:
+    __slots__ = ("user_input", "scan", "inputs", "reply", "offer")
+
+    def __init__(self, user_input, scan, inputs, reply=None, offer=None):
+        self.user_input = user_input
+        self.scan = scan
+        self.inputs = inputs
+        self.reply = reply
+        # Structured offer in the agent's reply (the accepted one when the turn concluded a deal)
+        self.offer = offer
+
+    def summary(self):
+        return {"reply": self.reply, "offer": self.offer or None, "candidateOffer": self.scan.offer or None}
+
+# Session fields written to the journal after every turn, next to the KG ops
+JOURNALED_FIELDS = ("current_turn", "subjective_limit", "last_agent_offer_node_id", "last_agent_offer_details")
+
+# Replies kept per session for requests retried with the same request id
+REPLAYABLE_REPLIES = 16
+
+# Shared by every session in the process; None unless NEGOTIATION_RESPONSE_CACHE is set
+response_cache = ResponseCache.from_env()
+
+def response_cache_stats():
+    return response_cache.stats() if response_cache is not None else None
+
+# Rule-based replies that skip the model; None unless NEGOTIATION_FAST_PATH is set
+fast_path = FastPath.from_env()
+
+def fast_path_stats():
+    return fast_path.stats() if fast_path is not None else None
+
+# Concluded sessions appended to columnar files for analytics; None unless NEGOTIATION_OFFER_EXPORT_DIR is set
+offer_export = OfferExport.from_env()
+
+def offer_export_stats():
+    return offer_export.stats() if offer_export is not None else None
+
+# Hedged model calls for get_agent_reply/aget_agent_reply; None unless NEGOTIATION_HEDGE is set
+llm_hedging = HedgedCalls.from_env()
+
+def hedging_stats():
+    return llm_hedging.stats() if llm_hedging is not None else None
+
+class NegotiationSessionState:
+    def __init__(self, session_id, journal=None, kg_backend=None):
+        self.session_id = session_id
+        # kg_backend: "networkx" or "compact"; defaults to NEGOTIATION_KG_BACKEND
+        self.kg = make_knowledge_graph(session_id, backend=kg_backend)
+        self.current_turn = 0
+        self.subjective_limit = INITIAL_SUBJECTIVE_LIMIT
+        self.last_agent_offer_node_id = None
+        self.last_agent_offer_details = None
+        # Optional SessionJournal; journal_seq counts the records written for this session
+        self.journal = journal
+        self.journal_seq = 0
+        # request id -> PreparedTurn.summary() of the turn it produced, oldest first
+        self.recent_replies = OrderedDict()
+        # NegotiationSummary as of the last finished turn, once someone has asked for the
+        # summary (see watch_summary); None keeps unwatched sessions from paying for it
+        self.summary_snapshot = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["journal"] = None
+        state["summary_snapshot"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("recent_replies", OrderedDict())
+        self.__dict__.setdefault("summary_snapshot", None)
+
+    def approx_memory_bytes(self):
+        return self.kg.approx_memory_bytes()
+
+    def apply_journal_record(self, seq, ops, fields):
+        for op in ops:
+            self.kg.apply_journal_op(*op)
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.journal_seq = seq
+
+    def watch_summary(self):
+        """The current summary; from now on every turn publishes a fresh one to summary_snapshot."""
+        self.summary_snapshot = self.kg.negotiation_summary()
+        return self.summary_snapshot
+
+    def _publish_summary(self):
+        if self.summary_snapshot is not None:
+            self.summary_snapshot = self.kg.negotiation_summary()
+
+    def _take_journal_record(self):
+        ops, self.kg.journal_ops = self.kg.journal_ops, None
+        self.journal_seq += 1
+        return (self.session_id, self.journal_seq, ops, {name: getattr(self, name) for name in JOURNALED_FIELDS})
+
+    def _llm_config(self):
+        # The KG may have been reloaded since the last turn (spill, backend refresh)
+        history_store.bind(self.session_id, self.kg)
+        return {"configurable": {"session_id": self.session_id}}
+
+    def _invoke(self, turn):
+        config = self._llm_config()
+        if llm_hedging is None:
+            return conversation.invoke(turn.inputs, config=config)
+        return llm_hedging.invoke(lambda: conversation.invoke(turn.inputs, config=config))
+
+    async def _ainvoke(self, turn):
+        config = self._llm_config()
+        if llm_hedging is None:
+            return await conversation.ainvoke(turn.inputs, config=config)
+        return await llm_hedging.ainvoke(lambda: conversation.ainvoke(turn.inputs, config=config))
+
+    def _cache_key(self, turn):
+        # The history window is rendered as the chain will render it for this call
+        history_store.bind(self.session_id, self.kg)
+        history = format_history(history_store.get(self.session_id).messages)
+        return response_cache.key(turn.inputs, self.current_turn, history)
+
+    def _instant_reply(self, turn):
+        # A fast-path rule, then the response cache; None means the turn needs the model
+        if fast_path is not None:
+            reply = fast_path.reply(turn.user_input, turn.scan, self.subjective_limit, self.kg, self.last_agent_offer_details)
+            if reply is not None:
+                turn_metrics.inc("fast_path_replies")
+                return reply
+        if response_cache is None:
+            return None
+        return response_cache.get(self._cache_key(turn))
+
+    def _record_llm_reply(self, turn, reply, started):
+        elapsed = time.perf_counter() - started
+        turn_metrics.observe("llm", elapsed)
+        if fast_path is not None:
+            fast_path.record_llm_call(elapsed)
+        if response_cache is not None:
+            response_cache.put(self._cache_key(turn), reply, elapsed)
+
+    def _record_error(self, reply):
+        # The reply is only set once the model call succeeded, so anything later is a KG update failure
+        turn_metrics.inc("llm_errors" if reply is None else "turn_errors")
+
+    def replayed_turn(self, request_id):
+        """The summary of the turn already produced for `request_id`, if any."""
+        if request_id is None:
+            return None
+        return self.recent_replies.get(request_id)
+
+    def _remember_turn(self, request_id, turn):
+        # Failed turns are not remembered, so a retry runs them again
+        if request_id is None or turn.reply is None:
+            return
+        self.recent_replies[request_id] = turn.summary()
+        while len(self.recent_replies) > REPLAYABLE_REPLIES:
+            self.recent_replies.popitem(last=False)
+
+    def get_agent_reply(self, user_input, request_id=None):
+        # A retried request gets the reply its first attempt produced, without another LLM call
+        replayed = self.replayed_turn(request_id)
+        if replayed is not None:
+            return replayed["reply"]
+
+        started_turn = time.perf_counter()
+        if self.journal is not None:
+            self.kg.journal_ops = []
+        try:
+            turn = self.prepare_turn(user_input)
+            if turn.reply is None:
+                reply = None
+                try:
+                    reply = self._instant_reply(turn)
+                    if reply is None:
+                        started = time.perf_counter()
+                        result = self._invoke(turn)
+                        prompt_layout.record_usage(getattr(result, "usage_metadata", None))
+                        reply = result.content
+                        self._record_llm_reply(turn, reply, started)
+                    self.finish_turn(turn, reply)
+                except Exception as e:
+                    logging.error(f"Error during invocation: {e}")
+                    self._record_error(reply)
+                    return f"Error: {str(e)}"
+            self._remember_turn(request_id, turn)
+            return turn.reply
+        finally:
+            self._publish_summary()
+            if self.journal is not None:
+                # Blocks until the record is on disk, so a reply is never sent for a lost turn
+                with turn_metrics.stage("journal"):
+                    self.journal.append(*self._take_journal_record())
+            turn_metrics.observe("turn", time.perf_counter() - started_turn)
+
+    async def aget_agent_reply(self, user_input, request_id=None):
+        # Same turn as get_agent_reply, but the LLM round trip and the journal fsync are
+        # awaited instead of holding a thread
+        replayed = self.replayed_turn(request_id)
+        if replayed is not None:
+            return replayed["reply"]
+
+        started_turn = time.perf_counter()
+        if self.journal is not None:
+            self.kg.journal_ops = []
+        try:
+            turn = self.prepare_turn(user_input)
+            if turn.reply is None:
+                reply = None
+                try:
+                    reply = self._instant_reply(turn)
+                    if reply is None:
+                        started = time.perf_counter()
+                        result = await self._ainvoke(turn)
+                        prompt_layout.record_usage(getattr(result, "usage_metadata", None))
+                        reply = result.content
+                        self._record_llm_reply(turn, reply, started)
+                    self.finish_turn(turn, reply)
+                except Exception as e:
+                    logging.error(f"Error during invocation: {e}")
+                    self._record_error(reply)
+                    return f"Error: {str(e)}"
+            self._remember_turn(request_id, turn)
+            return turn.reply
+        finally:
+            self._publish_summary()
+            if self.journal is not None:
+                with turn_metrics.stage("journal"):
+                    await asyncio.to_thread(self.journal.append, *self._take_journal_record())
+            turn_metrics.observe("turn", time.perf_counter() - started_turn)
+
+    def stream_agent_reply(self, user_input, request_id=None):
+        """
+        Streaming variant of get_agent_reply. Yields ("token", {"text": ...}) events while
+        the model generates, then ("done", {"reply", "offer", "candidateOffer"}) once the
+        reply has been recorded in the KG, or ("error", {"error": ...}) if the call failed.
+        """
+        replayed = self.replayed_turn(request_id)
+        if replayed is not None:
+            yield "token", {"text": replayed["reply"]}
+            yield "done", replayed
+            return
+
+        started_turn = time.perf_counter()
+        if self.journal is not None:
+            self.kg.journal_ops = []
+        try:
+            turn = self.prepare_turn(user_input)
+            if turn.reply is None:
+                chunks = []
+                reply = None
+                try:
+                    reply = self._instant_reply(turn)
+                    if reply is not None:
+                        yield "token", {"text": reply}
+                    else:
+                        started = time.perf_counter()
+                        for chunk in conversation.stream(turn.inputs, config=self._llm_config()):
+                            if chunk.content:
+                                chunks.append(chunk.content)
+                                yield "token", {"text": chunk.content}
+                        reply = "".join(chunks)
+                        self._record_llm_reply(turn, reply, started)
+                    self.finish_turn(turn, reply)
+                except Exception as e:
+                    logging.error(f"Error during streaming invocation: {e}")
+                    self._record_error(reply)
+                    yield "error", {"error": str(e)}
+                    return
+            else:
+                yield "token", {"text": turn.reply}
+            self._remember_turn(request_id, turn)
+            yield "done", turn.summary()
+        finally:
+            self._publish_summary()
+            if self.journal is not None:
+                with turn_metrics.stage("journal"):
+                    self.journal.append(*self._take_journal_record())
+            turn_metrics.observe("turn", time.perf_counter() - started_turn)
+
+    async def astream_agent_reply(self, user_input, request_id=None):
+        # Async counterpart of stream_agent_reply for the ASGI app
+        replayed = self.replayed_turn(request_id)
+        if replayed is not None:
+            yield "token", {"text": replayed["reply"]}
+            yield "done", replayed
+            return
+
+        started_turn = time.perf_counter()
+        if self.journal is not None:
+            self.kg.journal_ops = []
+        try:
+            turn = self.prepare_turn(user_input)
+            if turn.reply is None:
+                chunks = []
+                reply = None
+                try:
+                    reply = self._instant_reply(turn)
+                    if reply is not None:
+                        yield "token", {"text": reply}
+                    else:
+                        started = time.perf_counter()
+                        async for chunk in conversation.astream(turn.inputs, config=self._llm_config()):
+                            if chunk.content:
+                                chunks.append(chunk.content)
+                                yield "token", {"text": chunk.content}
+                        reply = "".join(chunks)
+                        self._record_llm_reply(turn, reply, started)
+                    self.finish_turn(turn, reply)
+                except Exception as e:
+                    logging.error(f"Error during streaming invocation: {e}")
+                    self._record_error(reply)
+                    yield "error", {"error": str(e)}
+                    return
+            else:
+                yield "token", {"text": turn.reply}
+            self._remember_turn(request_id, turn)
+            yield "done", turn.summary()
+        finally:
+            self._publish_summary()
+            if self.journal is not None:
+                with turn_metrics.stage("journal"):
+                    await asyncio.to_thread(self.journal.append, *self._take_journal_record())
+            turn_metrics.observe("turn", time.perf_counter() - started_turn)
+
+    def prepare_turn(self, user_input):
+        """
+        Everything before the LLM call: acceptance handling, preference extraction and the
+        new concession limit. Returns a PreparedTurn whose `reply` is already set when the
+        turn concluded without needing the model.
+        """
+        self.current_turn += 1
+        turn_metrics.inc("turns")
+        # Cleared again when the session is released (SessionStore.session)
+        set_log_context(self.session_id, self.current_turn)
+
+        # Logic for acceptance handling (from negotiation_bot_kg.py)
+        with turn_metrics.stage("extract"):
+            scan = scan_message(user_input)
+        accepted = False
+        if self.last_agent_offer_node_id and scan.accepted:
+            prev_base = self.last_agent_offer_details.get("base") if self.last_agent_offer_details else None
+            user_offer_details = scan.offer
+            user_base = user_offer_details.get("base")
+            
+            if isinstance(prev_base, int) and (user_base is None or user_base == prev_base):
+                accepted = True
+                self.kg.update_offer_status(self.last_agent_offer_node_id, "accepted")
+                self.kg.add_turn(user_input, "Agreement Reached.", self.subjective_limit) 
+                
+                if user_offer_details:
+                    self.kg.add_offer(self.current_turn, user_offer_details, "candidate", status="accepted_trigger")
+                else:
+                    self.kg.add_offer(self.current_turn, {"status_trigger": "acceptance"}, "candidate", status="accepted_trigger")
+                    
+                concluding_reply = f"Great! Then we have a deal based on our last offer: {json.dumps(self.last_agent_offer_details)}. I\'?m thrilled to have you join the team and will follow up with the formal offer letter shortly."
+                self.kg.set_agent_response(self.current_turn, concluding_reply)
+                turn_metrics.inc("acceptances")
+                if offer_export is not None:
+                    try:
+                        offer_export.add(self.kg)
+                    except OSError:
+                        # The session stays buffered; the next flush writes it
+                        logging.exception("Offer export flush failed")
+                logging.info("Deal concluded on the candidate's acceptance",
+                             extra={"candidate": user_input, "agent": concluding_reply, "concluded": True})
+                return PreparedTurn(user_input, scan, None, concluding_reply, self.last_agent_offer_details)
+
+        if accepted:
+            return PreparedTurn(user_input, scan, None, "")
+
+        with turn_metrics.stage("kg_query"):
+            extract_preferences(user_input, self.kg, scan)
+
+            last_candidate_offer_info = self.kg.get_last_offer_details("candidate")
+            rejected_agent_offers_count = self.kg.count_offers_by_status("rejected", "agent")
+            prev_limit_from_kg = self.kg.get_current_limit() or INITIAL_SUBJECTIVE_LIMIT
+
+        if self.current_turn == 1:
+            self.subjective_limit = INITIAL_SUBJECTIVE_LIMIT
+        elif rejected_agent_offers_count == 0 and last_candidate_offer_info:
+            _, candidate_offer, _ = last_candidate_offer_info
+            candidate_base = candidate_offer.get("base")
+            if isinstance(candidate_base, int):
+                midpoint = (prev_limit_from_kg + candidate_base) // 2
+                self.subjective_limit = min(TRUE_MAX_SALARY, midpoint)
+            else:
+                self.subjective_limit = min(TRUE_MAX_SALARY, int(prev_limit_from_kg * 1.05))
+        elif rejected_agent_offers_count == 1:
+            self.subjective_limit = min(TRUE_MAX_SALARY, int(prev_limit_from_kg * 1.08))
+        else: 
+            self.subjective_limit = TRUE_MAX_SALARY
+            
+        self.subjective_limit = max(self.subjective_limit, prev_limit_from_kg)
+
+        with turn_metrics.stage("context"):
+            kg_context_for_prompt = get_dynamic_context_from_kg(self.kg)
+
+        inputs = {
+            "message": user_input,
+            "subjective_limit": self.subjective_limit,
+            "kg_context": kg_context_for_prompt
+        }
+        return PreparedTurn(user_input, scan, inputs)
+
+    def finish_turn(self, turn, reply):
+        """Records the model's reply in the KG and tracks the offer it contains."""
+        with turn_metrics.stage("kg_update"):
+            return self._record_reply(turn, reply)
+
+    def _record_reply(self, turn, reply):
+        user_input = turn.user_input
+        candidate_offer_details = turn.scan.offer
+        reply = reply.strip()
+
+        self.kg.add_turn(user_input, reply, self.subjective_limit)
+        # Structured fields let replay_negotiations.py rebuild the session from the JSON log
+        logging.info(f"Turn {self.current_turn} recorded (limit ${self.subjective_limit})", extra={"candidate": user_input, "agent": reply, "limit": self.subjective_limit})
+
+        if candidate_offer_details:
+            self.kg.add_offer(self.current_turn, candidate_offer_details, "candidate")
+            if self.last_agent_offer_node_id and self.kg.get_offer_status(self.last_agent_offer_node_id) == "proposed":
+                self.kg.update_offer_status(self.last_agent_offer_node_id, "rejected")
+
+        agent_offer_details = scan_message(reply).offer
+        turn.reply = reply
+        turn.offer = agent_offer_details
+        if agent_offer_details:
+            agent_base = agent_offer_details.get("base")
+            if isinstance(agent_base, int) and agent_base <= self.subjective_limit:
+                new_agent_offer_node_id = self.kg.add_offer(self.current_turn, agent_offer_details, "agent")
+                self.last_agent_offer_node_id = new_agent_offer_node_id
+                self.last_agent_offer_details = agent_offer_details
+
+                similar = self.kg.find_similar_offer(agent_offer_details, "rejected", "agent")
+                if similar is not None:
+                    self.kg.add_similar_offer_relation(new_agent_offer_node_id, similar[2])
+            elif isinstance(agent_base, int):
+                turn_metrics.inc("offers_over_limit")
+                self.last_agent_offer_node_id = None
+                self.last_agent_offer_details = None
+            else:
+                self.kg.add_offer(self.current_turn, agent_offer_details, "agent")
+                self.last_agent_offer_node_id = None
+                self.last_agent_offer_details = None
+        else:
+            self.last_agent_offer_node_id = None
+            self.last_agent_offer_details = None
+        return reply
+
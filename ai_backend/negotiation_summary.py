@@ -0,0 +1,99 @@
+# negotiation_summary.py
+# Immutable snapshot of a session's negotiation summary, rendered as text or JSON, whole or in chunks
+
+import json
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+FORMATS = {"text": "text/plain; charset=utf-8", "json": "application/json"}
+
+
+def summary_turn(turn_number: int, candidate: str, agent: str, limit: Any,
+                 offers: List[Tuple[str, str, Any]]) -> Tuple[str, str]:
+    """
+    One turn of the summary as (JSON object, text block), both already serialized so polls
+    only join strings; offers are (offered_by, status, details).
+    """
+    entry = {
+        "turn": turn_number,
+        "candidate": candidate,
+        "agent": agent,
+        "limit": limit,
+        "offers": [{"offered_by": offered_by, "status": status, "details": details} for offered_by, status, details in offers],
+    }
+    text = f"\nTurn {turn_number}:\n  Candidate: {candidate}\n  Agent: {agent}\n  Agent Limit for this turn: ${limit}\n"
+    if offers:
+        text += "\n".join(f"  {offered_by.capitalize()} Offer ({status}): {json.dumps(details)}"
+                          for offered_by, status, details in offers) + "\n"
+    return json.dumps(entry, default=str), text
+
+
+class NegotiationSummary:
+    """
+    What get_negotiation_summary reports, as of one KG version. The per-turn parts are shared
+    with the KG's summary cache (they are never modified, only replaced), so taking a snapshot
+    copies references rather than text, and it can be rendered after the session has moved on.
+    """
+
+    __slots__ = ("session_id", "turn_count", "version", "preferences", "turns")
+
+    def __init__(self, session_id: str, turn_count: int, version: int, preferences: Sequence[str],
+                 turns: Sequence[Tuple[str, str]]):
+        self.session_id = session_id
+        self.turn_count = turn_count
+        self.version = version
+        self.preferences = tuple(preferences)
+        self.turns = tuple(turns)
+
+    def _from(self, from_turn: int) -> Sequence[Tuple[str, str]]:
+        return self.turns[max(from_turn, 1) - 1:]
+
+    def iter_text(self, from_turn: int = 1) -> Iterator[str]:
+        yield f"Negotiation Summary (Session: {self.session_id}, Turns: {self.turn_count}):\n"
+        if self.preferences:
+            yield f"Candidate Preferences: {', '.join(self.preferences)}\n"
+        for _, text in self._from(from_turn):
+            yield text
+
+    def text(self, from_turn: int = 1) -> str:
+        return "".join(self.iter_text(from_turn))
+
+    def header(self) -> Dict[str, Any]:
+        return {"session_id": self.session_id, "turn_count": self.turn_count, "version": self.version,
+                "preferences": list(self.preferences)}
+
+    def to_dict(self, from_turn: int = 1) -> Dict[str, Any]:
+        return json.loads(self.json(from_turn))
+
+    def iter_json(self, from_turn: int = 1) -> Iterator[str]:
+        """{header fields..., "turns": [...]}, a turn per chunk."""
+        yield json.dumps(self.header(), default=str)[:-1] + ', "turns": ['
+        for index, (entry, _) in enumerate(self._from(from_turn)):
+            yield (", " if index else "") + entry
+        yield "]}"
+
+    def json(self, from_turn: int = 1) -> str:
+        return "".join(self.iter_json(from_turn))
+
+    def render(self, format: str = "text", from_turn: int = 1) -> Iterator[str]:
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported summary format: {format} (expected one of {', '.join(FORMATS)})")
+        return self.iter_json(from_turn) if format == "json" else self.iter_text(from_turn)
+
+
+def parse_summary_request(args) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Reads ?sessionId=...&format=text|json&from_turn=N&stream=1 from a mapping of query
+    parameters. Returns (options, None), or (None, error) for a request to answer with 400.
+    """
+    session_id = args.get("sessionId")
+    if not session_id:
+        return None, "No sessionId provided"
+    format = args.get("format", "text")
+    if format not in FORMATS:
+        return None, f"format must be one of {', '.join(FORMATS)}"
+    try:
+        from_turn = int(args.get("from_turn", 1))
+    except ValueError:
+        return None, "from_turn must be an integer"
+    stream = args.get("stream", "").lower() in ("1", "true", "yes")
+    return {"session_id": session_id, "format": format, "from_turn": from_turn, "stream": stream}, None
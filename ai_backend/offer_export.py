@@ -0,0 +1,270 @@
+# offer_export.py
+# Columnar export of many sessions' turns, limits and offers for analytics: typed arrays
+# appended to one binary file per column, readable with array.fromfile or numpy.fromfile
+
+import atexit
+import json
+import os
+import sys
+import threading
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+FORMAT_VERSION = 1
+# Stored for a missing base/bonus/limit, and for a bonus that is mentioned without an amount
+MISSING = -1
+BONUS_MENTIONED = -2
+
+# table -> ((column, type), ...). Types are array typecodes; "str" is a UTF-8 string column and
+# "list" a list of dictionary codes, both stored Arrow-style as a values file plus the running
+# end offset of each row (row i is values[ends[i - 1]:ends[i]]).
+SCHEMA = {
+    "sessions": (("session_id", "str"), ("turn_count", "i"), ("first_turn", "q"), ("first_offer", "q"), ("concluded", "b")),
+    "turns": (("session", "q"), ("turn", "i"), ("limit", "q"), ("timestamp", "d")),
+    "offers": (("session", "q"), ("turn", "i"), ("party", "b"), ("status", "b"), ("base", "q"), ("bonus", "q"), ("perks", "list")),
+}
+# Dictionary-encoded values: a code is the position in the list; unseen values are appended,
+# so codes already written never change
+DICTIONARIES = {
+    "party": ["candidate", "agent"],
+    "status": ["proposed", "rejected", "accepted", "superseded", "accepted_trigger"],
+    "perk": [],
+}
+_VALUE_TYPES = {"str": "B", "list": "i"}
+
+
+def _dtype(typecode: str) -> str:
+    # The numpy dtype string for an array typecode, e.g. "q" -> "<i8" on a little-endian machine
+    kind = {"b": "i", "i": "i", "q": "i", "d": "f", "B": "u"}[typecode]
+    return f"{'<' if sys.byteorder == 'little' else '>'}{kind}{array(typecode).itemsize}"
+
+
+def _int_or(value: Any, default: int = MISSING) -> int:
+    return value if isinstance(value, int) and not isinstance(value, bool) else default
+
+
+class OfferExport:
+    """
+    Accumulates sessions in typed arrays (add) and appends them to the files in `directory`
+    (flush), every `flush_every` sessions and at exit. The manifest (manifest.json: row
+    counts, numpy dtypes, dictionaries) is replaced after the column files are written, and a
+    reopened export cuts the files back to it, so an interrupted flush loses only that batch.
+
+    Offers keep their base, bonus (BONUS_MENTIONED when given without an amount) and perks
+    (lowercased, dictionary-encoded); messages are left out. Each session's turns and offers
+    are contiguous, starting at its first_turn/first_offer row.
+    """
+
+    def __init__(self, directory: str, flush_every: int = 500):
+        self.directory = directory
+        self.flush_every = flush_every
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.rows = {table: 0 for table in SCHEMA}
+        # Values written so far per str/list column, the base for the next rows' end offsets
+        self.values = {f"{table}.{column}": 0 for table, columns in SCHEMA.items() for column, kind in columns if kind in _VALUE_TYPES}
+        self.dictionaries = {name: list(values) for name, values in DICTIONARIES.items()}
+        self.flushes = 0
+        self._load_manifest()
+        self._codes = {name: {value: code for code, value in enumerate(values)} for name, values in self.dictionaries.items()}
+        self._flushed_rows = dict(self.rows)
+        self._flushed_values = dict(self.values)
+        self._reset_buffers()
+
+    @classmethod
+    def from_env(cls) -> Optional["OfferExport"]:
+        """NEGOTIATION_OFFER_EXPORT_DIR turns the export on; unset leaves it off."""
+        directory = os.getenv("NEGOTIATION_OFFER_EXPORT_DIR")
+        if not directory:
+            return None
+        export = cls(directory, flush_every=int(os.getenv("NEGOTIATION_OFFER_EXPORT_FLUSH", 500)))
+        atexit.register(export.flush)
+        return export
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _files(self, rows: Dict[str, int], values: Dict[str, int]):
+        # (file name, typecode, element count) of every column file at the given row counts
+        for table, columns in SCHEMA.items():
+            for column, kind in columns:
+                name = f"{table}.{column}"
+                if kind in _VALUE_TYPES:
+                    yield f"{name}.ends.bin", "q", rows[table]
+                    yield f"{name}.values.bin", _VALUE_TYPES[kind], values[name]
+                else:
+                    yield f"{name}.bin", kind, rows[table]
+
+    def _truncate(self, rows: Dict[str, int], values: Dict[str, int]):
+        # Cuts the column files back to the given row counts, dropping a partly written batch
+        for name, typecode, count in self._files(rows, values):
+            path = self._path(name)
+            size = count * array(typecode).itemsize
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def _load_manifest(self):
+        path = self._path("manifest.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("format") != FORMAT_VERSION or manifest.get("byteorder") != sys.byteorder:
+                raise ValueError(f"{self.directory} holds an export this version can't append to")
+            self.rows.update(manifest["rows"])
+            self.values.update(manifest["values"])
+            self.dictionaries.update(manifest["dictionaries"])
+        self._truncate(self.rows, self.values)
+
+    def _write_manifest(self):
+        manifest = {
+            "format": FORMAT_VERSION,
+            "byteorder": sys.byteorder,
+            "rows": self.rows,
+            "values": self.values,
+            "dictionaries": self.dictionaries,
+            "columns": {name.rsplit(".", 1)[0]: _dtype(typecode) for name, typecode, _ in self._files(self.rows, self.values)},
+            "missing": MISSING,
+            "bonus_mentioned": BONUS_MENTIONED,
+        }
+        path = self._path("manifest.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def _reset_buffers(self):
+        self._buffers: Dict[str, Any] = {}
+        for table, columns in SCHEMA.items():
+            for column, kind in columns:
+                name = f"{table}.{column}"
+                if kind in _VALUE_TYPES:
+                    self._buffers[f"{name}.ends"] = array("q")
+                    self._buffers[f"{name}.values"] = array(_VALUE_TYPES[kind])
+                else:
+                    self._buffers[name] = array(kind)
+
+    def _code(self, dictionary: str, value: Any) -> int:
+        codes = self._codes[dictionary]
+        if value not in codes:
+            codes[value] = len(self.dictionaries[dictionary])
+            self.dictionaries[dictionary].append(value)
+        return codes[value]
+
+    def _append_values(self, name: str, values):
+        buffer = self._buffers[f"{name}.values"]
+        buffer.extend(values)
+        self.values[name] += len(values)
+        self._buffers[f"{name}.ends"].append(self.values[name])
+
+    def add(self, kg) -> int:
+        """Appends one session's KG (either backend); returns its row in the sessions table."""
+        limits, timestamps, offers = kg.export_rows()
+        turn_count = len(limits)
+        with self._lock:
+            b = self._buffers
+            session = self.rows["sessions"]
+            self._append_values("sessions.session_id", str(kg.session_id).encode("utf-8"))
+            b["sessions.turn_count"].append(turn_count)
+            b["sessions.first_turn"].append(self.rows["turns"])
+            b["sessions.first_offer"].append(self.rows["offers"])
+
+            b["turns.session"].extend(array("q", (session,)) * turn_count)
+            b["turns.turn"].extend(range(1, turn_count + 1))
+            if isinstance(limits, array) and limits.typecode == "q":
+                b["turns.limit"].extend(limits)
+            else:
+                b["turns.limit"].extend([_int_or(limit) for limit in limits])
+            b["turns.timestamp"].extend(timestamps)
+
+            # Column at a time: the per-offer work is a dictionary lookup or two
+            details = [offer[3] if isinstance(offer[3], dict) else {} for offer in offers]
+            b["offers.session"].extend(array("q", (session,)) * len(offers))
+            b["offers.turn"].extend([offer[0] for offer in offers])
+            b["offers.party"].extend([self._code("party", offer[1]) for offer in offers])
+            statuses = [self._code("status", offer[2]) for offer in offers]
+            b["offers.status"].extend(statuses)
+            b["offers.base"].extend([_int_or(offer.get("base")) for offer in details])
+            b["offers.bonus"].extend([MISSING if offer.get("bonus") is None else _int_or(offer["bonus"], BONUS_MENTIONED)
+                                      for offer in details])
+            perk_ends, perk_values = b["offers.perks.ends"], b["offers.perks.values"]
+            for offer in details:
+                perks = offer.get("perks")
+                if perks and isinstance(perks, (list, tuple)):
+                    perk_values.extend([self._code("perk", str(perk).lower()) for perk in perks])
+                    self.values["offers.perks"] += len(perks)
+                perk_ends.append(self.values["offers.perks"])
+            concluded = self._codes["status"]["accepted"] in statuses
+            b["sessions.concluded"].append(concluded)
+
+            self.rows["sessions"] += 1
+            self.rows["turns"] += turn_count
+            self.rows["offers"] += len(offers)
+            if self.rows["sessions"] - self._flushed_rows["sessions"] >= self.flush_every:
+                self._flush()
+        return session
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self.rows == self._flushed_rows:
+            return
+        try:
+            for name, buffer in self._buffers.items():
+                with open(self._path(f"{name}.bin"), "ab") as f:
+                    buffer.tofile(f)
+            self._write_manifest()
+        except OSError:
+            # Keep the batch buffered for the next flush, without the part that made it to disk
+            self._truncate(self._flushed_rows, self._flushed_values)
+            raise
+        self._flushed_rows = dict(self.rows)
+        self._flushed_values = dict(self.values)
+        self._reset_buffers()
+        self.flushes += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "sessions": self.rows["sessions"],
+                "turns": self.rows["turns"],
+                "offers": self.rows["offers"],
+                "buffered_sessions": self.rows["sessions"] - self._flushed_rows["sessions"],
+                "flushes": self.flushes,
+            }
+
+
+def read_export(directory: str) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, List[Any]]]:
+    """
+    (tables, dictionaries) of an export: table -> column -> array, with str columns decoded to
+    lists and list columns as (ends, values) arrays. With numpy, numpy.fromfile(path,
+    dtype=manifest["columns"][name]) reads the same files without a copy through Python.
+    """
+    with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    def load(name: str, typecode: str, count: int) -> array:
+        column = array(typecode)
+        if count:
+            with open(os.path.join(directory, f"{name}.bin"), "rb") as f:
+                column.fromfile(f, count)
+        return column
+
+    tables: Dict[str, Dict[str, Any]] = {}
+    for table, columns in SCHEMA.items():
+        rows = manifest["rows"][table]
+        tables[table] = {}
+        for column, kind in columns:
+            name = f"{table}.{column}"
+            if kind not in _VALUE_TYPES:
+                tables[table][column] = load(name, kind, rows)
+                continue
+            ends = load(f"{name}.ends", "q", rows)
+            values = load(f"{name}.values", _VALUE_TYPES[kind], manifest["values"][name])
+            if kind == "str":
+                data = values.tobytes()
+                tables[table][column] = [data[start:end].decode("utf-8") for start, end in zip([0, *ends[:-1]], ends)]
+            else:
+                tables[table][column] = (ends, values)
+    return tables, manifest["dictionaries"]
@@ -0,0 +1,132 @@
+# Single-pass extraction of offers, preferences and acceptance signals from chat text
+
+import re
+from typing import Dict, Any, List, Tuple
+
+SALARY_MIN = 10_000
+SALARY_MAX = 1_000_000
+
+# The text is lowercased and tokenized once into amounts, words and punctuation marks.
+# Punctuation stays in the token stream, so neighbouring tokens were separated by
+# whitespace only, which is what the multi-word phrases and amount tags require.
+_TOKEN = re.compile(r"\$?(\d{1,3}(?:,\d{3})+|\d+)(k)?\b|([a-z]+(?:'[a-z]+)?|[^\w\s])")
+
+# Words introducing an amount as the base salary ("offering $120k", "base salary of ...")
+_BASE_CONTEXT = frozenset(("offer", "offering", "at", "is", "around", "for"))
+_BASE_OF_CONTEXT = frozenset(("base", "salary"))
+# Words right after an amount that mark it as something other than base salary
+_AMOUNT_TAGS = ("bonus", "relocation", "stock", "year", "month")
+_PERIOD_TAGS = ("year", "month")
+_BONUS_QUALIFIERS = frozenset(("signing", "annual", "performance", "relocation"))
+
+_REMOTE, _WORK, _STOCK, _EQUITY, _RELOCATION, _MOVING, _BONUS, _ACCEPT, _SOUNDS, _LETS, _ILL, _HAPPY = range(12)
+_KEYWORDS = {
+    "remote": _REMOTE, "wfh": _REMOTE, "work": _WORK,
+    "stock": _STOCK, "equity": _EQUITY, "rsu": _EQUITY, "rsus": _EQUITY,
+    "relocation": _RELOCATION, "moving": _MOVING, "bonus": _BONUS,
+    "deal": _ACCEPT, "accept": _ACCEPT, "agree": _ACCEPT, "ok": _ACCEPT,
+    "sounds": _SOUNDS, "let's": _LETS, "lets": _LETS, "i'll": _ILL, "ill": _ILL, "happy": _HAPPY,
+}
+
+
+class MessageScan:
+    __slots__ = ("offer", "preferences", "accepted", "salary_amounts")
+
+    def __init__(self, offer: Dict[str, Any], preferences: List[str], accepted: bool, salary_amounts: int = 0):
+        self.offer = offer
+        self.preferences = preferences
+        self.accepted = accepted
+        # Distinct amounts that could be the base salary; offer["base"] is the largest of them
+        self.salary_amounts = salary_amounts
+
+    def __repr__(self):
+        return (f"MessageScan(offer={self.offer!r}, preferences={self.preferences!r}, accepted={self.accepted!r}, "
+                f"salary_amounts={self.salary_amounts!r})")
+
+
+def _follows(words: List[str], i: int, phrase: Tuple[str, ...]) -> bool:
+    return tuple(words[i + 1:i + 1 + len(phrase)]) == phrase
+
+
+def scan_message(text: str) -> MessageScan:
+    tokens = _TOKEN.findall(text.lower())
+    words = [word for _, _, word in tokens]
+    count = len(tokens)
+
+    base_candidates = []
+    fallback_candidates = []
+    bonus_amount = None
+    remote = stock = relocation = relocation_perk = False
+    bonus_mentioned = False
+    accepted = False
+
+    for i, (digits, k, word) in enumerate(tokens):
+        if digits:
+            amount = int(digits.replace(",", ""))
+            if k:
+                if amount == 401:  # 401k retirement plan, not a salary
+                    continue
+                amount *= 1000
+            following = words[i + 1] if i + 1 < count else ""
+            if following in _BONUS_QUALIFIERS and i + 2 < count and words[i + 2].startswith("bonus"):
+                following = "bonus"
+            if bonus_amount is None and following.startswith("bonus"):
+                bonus_amount = amount
+            if SALARY_MIN < amount < SALARY_MAX:
+                # Tagged amounts only count as base when introduced as one; per-year/month
+                # figures are still used when nothing else in the text qualifies
+                if not following.startswith(_AMOUNT_TAGS):
+                    base_candidates.append(amount)
+                elif i > 0 and (words[i - 1] in _BASE_CONTEXT or (words[i - 1] == "of" and i > 1 and words[i - 2] in _BASE_OF_CONTEXT)):
+                    base_candidates.append(amount)
+                elif following.startswith(_PERIOD_TAGS):
+                    fallback_candidates.append(amount)
+            continue
+
+        kind = _KEYWORDS.get(word)
+        if kind is None:
+            continue
+        if kind == _REMOTE:
+            remote = True
+        elif kind == _WORK:
+            remote = remote or _follows(words, i, ("from", "home"))
+        elif kind == _STOCK:
+            stock = stock or (i + 1 < count and words[i + 1] in ("option", "options"))
+        elif kind == _EQUITY:
+            stock = True
+        elif kind == _RELOCATION:
+            relocation = relocation_perk = True
+        elif kind == _MOVING:
+            relocation = True
+            relocation_perk = relocation_perk or (i + 1 < count and words[i + 1] == "expenses")
+        elif kind == _BONUS:
+            bonus_mentioned = True
+        elif kind == _ACCEPT:
+            accepted = True
+        elif kind == _SOUNDS:
+            accepted = accepted or _follows(words, i, ("good",))
+        elif kind == _LETS:
+            accepted = accepted or _follows(words, i, ("do", "it"))
+        elif kind == _ILL:
+            accepted = accepted or _follows(words, i, ("take", "it"))
+        elif kind == _HAPPY:
+            accepted = accepted or _follows(words, i, ("to", "take", "it"))
+
+    preferences = []
+    if remote:
+        preferences.append("remote work")
+    if stock:
+        preferences.append("stock options")
+    if relocation:
+        preferences.append("relocation assistance")
+
+    offer: Dict[str, Any] = {}
+    if base_candidates or fallback_candidates:
+        offer["base"] = max(base_candidates or fallback_candidates)
+        perks = [perk for perk in preferences if perk != "relocation assistance" or relocation_perk]
+        if perks:
+            offer["perks"] = sorted(perks)
+        if bonus_mentioned:
+            offer["bonus"] = bonus_amount if bonus_amount is not None else "mentioned"
+
+    return MessageScan(offer, preferences, accepted, len(set(base_candidates or fallback_candidates)))
@@ -0,0 +1,84 @@
+# prompt_layout.py
+# Prompt assembly without PromptTemplate, with per-request prompt token counts
+
+import logging
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from conversation_history import approx_tokens
+from turn_metrics import metrics as turn_metrics
+
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+
+
+class PromptLayout:
+    """
+    Renders the negotiation prompt as chat messages. `static_text` is rendered once and
+    sent first, as a system message that is byte-identical on every call, so providers
+    with prefix/KV caching can reuse it across turns and sessions; `dynamic_template` is
+    formatted per call with str.format and sent after it. An empty `static_text` sends the
+    whole prompt as one message, like the original template.
+    """
+
+    def __init__(self, name: str, static_text: str, dynamic_template: str):
+        self.name = name
+        self.static_text = static_text
+        self._static_message = None
+        self.static_tokens = approx_tokens(static_text)
+        self.dynamic_template = dynamic_template
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._dynamic_tokens = 0
+        self._last: Optional[Dict[str, int]] = None
+        self._reported_input_tokens = 0
+        self._reported_cached_tokens = 0
+
+    @property
+    def static_message(self):
+        # Built on first render, so the layout can be set up without importing LangChain
+        if self._static_message is None and self.static_text:
+            from langchain_core.messages import SystemMessage
+            self._static_message = SystemMessage(content=self.static_text)
+        return self._static_message
+
+    def render(self, inputs: Dict[str, Any]) -> List["BaseMessage"]:
+        from langchain_core.messages import HumanMessage
+
+        with turn_metrics.stage("prompt"):
+            dynamic = self.dynamic_template.format(**inputs)
+            dynamic_tokens = approx_tokens(dynamic)
+            with self._lock:
+                self._requests += 1
+                self._dynamic_tokens += dynamic_tokens
+                self._last = {"static": self.static_tokens, "dynamic": dynamic_tokens}
+            logging.debug(f"Prompt ({self.name}): ~{self.static_tokens} static + ~{dynamic_tokens} dynamic tokens")
+            static_message = self.static_message
+            if static_message is None:
+                return [HumanMessage(content=dynamic)]
+            return [static_message, HumanMessage(content=dynamic)]
+
+    def record_usage(self, usage_metadata: Optional[Dict[str, Any]]):
+        # Token counts reported by the provider, when it returns them; cache_read shows how
+        # much of the prompt was served from its prefix cache
+        if not usage_metadata:
+            return
+        details = usage_metadata.get("input_token_details") or {}
+        input_tokens = usage_metadata.get("input_tokens", 0)
+        cached_tokens = details.get("cache_read", 0) or 0
+        with self._lock:
+            self._reported_input_tokens += input_tokens
+            self._reported_cached_tokens += cached_tokens
+        logging.info(f"Prompt tokens: {input_tokens} ({cached_tokens} from provider cache)")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "layout": self.name,
+                "requests": self._requests,
+                "static_tokens": self.static_tokens,
+                "avg_dynamic_tokens": round(self._dynamic_tokens / self._requests, 1) if self._requests else 0,
+                "last_request_tokens": self._last,
+                "reported_input_tokens": self._reported_input_tokens,
+                "reported_cached_tokens": self._reported_cached_tokens,
+            }
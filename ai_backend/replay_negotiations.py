@@ -0,0 +1,249 @@
+# replay_negotiations.py
+# Re-runs recorded negotiations through the current turn logic, using the recorded agent replies
+# in place of LLM calls, to see how a change to extraction or concession rules shifts limits
+# and outcomes.
+#
+#   python replay_negotiations.py --log negotiation_api.jsonl.1 --log negotiation_api.jsonl
+#   python replay_negotiations.py --transcripts transcripts.jsonl --jobs 8 --output replay.jsonl
+#
+# --log reads a JSON-lines log written through log_pipeline.py (API or command-line agent;
+# turns are the records carrying "candidate"/"agent" fields, grouped by session_id), or an
+# older plain-text log of the command-line agent (one session per "Agent Active" line).
+# --transcripts reads JSON lines of {"session_id": ..., "turns": [{"candidate": ..., "agent": ...,
+# "limit": ...}, ...]}; a turn may also be a [candidate, agent] pair and "limit" is optional.
+# One JSON line per session is written, in input order, followed by totals on stderr.
+
+import argparse
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from negotiation_session import NegotiationSessionState
+
+# Sessions handed to a worker at a time; large enough to amortize the pickling round trip
+CHUNK_SIZE = 64
+
+_LOG_LINE = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}  (.*)$")
+_LOG_CANDIDATE = re.compile(r"^Candidate \(Turn (\d+)\): (.*)$", re.S)
+_LOG_AGENT = re.compile(r"^Employer Agent \((?:Turn \d+, Limit: \$(\d+)|(Conclusion))\): (.*)$", re.S)
+_LOG_SESSION_START = "=== Enhanced Negotiation Agent Active ==="
+
+
+def _log_messages(lines: Iterable[str]) -> Iterator[tuple]:
+    # (timestamp, message) per log record; lines without a timestamp continue the previous one
+    stamp, message = None, None
+    for line in lines:
+        line = line.rstrip("\n")
+        match = _LOG_LINE.match(line)
+        if match:
+            if message is not None:
+                yield stamp, message
+            stamp, message = line[:19], match.group(1)
+        elif message is not None:
+            message += "\n" + line
+    if message is not None:
+        yield stamp, message
+
+
+def read_json_log(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """Transcripts of the sessions in JSON-lines logs; pass rotated files oldest first."""
+    sessions: Dict[str, Dict[str, Any]] = {}
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if "candidate" not in record or "agent" not in record or not record.get("session_id"):
+                    continue
+                session = sessions.setdefault(record["session_id"], {"session_id": record["session_id"], "source": path, "turns": []})
+                turn = {"candidate": record["candidate"], "agent": record["agent"], "limit": record.get("limit")}
+                if record.get("concluded"):
+                    turn["concluded"] = True
+                session["turns"].append(turn)
+    yield from sessions.values()
+
+
+def is_json_log(path: str) -> bool:
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line.strip():
+                return line.lstrip().startswith("{")
+    return False
+
+
+def read_log(path: str) -> Iterator[Dict[str, Any]]:
+    """Transcripts of the command-line sessions in a plain-text conversation log."""
+    session, pending = None, None
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for stamp, message in _log_messages(f):
+            if message == _LOG_SESSION_START:
+                if session and session["turns"]:
+                    yield session
+                session = {"session_id": f"log-{stamp.replace(' ', 'T')}", "source": path, "turns": []}
+                pending = None
+                continue
+            if session is None:
+                continue
+            candidate = _LOG_CANDIDATE.match(message)
+            if candidate:
+                pending = candidate.group(2)
+                continue
+            agent = _LOG_AGENT.match(message)
+            if agent and pending is not None:
+                limit, conclusion, reply = agent.groups()
+                turn = {"candidate": pending, "agent": reply, "limit": int(limit) if limit else None}
+                if conclusion:
+                    turn["concluded"] = True
+                session["turns"].append(turn)
+                pending = None
+    if session and session["turns"]:
+        yield session
+
+
+def read_transcripts(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            turns = []
+            for turn in record.get("turns", []):
+                if isinstance(turn, dict):
+                    turns.append(turn)
+                else:
+                    turns.append({"candidate": turn[0], "agent": turn[1]})
+            yield {"session_id": record.get("session_id") or f"{os.path.basename(path)}:{line_number}",
+                   "source": path, "turns": turns}
+
+
+def replay_transcript(transcript: Dict[str, Any], kg_backend: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Drives one NegotiationSessionState through the recorded candidate messages, feeding it the
+    recorded agent replies. Replay stops at the first turn where the current rules and the
+    recording disagree on whether a deal was concluded, since later turns depended on it.
+    """
+    state = NegotiationSessionState(transcript["session_id"], kg_backend=kg_backend)
+    turns = transcript["turns"]
+    recorded_concluded = any(turn.get("concluded") for turn in turns)
+    result = {
+        "session_id": transcript["session_id"],
+        "recorded_turns": len(turns),
+        "recorded_outcome": "accepted" if recorded_concluded else "open",
+        "turns": 0,
+        "outcome": "open",
+        "diverged_at": None,
+        "limits": [],
+        "recorded_limits": [turn.get("limit") for turn in turns],
+        "agent_offers": [],
+        "offers_over_limit": 0,
+    }
+    try:
+        for number, recorded in enumerate(turns, 1):
+            turn = state.prepare_turn(recorded["candidate"])
+            if turn.reply is not None:
+                # The current rules conclude the negotiation here without the model
+                result.update(turns=number, outcome="accepted", accepted_offer=turn.offer or None)
+                if not recorded.get("concluded"):
+                    result["diverged_at"] = number
+                break
+            if recorded.get("concluded"):
+                # Recorded as an acceptance, but the current rules would have kept negotiating
+                result["diverged_at"] = number
+                break
+            state.finish_turn(turn, recorded["agent"])
+            base = turn.offer.get("base") if turn.offer else None
+            result["turns"] = number
+            result["limits"].append(state.subjective_limit)
+            result["agent_offers"].append(base if isinstance(base, int) else None)
+            if isinstance(base, int) and base > state.subjective_limit:
+                result["offers_over_limit"] += 1
+    except Exception as e:
+        result.update(outcome="error", error=f"{type(e).__name__}: {e}")
+    result["final_limit"] = state.subjective_limit
+    result["limit_changes"] = sum(1 for replayed, recorded in zip(result["limits"], result["recorded_limits"])
+                                  if recorded is not None and replayed != recorded)
+    return result
+
+
+_worker_kg_backend: Optional[str] = None
+
+
+def _init_worker(kg_backend: Optional[str]):
+    global _worker_kg_backend
+    _worker_kg_backend = kg_backend
+    # The KG prints its warnings; keep them off the JSON lines on stdout
+    sys.stdout = sys.stderr
+
+
+def _replay_chunk(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [replay_transcript(transcript, _worker_kg_backend) for transcript in chunk]
+
+
+def _chunks(transcripts: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    iterator = iter(transcripts)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def replay(transcripts: Iterable[Dict[str, Any]], jobs: int, kg_backend: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Replay results in input order; jobs <= 1 replays in this process."""
+    if jobs <= 1:
+        for chunk in _chunks(transcripts, CHUNK_SIZE):
+            with contextlib.redirect_stdout(sys.stderr):
+                results = [replay_transcript(transcript, kg_backend) for transcript in chunk]
+            yield from results
+        return
+    with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(kg_backend,)) as pool:
+        for results in pool.imap(_replay_chunk, _chunks(transcripts, CHUNK_SIZE)):
+            yield from results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log", action="append", default=[], help="JSON-lines log, or plain-text log of the command-line agent")
+    parser.add_argument("--transcripts", action="append", default=[], help="JSON lines of recorded sessions")
+    parser.add_argument("--output", help="write JSON lines here instead of stdout")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--kg-backend", choices=("networkx", "compact"), help="defaults to NEGOTIATION_KG_BACKEND")
+    args = parser.parse_args()
+    if not args.log and not args.transcripts:
+        parser.error("give at least one --log or --transcripts file")
+
+    json_logs = [path for path in args.log if is_json_log(path)]
+    transcripts = itertools.chain(read_json_log(json_logs),
+                                  *(read_log(path) for path in args.log if path not in json_logs),
+                                  *(read_transcripts(path) for path in args.transcripts))
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    totals = {"sessions": 0, "turns": 0, "accepted": 0, "diverged": 0, "limit_changes": 0, "errors": 0}
+    start = time.perf_counter()
+    try:
+        for result in replay(transcripts, args.jobs, args.kg_backend):
+            output.write(json.dumps(result) + "\n")
+            totals["sessions"] += 1
+            totals["turns"] += result["turns"]
+            totals["accepted"] += result["outcome"] == "accepted"
+            totals["diverged"] += result["diverged_at"] is not None
+            totals["limit_changes"] += result["limit_changes"]
+            totals["errors"] += result["outcome"] == "error"
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start
+    print(f"replayed {totals['sessions']} sessions ({totals['turns']} turns) in {elapsed:.1f}s with {args.jobs} jobs: "
+          f"{totals['accepted']} accepted, {totals['diverged']} diverged from the recording, "
+          f"{totals['limit_changes']} turn limits changed, {totals['errors']} errors", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
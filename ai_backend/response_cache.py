@@ -0,0 +1,115 @@
+# response_cache.py
+# Optional cache of model replies for negotiation situations that recur across sessions
+
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+_PUNCTUATION = re.compile(r"[^\w$%.,\s]|(?<!\d)[.,]|[.,](?!\d)")
+_SPACES = re.compile(r"\s+")
+
+
+def canonical_message(text: str) -> str:
+    # Case, spacing and stray punctuation don't change what the candidate said;
+    # amounts keep their "$" and inner "," / "." so $130,000 and $13,000 stay distinct
+    text = _PUNCTUATION.sub(" ", text.lower())
+    return _SPACES.sub(" ", text).strip()
+
+
+class _CacheEntry:
+    __slots__ = ("replies", "expires_at", "llm_seconds", "llm_calls")
+
+    def __init__(self, expires_at: float):
+        self.replies: List[str] = []
+        self.expires_at = expires_at
+        self.llm_seconds = 0.0
+        self.llm_calls = 0
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache from a negotiation situation (canonical message, offer ceiling, KG
+    context, turn number and a digest of the dialogue history the prompt carries) to model
+    replies. Each key goes to the model `variations` times
+    before it starts serving hits, keeping the distinct replies, then answers with a
+    random one of them, so a common situation doesn't always get the same sentence.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl: float = 3600.0, variations: int = 3):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variations = max(1, variations)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _CacheEntry]" = OrderedDict()
+        self._lookups = 0
+        self._hits = 0
+        self._evictions = 0
+        self._seconds_saved = 0.0
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """NEGOTIATION_RESPONSE_CACHE=<max entries> turns the cache on; unset or 0 leaves it off."""
+        max_entries = int(os.getenv("NEGOTIATION_RESPONSE_CACHE", "0") or 0)
+        if max_entries <= 0:
+            return None
+        return cls(
+            max_entries=max_entries,
+            ttl=float(os.getenv("NEGOTIATION_RESPONSE_CACHE_TTL_SECONDS", 3600)),
+            variations=int(os.getenv("NEGOTIATION_RESPONSE_CACHE_VARIATIONS", 3)),
+        )
+
+    @staticmethod
+    def key(inputs: Dict[str, Any], turn_number: int, history: str = "") -> Tuple:
+        # `history` is the rendered history window: the prompt quotes recent turns verbatim, so
+        # two sessions with the same KG context but different wording must not share replies
+        history_digest = hashlib.blake2b(history.encode("utf-8"), digest_size=16).digest()
+        return (canonical_message(inputs["message"]), inputs["subjective_limit"], inputs["kg_context"], turn_number, history_digest)
+
+    def get(self, key: Hashable) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            self._lookups += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= now:
+                del self._entries[key]
+                return None
+            if entry.llm_calls < self.variations:
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            self._seconds_saved += entry.llm_seconds
+            return random.choice(entry.replies)
+
+    def put(self, key: Hashable, reply: str, llm_seconds: float):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= now:
+                entry = self._entries[key] = _CacheEntry(now + self.ttl)
+            self._entries.move_to_end(key)
+            if reply not in entry.replies and len(entry.replies) < self.variations:
+                entry.replies.append(reply)
+            # Running mean of what a call for this situation costs, for the latency-saved figure
+            entry.llm_calls += 1
+            entry.llm_seconds += (llm_seconds - entry.llm_seconds) / entry.llm_calls
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "hit_rate": round(self._hits / self._lookups, 3) if self._lookups else 0.0,
+                "llm_seconds_saved": round(self._seconds_saved, 3),
+                "evictions": self._evictions,
+            }
@@ -0,0 +1,166 @@
+# session_backend.py
+# Shared session storage so several worker processes can serve the same negotiation
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+from negotiation_session import NegotiationSessionState
+
+
+class VersionConflict(Exception):
+    """Raised by save() when the session changed since the caller loaded it."""
+
+
+def encode_state(state: NegotiationSessionState) -> bytes:
+    # The KG drops its offer indexes and context cache when pickled (see
+    # NegotiationKnowledgeGraph.__getstate__); zlib level 1 roughly halves what is left
+    return zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+
+def decode_state(blob: bytes) -> NegotiationSessionState:
+    return pickle.loads(zlib.decompress(blob))
+
+
+class SessionBackend:
+    """
+    Versioned store of serialized sessions. Version 0 means "no such session"; every
+    successful save() returns the next version, and fails with VersionConflict when
+    `expected_version` is no longer current.
+    """
+
+    def version(self, session_id: str) -> int:
+        raise NotImplementedError
+
+    def load(self, session_id: str) -> Optional[Tuple[int, NegotiationSessionState]]:
+        raise NotImplementedError
+
+    def save(self, session_id: str, state: NegotiationSessionState, expected_version: int) -> int:
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+
+class InMemorySessionBackend(SessionBackend):
+    """Single-process backend with the same serialization and versioning as the SQLite one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Tuple[int, bytes]] = {}
+
+    def version(self, session_id: str) -> int:
+        with self._lock:
+            return self._sessions.get(session_id, (0, b""))[0]
+
+    def load(self, session_id: str) -> Optional[Tuple[int, NegotiationSessionState]]:
+        with self._lock:
+            row = self._sessions.get(session_id)
+        if row is None:
+            return None
+        return row[0], decode_state(row[1])
+
+    def save(self, session_id: str, state: NegotiationSessionState, expected_version: int) -> int:
+        blob = encode_state(state)
+        with self._lock:
+            current = self._sessions.get(session_id, (0, b""))[0]
+            if current != expected_version:
+                raise VersionConflict(f"Session {session_id} is at version {current}, expected {expected_version}")
+            self._sessions[session_id] = (current + 1, blob)
+            return current + 1
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    One SQLite file shared by every worker process on the host. WAL mode lets readers
+    proceed during a write; a save is a single conditional UPDATE (or INSERT for a new
+    session), so the version check and the write are atomic.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        db = self._connect()
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                              session_id TEXT PRIMARY KEY,
+                              version INTEGER NOT NULL,
+                              state BLOB NOT NULL,
+                              updated_at REAL NOT NULL)""")
+        finally:
+            db.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # sqlite3 connections are not shared between threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = self._connect()
+        return db
+
+    def version(self, session_id: str) -> int:
+        row = self._db.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def load(self, session_id: str) -> Optional[Tuple[int, NegotiationSessionState]]:
+        row = self._db.execute("SELECT version, state FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        return row[0], decode_state(row[1])
+
+    def save(self, session_id: str, state: NegotiationSessionState, expected_version: int) -> int:
+        blob = encode_state(state)
+        if expected_version == 0:
+            cursor = self._db.execute(
+                "INSERT INTO sessions (session_id, version, state, updated_at) VALUES (?, 1, ?, ?) "
+                "ON CONFLICT(session_id) DO NOTHING",
+                (session_id, blob, time.time()))
+        else:
+            cursor = self._db.execute(
+                "UPDATE sessions SET version = version + 1, state = ?, updated_at = ? "
+                "WHERE session_id = ? AND version = ?",
+                (blob, time.time(), session_id, expected_version))
+        if cursor.rowcount != 1:
+            raise VersionConflict(f"Session {session_id} changed since version {expected_version}")
+        return expected_version + 1
+
+    def delete(self, session_id: str):
+        self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+
+def backend_from_env() -> Optional[SessionBackend]:
+    """
+    NEGOTIATION_SESSION_BACKEND: unset for the process-local store, "memory" for the
+    in-memory backend, or a SQLite URL to share sessions between workers. As in SQLAlchemy,
+    "sqlite:///sessions.db" is relative to the working directory and "sqlite:////var/lib/sessions.db"
+    (four slashes) is absolute.
+    """
+    spec = os.getenv("NEGOTIATION_SESSION_BACKEND")
+    if not spec:
+        return None
+    if spec == "memory":
+        return InMemorySessionBackend()
+    if spec.startswith("sqlite:///"):
+        # Everything after the third slash, so an absolute path keeps its own leading slash
+        path = spec[len("sqlite:///"):]
+        if not path:
+            raise ValueError(f"NEGOTIATION_SESSION_BACKEND has no database path: {spec}")
+        return SQLiteSessionBackend(path)
+    raise ValueError(f"Unsupported NEGOTIATION_SESSION_BACKEND: {spec}")
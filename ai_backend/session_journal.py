@@ -0,0 +1,291 @@
+# session_journal.py
+# Append-only write-ahead log of negotiation turns with group commit and per-session snapshots
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Any, Tuple
+
+from negotiation_session import NegotiationSessionState
+
+# One record per turn: {"s": session_id, "q": seq, "ops": [[op, *args], ...], "st": {field: value}}
+Record = Tuple[int, List[List[Any]], Dict[str, Any]]
+
+
+class SessionJournal:
+    def __init__(self,
+                 directory: str,
+                 segment_bytes: int = 16 * 1024 * 1024,
+                 compact_interval: Optional[float] = 60,
+                 fsync: bool = True,
+                 factory: Callable[[str], NegotiationSessionState] = NegotiationSessionState):
+        self.directory = directory
+        self.snapshot_dir = os.path.join(directory, "snapshots")
+        self.segment_bytes = segment_bytes
+        self.compact_interval = compact_interval
+        self.fsync = fsync
+        self.factory = factory
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+
+        # Segments left by a previous process are sealed; this process appends to a new one
+        self._sealed = self._list_segments()
+        self._segment_number = max((self._segment_number_of(path) for path in self._sealed), default=0) + 1
+        self._file = open(self._segment_path(self._segment_number), "ab")
+        self._io_lock = threading.Lock()
+
+        self._cond = threading.Condition()
+        self._queue: List[bytes] = []
+        self._enqueued = 0
+        self._durable = 0
+        self._failed_through = 0
+        self._error: Optional[BaseException] = None
+        self._closed = False
+
+        # Records from sealed segments not yet folded into snapshots, filled by recover()
+        self._recovered: Dict[str, List[Record]] = {}
+        # Serializes load() against compaction rewriting the same snapshot
+        self._snapshot_lock = threading.Lock()
+
+        self.records = 0
+        self.batches = 0
+        self.bytes_written = 0
+        self.compactions = 0
+        self.snapshots_written = 0
+
+        self._writer = threading.Thread(target=self._write_loop, name="session-journal-writer", daemon=True)
+        self._writer.start()
+        self._compactor = None
+        if compact_interval:
+            self._compactor = threading.Thread(target=self._compact_loop, name="session-journal-compactor", daemon=True)
+            self._compactor.start()
+
+    @classmethod
+    def from_env(cls, **overrides) -> Optional["SessionJournal"]:
+        directory = overrides.pop("directory", None) or os.getenv("NEGOTIATION_JOURNAL_DIR")
+        if not directory:
+            return None
+        compact_interval = float(os.getenv("NEGOTIATION_JOURNAL_COMPACT_SECONDS", "60"))
+        config = {
+            "segment_bytes": int(float(os.getenv("NEGOTIATION_JOURNAL_SEGMENT_MB", "16")) * 1024 * 1024),
+            "compact_interval": compact_interval if compact_interval > 0 else None,
+            "fsync": os.getenv("NEGOTIATION_JOURNAL_FSYNC", "1") != "0",
+        }
+        config.update(overrides)
+        return cls(directory, **config)
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"wal-{number:06d}.log")
+
+    @staticmethod
+    def _segment_number_of(path: str) -> int:
+        return int(os.path.basename(path)[4:-4])
+
+    def _list_segments(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, "wal-*.log")), key=self._segment_number_of)
+
+    def _snapshot_path(self, session_id: str) -> str:
+        digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.snapshot_dir, f"{digest}.pkl")
+
+    # --- writing ---
+
+    def append(self, session_id: str, seq: int, ops: List[List[Any]], fields: Dict[str, Any]):
+        """Queues one turn record and blocks until it is on disk."""
+        line = json.dumps({"s": session_id, "q": seq, "ops": ops, "st": fields}, separators=(",", ":"), default=str)
+        data = (line + "\n").encode("utf-8")
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Session journal is closed")
+            self._queue.append(data)
+            self._enqueued += 1
+            ticket = self._enqueued
+            self._cond.notify_all()
+            while self._durable < ticket and self._failed_through < ticket:
+                self._cond.wait()
+            if self._durable < ticket:
+                raise OSError(f"Session journal write failed: {self._error}")
+
+    def _write_loop(self):
+        # Group commit: whatever queued up while the previous batch was being fsynced
+        # goes out in a single write and a single fsync
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                batch, self._queue = self._queue, []
+                ticket = self._enqueued
+
+            data = b"".join(batch)
+            try:
+                with self._io_lock:
+                    self._file.write(data)
+                    self._file.flush()
+                    if self.fsync:
+                        os.fsync(self._file.fileno())
+                    if self._file.tell() >= self.segment_bytes:
+                        self._rotate()
+            except Exception as e:
+                logging.error(f"Session journal write failed: {e}")
+                with self._cond:
+                    self._error = e
+                    self._failed_through = ticket
+                    self._cond.notify_all()
+                continue
+
+            with self._cond:
+                self._durable = ticket
+                self.records += len(batch)
+                self.batches += 1
+                self.bytes_written += len(data)
+                self._cond.notify_all()
+
+    def _rotate(self):
+        # Called with _io_lock held
+        self._file.close()
+        self._sealed.append(self._segment_path(self._segment_number))
+        self._segment_number += 1
+        self._file = open(self._segment_path(self._segment_number), "ab")
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        with self._io_lock:
+            self._file.close()
+
+    # --- reading ---
+
+    def _read_segment(self, path: str) -> Dict[str, List[Record]]:
+        records: Dict[str, List[Record]] = {}
+        with open(path, "rb") as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn write at the tail is expected after a crash; the turn was never acknowledged
+                    logging.warning(f"Ignoring unreadable journal record {path}:{line_number}")
+                    continue
+                records.setdefault(record["s"], []).append((record["q"], record["ops"], record["st"]))
+        return records
+
+    def recover(self) -> int:
+        """Indexes the records of segments left by a previous process. Snapshots are read lazily in load()."""
+        recovered: Dict[str, List[Record]] = {}
+        for path in list(self._sealed):
+            for session_id, records in self._read_segment(path).items():
+                recovered.setdefault(session_id, []).extend(records)
+        for records in recovered.values():
+            records.sort(key=lambda record: record[0])
+        with self._snapshot_lock:
+            self._recovered = recovered
+        sessions = len(recovered)
+        logging.info(f"Recovered journal records for {sessions} sessions from {len(self._sealed)} segments")
+        return sessions
+
+    def _read_snapshot(self, session_id: str) -> Optional[NegotiationSessionState]:
+        path = self._snapshot_path(session_id)
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_snapshot(self, state: NegotiationSessionState):
+        path = self._snapshot_path(state.session_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _apply(state: NegotiationSessionState, records: List[Record]) -> NegotiationSessionState:
+        for seq, ops, fields in records:
+            if seq > state.journal_seq:
+                state.apply_journal_record(seq, ops, fields)
+        return state
+
+    def load(self, session_id: str, base: Optional[NegotiationSessionState] = None) -> Optional[NegotiationSessionState]:
+        """
+        Returns the latest journaled state of a session, or None if the journal has none.
+        `base` is a copy the caller already has (e.g. spilled to disk); it is used unless
+        the snapshot is newer, and recovered records past it are replayed on top.
+        """
+        with self._snapshot_lock:
+            state = base
+            snapshot = self._read_snapshot(session_id)
+            if snapshot is not None and (state is None or snapshot.journal_seq > state.journal_seq):
+                state = snapshot
+            records = self._recovered.pop(session_id, None)
+        if records:
+            state = self._apply(state or self.factory(session_id), records)
+        return state
+
+    # --- compaction ---
+
+    def compact(self):
+        """Rolls the active segment and folds every sealed segment into per-session snapshots."""
+        with self._io_lock:
+            if self._file.tell() > 0:
+                self._rotate()
+            sealed = list(self._sealed)
+        if not sealed:
+            return
+
+        pending: Dict[str, List[Record]] = {}
+        for path in sealed:
+            for session_id, records in self._read_segment(path).items():
+                pending.setdefault(session_id, []).extend(records)
+
+        for session_id, records in pending.items():
+            records.sort(key=lambda record: record[0])
+            with self._snapshot_lock:
+                state = self._read_snapshot(session_id) or self.factory(session_id)
+                if records[-1][0] > state.journal_seq:
+                    self._write_snapshot(self._apply(state, records))
+                    self.snapshots_written += 1
+                # Everything recovered for this session is in the snapshot now
+                if session_id in self._recovered and self._recovered[session_id][-1][0] <= state.journal_seq:
+                    del self._recovered[session_id]
+
+        # Snapshots are durable before the segments they replace go away
+        for path in sealed:
+            os.remove(path)
+        with self._io_lock:
+            self._sealed = [path for path in self._sealed if path not in sealed]
+        self.compactions += 1
+        logging.info(f"Compacted {len(sealed)} journal segments into {len(pending)} session snapshots")
+
+    def _compact_loop(self):
+        while True:
+            time.sleep(self.compact_interval)
+            with self._cond:
+                if self._closed:
+                    return
+            try:
+                self.compact()
+            except Exception as e:
+                logging.error(f"Session journal compaction failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "records": self.records,
+                "batches": self.batches,
+                "records_per_fsync": self.records / self.batches if self.batches else 0.0,
+                "bytes_written": self.bytes_written,
+                "sealed_segments": len(self._sealed),
+                "recovered_sessions_pending": len(self._recovered),
+                "compactions": self.compactions,
+                "snapshots_written": self.snapshots_written,
+            }
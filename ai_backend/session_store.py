@@ -0,0 +1,470 @@
+# session_store.py
+# Bounded in-process store for NegotiationSessionState with LRU/TTL eviction and spill-to-disk
+
+import asyncio
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager, suppress
+from typing import Awaitable, Callable, Dict, Optional, Any, Tuple
+
+from negotiation_session import NegotiationSessionState
+from log_pipeline import set_log_context, reset_log_context
+from session_backend import SessionBackend, VersionConflict, backend_from_env
+
+
+def _wake(future: "asyncio.Future"):
+    if not future.done():
+        future.set_result(None)
+
+
+class TurnQueue:
+    """
+    FIFO lock over one session's turns. Waiters are threads (Flask) or coroutines (ASGI);
+    on release the lock is handed straight to the oldest waiter, so turns run in arrival
+    order and a busy session never blocks any other.
+    """
+    __slots__ = ("_lock", "_busy", "_waiters")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._busy = False
+        self._waiters = deque()
+
+    def acquire(self):
+        with self._lock:
+            if not self._busy:
+                self._busy = True
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()
+
+    async def acquire_async(self):
+        with self._lock:
+            if not self._busy:
+                self._busy = True
+                return
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if future in self._waiters:
+                    self._waiters.remove(future)
+                    raise
+            # The lock was handed over as we were cancelled; pass it on
+            self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._busy = False
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+
+    def __len__(self) -> int:
+        # Turns waiting behind the one in progress
+        return len(self._waiters)
+
+
+class _Entry:
+    __slots__ = ("state", "last_access", "leases", "size", "turns", "version")
+
+    def __init__(self, state: NegotiationSessionState, version: int = 0):
+        self.state = state
+        self.last_access = time.monotonic()
+        self.leases = 0
+        self.size = state.approx_memory_bytes()
+        self.turns = TurnQueue()
+        # Backend version this copy was loaded at or last saved as
+        self.version = version
+
+
+def _fingerprint(state: NegotiationSessionState):
+    # Changes whenever a turn ran; replayed requests leave it untouched
+    return (state.current_turn, state.kg.version)
+
+
+class SessionStore:
+    def __init__(self,
+                 max_sessions: int = 1000,
+                 max_memory_mb: Optional[float] = None,
+                 idle_ttl: Optional[float] = 1800,
+                 spill_dir: Optional[str] = None,
+                 factory: Callable[[str], NegotiationSessionState] = NegotiationSessionState,
+                 journal=None,
+                 backend: Optional[SessionBackend] = None):
+        self.max_sessions = max_sessions
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024) if max_memory_mb else None
+        self.idle_ttl = idle_ttl
+        self.spill_dir = spill_dir or os.path.join(tempfile.gettempdir(), "negotiation_sessions")
+        self.factory = factory
+        # Optional SessionJournal; sessions missing from memory and the spill dir are restored from it
+        self.journal = journal
+        # Optional shared SessionBackend. When set it is the source of truth: each turn starts
+        # from its latest version and is saved back with an optimistic version check, and
+        # evicted sessions are simply dropped (spill files and journal loading are not used).
+        self.backend = backend
+        os.makedirs(self.spill_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Least recently used first
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Evicted sessions whose spill file is still being written, with the generation of that
+        # spill: a session taken back and evicted again gets a new one, so an older spill that
+        # finishes late can tell it has been superseded
+        self._spilling: Dict[str, Tuple[int, NegotiationSessionState]] = {}
+        self._spill_generation = 0
+        self._memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.rehydrated = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.spill_failures = 0
+        self.refreshes = 0
+        self.conflicts = 0
+
+    @classmethod
+    def from_env(cls, **overrides) -> "SessionStore":
+        max_memory_mb = os.getenv("NEGOTIATION_MAX_SESSION_MEMORY_MB")
+        idle_ttl = os.getenv("NEGOTIATION_SESSION_TTL_SECONDS", "1800")
+        config = {
+            "max_sessions": int(os.getenv("NEGOTIATION_MAX_SESSIONS", "1000")),
+            "max_memory_mb": float(max_memory_mb) if max_memory_mb else None,
+            "idle_ttl": float(idle_ttl) if float(idle_ttl) > 0 else None,
+            "spill_dir": os.getenv("NEGOTIATION_SPILL_DIR"),
+            "backend": backend_from_env(),
+        }
+        config.update(overrides)
+        return cls(**config)
+
+    def _spill_path(self, session_id: str) -> str:
+        digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.pkl")
+
+    def _load_spilled(self, session_id: str) -> Optional[NegotiationSessionState]:
+        path = self._spill_path(session_id)
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.error(f"Could not rehydrate session {session_id} from {path}: {e}")
+            return None
+        os.remove(path)
+        return state
+
+    def _spill(self, session_id: str, generation: int):
+        path = self._spill_path(session_id)
+        tmp_path = f"{path}.{generation}.tmp"
+        try:
+            with self._lock:
+                # Pickled under the lock: once taken back by _checkout the state may change
+                pending = self._spilling.get(session_id)
+                if pending is None or pending[0] != generation:
+                    return
+                data = pickle.dumps(pending[1], protocol=pickle.HIGHEST_PROTOCOL)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            with self._lock:
+                # Only publish the file if this is still the session's latest spill; otherwise
+                # it is stale and would shadow the newer state
+                pending = self._spilling.get(session_id)
+                if pending is not None and pending[0] == generation:
+                    os.replace(tmp_path, path)
+                    del self._spilling[session_id]
+        except Exception as e:
+            logging.error(f"Could not spill session {session_id} to {path}: {e}")
+            with self._lock:
+                self.spill_failures += 1
+                pending = self._spilling.get(session_id)
+                if pending is not None and pending[0] == generation:
+                    del self._spilling[session_id]
+        finally:
+            with suppress(FileNotFoundError):
+                os.remove(tmp_path)
+
+    def _collect_evictions(self, now: float) -> Dict[str, int]:
+        # Called with the lock held. Walks from the least recently used end and stops at
+        # the first session that is neither idle nor needed to get back under the caps.
+        # Sessions leased to an in-flight request are never evicted.
+        expired, evicted = [], []
+        excess = len(self._entries) - self.max_sessions
+        excess_bytes = self._memory_bytes - self.max_memory_bytes if self.max_memory_bytes is not None else 0
+        for session_id, entry in self._entries.items():
+            idle = self.idle_ttl is not None and now - entry.last_access >= self.idle_ttl
+            if not idle and excess <= 0 and excess_bytes <= 0:
+                break
+            if entry.leases:
+                continue
+            (expired if idle else evicted).append(session_id)
+            excess -= 1
+            excess_bytes -= entry.size
+
+        # session_id -> spill generation
+        spilled = {}
+        for session_id in expired + evicted:
+            entry = self._entries.pop(session_id)
+            self._memory_bytes -= entry.size
+            self._spill_generation += 1
+            spilled[session_id] = self._spill_generation
+            self._spilling[session_id] = (self._spill_generation, entry.state)
+        self.expirations += len(expired)
+        self.evictions += len(evicted)
+        return spilled
+
+    def checkout(self, session_id: str) -> NegotiationSessionState:
+        return self._checkout(session_id).state
+
+    def _checkout(self, session_id: str, create: bool = True) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(session_id)
+                entry.last_access = time.monotonic()
+                entry.leases += 1
+                return entry
+            self.misses += 1
+            pending = self._spilling.pop(session_id, None)
+            state = pending[1] if pending is not None else None
+        if state is not None and self.backend is None:
+            # Taken back mid-spill: drop any file for it, as _load_spilled does after reading one
+            with suppress(FileNotFoundError):
+                os.remove(self._spill_path(session_id))
+
+        version = 0
+        if self.backend is not None:
+            loaded = self.backend.load(session_id)
+            if loaded is not None:
+                version, state = loaded
+        else:
+            if state is None:
+                state = self._load_spilled(session_id)
+                if state is not None:
+                    logging.info(f"Rehydrated negotiation session from disk: {session_id}")
+            if self.journal is not None:
+                state = self.journal.load(session_id, base=state)
+
+        with self._lock:
+            # Another request may have loaded or created the session meanwhile
+            entry = self._entries.get(session_id)
+            if entry is None:
+                if state is not None:
+                    self.rehydrated += 1
+                elif not create:
+                    return None
+                else:
+                    state = self.factory(session_id)
+                    self.created += 1
+                    logging.info(f"New negotiation session created: {session_id}")
+                state.journal = self.journal
+                entry = self._entries[session_id] = _Entry(state, version)
+                self._memory_bytes += entry.size
+            entry.leases += 1
+            entry.last_access = time.monotonic()
+            evicted = self._collect_evictions(entry.last_access)
+
+        for evicted_id, generation in evicted.items():
+            if self.backend is None:
+                self._spill(evicted_id, generation)
+            else:
+                # Already saved to the backend after its last turn
+                with self._lock:
+                    if self._spilling.get(evicted_id, (None,))[0] == generation:
+                        del self._spilling[evicted_id]
+        return entry
+
+    def _refresh(self, session_id: str, entry: _Entry):
+        # Called with the session's turn queue held. Another worker may have run a turn
+        # since this copy was loaded; a version probe is much cheaper than a reload.
+        if self.backend is None or self.backend.version(session_id) == entry.version:
+            return
+        loaded = self.backend.load(session_id)
+        if loaded is not None:
+            entry.version, entry.state = loaded
+            entry.state.journal = self.journal
+            with self._lock:
+                self.refreshes += 1
+
+    def _persist(self, session_id: str, entry: _Entry, before):
+        if self.backend is None or _fingerprint(entry.state) == before:
+            return
+        try:
+            entry.version = self.backend.save(session_id, entry.state, entry.version)
+        except VersionConflict:
+            # This copy lost the race; the next turn reloads the winner
+            entry.version = -1
+            with self._lock:
+                self.conflicts += 1
+            raise
+
+    def release(self, session_id: str):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.leases:
+                entry.leases -= 1
+                entry.last_access = time.monotonic()
+                self._entries.move_to_end(session_id)
+                size = entry.state.approx_memory_bytes()
+                self._memory_bytes += size - entry.size
+                entry.size = size
+
+    @contextmanager
+    def session(self, session_id: str, create: bool = True):
+        """
+        Leases the session and holds its turn queue, so overlapping turns run one at a time.
+        With create=False an unknown session yields None instead of starting a new one.
+        """
+        # Records logged while the session is held carry its id (and the turn, once prepare_turn sets it)
+        log_token = set_log_context(session_id)
+        entry = self._checkout(session_id, create)
+        if entry is None:
+            try:
+                yield None
+            finally:
+                reset_log_context(log_token)
+            return
+        try:
+            entry.turns.acquire()
+            try:
+                self._refresh(session_id, entry)
+                before = _fingerprint(entry.state)
+                try:
+                    yield entry.state
+                except BaseException:
+                    # Possibly half-applied; reload from the backend next time
+                    entry.version = -1
+                    raise
+                self._persist(session_id, entry, before)
+            finally:
+                entry.turns.release()
+        finally:
+            self.release(session_id)
+            reset_log_context(log_token)
+
+    @asynccontextmanager
+    async def asession(self, session_id: str):
+        log_token = set_log_context(session_id)
+        # A miss may read a spilled or journaled session from disk, so keep it off the loop
+        checkout = asyncio.ensure_future(asyncio.to_thread(self._checkout, session_id))
+        try:
+            entry = await asyncio.shield(checkout)
+        except asyncio.CancelledError:
+            # The thread runs on regardless; give back the lease it takes once it is done
+            checkout.add_done_callback(
+                lambda done: done.cancelled() or done.exception() is not None or self.release(session_id))
+            reset_log_context(log_token)
+            raise
+        except BaseException:
+            reset_log_context(log_token)
+            raise
+        try:
+            await entry.turns.acquire_async()
+            try:
+                if self.backend is not None:
+                    await asyncio.to_thread(self._refresh, session_id, entry)
+                before = _fingerprint(entry.state)
+                try:
+                    yield entry.state
+                except BaseException:
+                    entry.version = -1
+                    raise
+                if self.backend is not None:
+                    await asyncio.to_thread(self._persist, session_id, entry, before)
+            finally:
+                entry.turns.release()
+        finally:
+            self.release(session_id)
+            reset_log_context(log_token)
+
+    def run_turn(self, session_id: str, turn: Callable[[NegotiationSessionState], Any], retries: int = 2):
+        """
+        Runs `turn(state)` inside session(). If another worker saved the session first,
+        the turn is run again on the winner's state (a retried request id replays its reply).
+        """
+        for attempt in range(retries + 1):
+            try:
+                with self.session(session_id) as state:
+                    return turn(state)
+            except VersionConflict:
+                if attempt == retries:
+                    raise
+                logging.warning(f"Session {session_id} was updated by another worker; retrying the turn")
+
+    async def arun_turn(self, session_id: str, turn: Callable[[NegotiationSessionState], Awaitable[Any]], retries: int = 2):
+        for attempt in range(retries + 1):
+            try:
+                async with self.asession(session_id) as state:
+                    return await turn(state)
+            except VersionConflict:
+                if attempt == retries:
+                    raise
+                logging.warning(f"Session {session_id} was updated by another worker; retrying the turn")
+
+    def summary(self, session_id: str):
+        """
+        The session's NegotiationSummary as of its last finished turn, or None for an unknown
+        session. The first request for a session waits for a turn in progress; after that every
+        turn publishes a snapshot, and requests are answered from it without the turn queue.
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+        if entry is not None and entry.state.summary_snapshot is not None:
+            # With a shared backend, another worker may have run turns since
+            if self.backend is None or self.backend.version(session_id) == entry.version:
+                return entry.state.summary_snapshot
+        with self.session(session_id, create=False) as state:
+            return None if state is None else state.watch_summary()
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def __getitem__(self, session_id: str) -> NegotiationSessionState:
+        with self._lock:
+            return self._entries[session_id].state
+
+    def stats(self) -> Dict[str, Any]:
+        journal_stats = self.journal.stats() if self.journal is not None else None
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "resident_sessions": len(self._entries),
+                "queued_turns": sum(len(entry.turns) for entry in self._entries.values()),
+                "approx_memory_bytes": self._memory_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "created": self.created,
+                "rehydrated": self.rehydrated,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "spill_failures": self.spill_failures,
+                "backend": type(self.backend).__name__ if self.backend is not None else None,
+                "backend_refreshes": self.refreshes,
+                "version_conflicts": self.conflicts,
+                "max_sessions": self.max_sessions,
+                "max_memory_bytes": self.max_memory_bytes,
+                "idle_ttl": self.idle_ttl,
+                "journal": journal_stats,
+            }
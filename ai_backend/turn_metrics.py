@@ -0,0 +1,109 @@
+# turn_metrics.py
+# Per-stage timings and counters for negotiation turns, rendered in the Prometheus text format
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+# Stages of a turn, in the order they run: offer/acceptance/preference extraction, recording
+# preferences and the KG reads behind the concession limit, get_dynamic_context_from_kg, prompt rendering (which
+# happens inside the model call), the model round trip or cache hit, recording the reply in
+# the KG, the journal write, and the whole turn
+STAGES = ("extract", "kg_query", "context", "prompt", "llm", "kg_update", "journal", "turn")
+
+COUNTERS = {
+    "turns": "Negotiation turns handled",
+    "acceptances": "Turns that concluded a deal on the candidate's acceptance",
+    "fast_path_replies": "Turns answered by a fast-path rule without a model call",
+    "offers_over_limit": "Agent replies offering a base above the turn's limit",
+    "llm_errors": "Turns whose model call failed",
+    "turn_errors": "Turns that failed after the model replied",
+}
+
+# Upper bounds in seconds: 100us (regex, KG reads) up to 30s (slow model calls)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Histogram:
+    __slots__ = ("counts", "total")
+
+    def __init__(self, size: int):
+        # counts[i] is the number of observations in (bucket[i-1], bucket[i]]; the last is +Inf
+        self.counts = [0] * (size + 1)
+        self.total = 0.0
+
+
+class _StageTimer:
+    # A class rather than @contextmanager: no generator per use on the hot path
+    __slots__ = ("metrics", "stage", "started")
+
+    def __init__(self, metrics: "TurnMetrics", stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started)
+
+
+class TurnMetrics:
+    """
+    Fixed-bucket histograms and counters. An observation is a bisect and two additions under
+    a lock, so this stays on in production; /metrics renders a consistent snapshot.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, _Histogram] = {stage: _Histogram(len(buckets)) for stage in STAGES}
+        self._counters: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+
+    def observe(self, stage: str, seconds: float):
+        index = bisect_left(self.buckets, seconds)
+        histogram = self._histograms[stage]
+        with self._lock:
+            histogram.counts[index] += 1
+            histogram.total += seconds
+
+    def stage(self, stage: str) -> _StageTimer:
+        """with metrics.stage("context"): ... records the block's duration."""
+        return _StageTimer(self, stage)
+
+    def inc(self, counter: str, amount: int = 1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    def render(self) -> str:
+        with self._lock:
+            snapshot = {stage: (list(h.counts), h.total) for stage, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines: List[str] = [
+            "# HELP negotiation_stage_seconds Time spent in each stage of a negotiation turn.",
+            "# TYPE negotiation_stage_seconds histogram",
+        ]
+        bounds = [repr(float(bound)) for bound in self.buckets] + ["+Inf"]
+        for stage, (counts, total) in snapshot.items():
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f'negotiation_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'negotiation_stage_seconds_sum{{stage="{stage}"}} {total!r}')
+            lines.append(f'negotiation_stage_seconds_count{{stage="{stage}"}} {cumulative}')
+        for counter, help_text in COUNTERS.items():
+            lines.append(f"# HELP negotiation_{counter}_total {help_text}.")
+            lines.append(f"# TYPE negotiation_{counter}_total counter")
+            lines.append(f"negotiation_{counter}_total {counters[counter]}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by every session in the process
+metrics = TurnMetrics()
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
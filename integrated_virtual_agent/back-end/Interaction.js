@@ -20,6 +20,9 @@ const { v4: uuidv4 } = require("uuid");
 
 // URL of your Python AI Negotiator API
 const AI_NEGOTIATOR_API_URL = process.env.AI_NEGOTIATOR_API_URL || "http://localhost:5000/negotiate";
+// When set (e.g. "http://localhost:5000/negotiate_stream"), replies are consumed as Server-Sent
+// Events and each sentence is sent to TTS as soon as it is complete
+const AI_NEGOTIATOR_STREAM_URL = process.env.AI_NEGOTIATOR_STREAM_URL;
 
 // The main function to handle user input
 router.post("/:nodeId", async (req, res, next) => {
@@ -27,12 +30,18 @@ router.post("/:nodeId", async (req, res, next) => {
     const additionalData = req.body || {};
     const userMessage = additionalData.userInput; // The user\'s message to send to the AI
     const sessionId = req.session?.id || "default-session"; // Use express-session\'s session ID or fallback
+    // Lets the negotiator answer a resubmitted message from its reply cache instead of running a new turn
+    const requestId = additionalData.requestId || req.get("Idempotency-Key");
 
     if (!userMessage) {
         console.error("No user input provided for AI negotiation.");
         return res.status(400).json({ error: "No user input provided" });
     }
 
+    if (AI_NEGOTIATOR_STREAM_URL) {
+        return streamNegotiatorReply(res, nodeId, userMessage, sessionId, requestId);
+    }
+
     try {
         // Call your Python AI Negotiator API
         const aiResponse = await fetch(AI_NEGOTIATOR_API_URL, {
@@ -40,7 +49,8 @@ router.post("/:nodeId", async (req, res, next) => {
             headers: { "Content-Type": "application/json" },
             body: JSON.stringify({
                 userInput: userMessage,
-                sessionId: sessionId
+                sessionId: sessionId,
+                requestId: requestId
             }),
         });
 
@@ -117,6 +127,111 @@ router.post("/:nodeId", async (req, res, next) => {
     }
 });
 
+// Streams the reply from /negotiate_stream, starting TTS for each sentence as soon as it is
+// complete. Audio chunks are still written to the client in sentence order.
+async function streamNegotiatorReply(res, nodeId, userMessage, sessionId, requestId) {
+    try {
+        const aiResponse = await fetch(AI_NEGOTIATOR_STREAM_URL, {
+            method: "POST",
+            headers: { "Content-Type": "application/json", "Accept": "text/event-stream" },
+            body: JSON.stringify({
+                userInput: userMessage,
+                sessionId: sessionId,
+                requestId: requestId
+            }),
+        });
+
+        if (!aiResponse.ok) {
+            const errorText = await aiResponse.text();
+            console.error(`AI Negotiator API error: ${aiResponse.status} - ${errorText}`);
+            return res.status(aiResponse.status).json({ error: `AI Negotiator API error: ${errorText}` });
+        }
+
+        res.setHeader("Content-Type", "application/json; charset=utf-8");
+
+        let pendingText = "";
+        let sentenceCount = 0;
+        let writeChain = Promise.resolve();
+        let dialogue = null;
+        let spokenText = "";
+
+        const speak = (sentence) => {
+            // The front end shows the longest dialogue seen so far, so each chunk carries the text up to its sentence
+            spokenText += sentence;
+            const chunkPromise = processSentence(sentence, {
+                nodeId: nodeId,
+                dialogue: spokenText,
+                wholeDialogue: spokenText,
+                input: { nextNode: nodeId + 1 },
+                options: []
+            }, sentenceCount++ === 0);
+            writeChain = writeChain.then(() => chunkPromise).then(chunk => {
+                res.write(JSON.stringify(chunk) + "\n");
+            });
+        };
+
+        const handleEvent = (event, data) => {
+            if (event === "token") {
+                pendingText += data.text;
+                // Every segment but the last is a finished sentence
+                const sentences = splitTextIntoSentences(pendingText);
+                sentences.slice(0, -1).forEach(speak);
+                pendingText = sentences[sentences.length - 1] || "";
+            } else if (event === "done") {
+                dialogue = data.reply;
+            } else if (event === "error") {
+                throw new Error(data.error);
+            }
+        };
+
+        let buffer = "";
+        for await (const part of aiResponse.body) {
+            buffer += part.toString("utf8");
+            let boundary;
+            while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = "message";
+                let data = "";
+                rawEvent.split("\n").forEach(line => {
+                    if (line.startsWith("event: ")) event = line.slice(7);
+                    else if (line.startsWith("data: ")) data += line.slice(6);
+                });
+                handleEvent(event, data ? JSON.parse(data) : {});
+            }
+        }
+
+        if (pendingText.trim()) {
+            speak(pendingText);
+        }
+        await writeChain;
+
+        if (!dialogue) {
+            console.warn("AI Negotiator returned an empty reply.");
+            dialogue = "I\'m sorry, I don\'t have a response right now.";
+        }
+        const responseData = {
+            nodeId: nodeId,
+            dialogue: dialogue,
+            audio: null,
+            input: { nextNode: nodeId + 1 },
+            options: [],
+            type: "END CHUNK",
+            wholeDialogue: dialogue
+        };
+        console.log("Sending final streamed response from AI:", responseData);
+        res.write(JSON.stringify(responseData) + "\n");
+        res.end();
+    } catch (err) {
+        console.error("Error during streamed AI Negotiator call or processing:", err);
+        if (res.headersSent) {
+            res.end();
+        } else {
+            res.status(500).json({ error: "Failed to get response from AI Negotiator" });
+        }
+    }
+}
+
 // Helper function to process and send response
 async function processAndSendResponse(res, nodeId, dialogue, nextNode, options) {
     try {
@@ -256,10 +256,12 @@ function scrollChatToBottom() {
 
 // Main function to handle user input
 async function handleUserInput(nodeId, body) {
+    // One id per submission, so a resent request is answered once by the negotiator
+    const requestId = window.crypto?.randomUUID ? window.crypto.randomUUID() : `${Date.now()}-${Math.random()}`;
     const response = await fetch(`/Interaction/${nodeId}`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(body),
+        body: JSON.stringify({ requestId, ...body }),
     });
 
     if (!response.ok) {